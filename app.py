@@ -1,26 +1,67 @@
-from flask import Flask, render_template, jsonify, request, send_file, send_from_directory
+from flask import Flask, render_template, jsonify, request, send_file, send_from_directory, Response
 import pandas as pd
 import os
 import json
 import tempfile
 import shutil
 from werkzeug.utils import secure_filename
+from werkzeug.http import parse_options_header
 from datetime import datetime, timedelta
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4, landscape
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, Image
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, Image, Flowable
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import cm
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfgen import canvas as pdf_canvas
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Border, Side, Alignment
+from openpyxl.utils import get_column_letter
 import io
+import contextlib
+import functools
+import zipfile
+import multiprocessing
+import socket
+import hashlib
+import click
 import numpy as np
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
 import math
+import threading
+import re
+import time
+import unicodedata
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from xml.sax.saxutils import escape
 
 from flask_sqlalchemy import SQLAlchemy
 
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pa_parquet
+except ImportError:
+    pa = None
+    pa_ipc = None
+    pa_parquet = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:
+    PdfReader = None
+    PdfWriter = None
+
 app = Flask(__name__, static_folder='static', template_folder='templates')
 
 # Deteksi environment Vercel
@@ -47,11 +88,50 @@ class UploadData(db.Model):
     data_json = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.now)
     count = db.Column(db.Integer, default=0)
+    # Versi unik per upload (id bisa terpakai ulang di SQLite karena tabel dikosongkan tiap upload)
+    version = db.Column(db.String(32))
+
+class ExportJob(db.Model):
+    """Antrean export di database: diisi web, dikerjakan proses `flask export-worker`"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)
+    payload_json = db.Column(db.Text, nullable=False)
+    dataset_version = db.Column(db.String(32))  # UploadData.version saat job dibuat
+    status = db.Column(db.String(16), nullable=False, default='queued', index=True)  # queued / running / done / failed
+    worker = db.Column(db.String(120))
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    message = db.Column(db.Text)
+    filename = db.Column(db.String(255))
+    mimetype = db.Column(db.String(120))
+    size = db.Column(db.Integer)
+    # Hasil file disimpan di database agar bisa diunduh dari host web mana pun
+    result = db.deferred(db.Column(db.LargeBinary))
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+def upgrade_schema():
+    """Sesuaikan tabel dari versi aplikasi lama (db.create_all tidak mengubah tabel yang sudah ada)"""
+    inspector = db.inspect(db.engine)
+    tables = inspector.get_table_names()
+    with db.engine.begin() as connection:
+        # upload_data lama belum punya kolom version
+        table = UploadData.__tablename__
+        if 'version' not in {column['name'] for column in inspector.get_columns(table)}:
+            connection.execute(db.text(f'ALTER TABLE {table} ADD COLUMN version VARCHAR(32)'))
+
+        # export_job.dataset_version dulu Integer (SQLite tidak memaksakan tipe kolom)
+        table = ExportJob.__tablename__
+        if table in tables and db.engine.dialect.name == 'postgresql':
+            columns = {column['name']: column['type'] for column in inspector.get_columns(table)}
+            if isinstance(columns.get('dataset_version'), db.Integer):
+                connection.execute(db.text(f'ALTER TABLE {table} ALTER COLUMN dataset_version TYPE VARCHAR(32)'))
 
 # Inisialisasi Database
 try:
     with app.app_context():
         db.create_all()
+        upgrade_schema()
 except Exception as e:
     print(f"Bypass DB init error (Read-Only FS): {e}")
 
@@ -292,10 +372,19 @@ def save_temp_data(data):
         new_record = UploadData(
             data_json=json.dumps(data, ensure_ascii=False),
             timestamp=datetime.now(),
-            count=len(data)
+            count=len(data),
+            version=uuid.uuid4().hex
         )
         db.session.add(new_record)
         db.session.commit()
+
+        # Bangun indeks sekarang agar request berikutnya tidak perlu parsing ulang
+        try:
+            set_dataset_index(data, new_record.version)
+        except Exception as e:
+            print(f"Error building dataset index: {e}")
+        # Hasil export versi data lama tidak terpakai lagi
+        clear_export_cache()
         return True, ""
     except Exception as e:
         print(f"Error saving temp data to DB: {e}")
@@ -318,391 +407,2913 @@ def clear_temp_data():
     try:
         UploadData.query.delete()
         db.session.commit()
+        reset_dataset_index()
+        clear_export_cache()
         return True
     except Exception as e:
         print(f"Error clearing temp data: {e}")
         db.session.rollback()
         return False
 
-@app.route('/')
-def index():
-    return render_template('index.html')
+# ============================================
+# INDEKS DATASET (dibangun sekali per upload)
+# ============================================
 
-@app.route('/api/data')
-def api_data():
-    data = load_temp_data()
-    return jsonify(data)
+INDEX_YEARS = [str(year) for year in range(2022, 2033)]
+INDEX_MONTHS = [f"{year}-{str(month).zfill(2)}" for year in INDEX_YEARS for month in range(1, 13)]
+MONTH_POSITION = {month_key: pos for pos, month_key in enumerate(INDEX_MONTHS)}
+_INDEX_BASE_ORDINAL = int(INDEX_YEARS[0]) * 12
+# Jumlah periode ReportTable seluruh dataset yang disimpan per indeks
+REPORT_TABLE_MEMO_SIZE = int(os.environ.get('REPORT_TABLE_MEMO_SIZE', '4'))
+
+_dataset_index = None
+_dataset_index_lock = threading.Lock()
+
+
+def month_ordinal(month_key):
+    """Ubah 'YYYY-MM' menjadi nomor urut bulan (tahun * 12 + bulan - 1)"""
+    year, month = str(month_key).strip().split('-')[:2]
+    month = int(month)
+    if not 1 <= month <= 12:
+        raise ValueError(f"Bulan tidak valid: {month_key}")
+    return int(year) * 12 + month - 1
+
+
+SEARCH_FIELDS = ('nama', 'nik', 'jabatan', 'tempat')
+
+
+def fold_text(value):
+    """Normalisasi teks untuk pencarian: hapus aksen, casefold, rapikan spasi"""
+    text = unicodedata.normalize('NFKD', str(value or ''))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(text.casefold().split())
+
+
+class SearchIndex:
+    """Indeks pencarian nama, NIK, jabatan dan tempat tugas.
+
+    Semua query dicocokkan sebagai substring (hasil sama dengan pencarian
+    `includes` di browser). Query >= 3 karakter disaring dulu lewat trigram,
+    query yang lebih pendek cukup memindai seluruh teks.
+    """
+
+    def __init__(self, employees):
+        self.texts = []
+        self.trigrams = {}
+
+        for row, emp in enumerate(employees):
+            # Pemisah \x00 mencegah substring melintasi batas antar kolom
+            text = '\x00'.join(fold_text(emp.get(field, '')) for field in SEARCH_FIELDS)
+            self.texts.append(text)
+            for gram in {text[i:i + 3] for i in range(len(text) - 2)}:
+                if '\x00' not in gram:
+                    self.trigrams.setdefault(gram, set()).add(row)
+
+    def search(self, query):
+        """Kembalikan daftar baris (terurut) yang cocok dengan query"""
+        query = fold_text(query)
+        if not query:
+            return list(range(len(self.texts)))
+
+        if len(query) < 3:
+            return [row for row, text in enumerate(self.texts) if query in text]
+
+        postings = []
+        for gram in {query[i:i + 3] for i in range(len(query) - 2)}:
+            rows = self.trigrams.get(gram)
+            if not rows:
+                return []
+            postings.append(rows)
+        postings.sort(key=len)
+        candidates = postings[0].intersection(*postings[1:])
+        return sorted(row for row in candidates if query in self.texts[row])
+
+
+SORT_TEXT_COLUMNS = ('nama', 'nik', 'jabatan', 'struktur', 'tempat')
+
+
+def collation_key(value):
+    """Kunci urut nama gaya Indonesia: abaikan aksen, kapital dan tanda baca
+    (Nur'aini = Nuraini), angka diurutkan secara numerik, nilai kosong di akhir"""
+    text = re.sub(r"[^\w\s]", '', fold_text(value))
+    parts = []
+    for part in re.split(r'(\d+)', text):
+        part = part.strip()
+        if not part:
+            continue
+        if part.isdigit():
+            parts.append((1, int(part), ''))
+        else:
+            parts.append((0, 0, part))
+    return (not parts, tuple(parts))
+
+
+class SortIndex:
+    """Permutasi urut stabil per kolom, dihitung sekali per upload.
+
+    Untuk halaman terurut cukup saring permutasi dengan mask filter lalu
+    potong satu halaman, tanpa mengurutkan ulang.
+    """
+
+    def __init__(self, employees, numeric_columns):
+        self.orders = {}
+
+        for column in SORT_TEXT_COLUMNS:
+            keys = [collation_key(emp.get(column, '')) for emp in employees]
+            rank_of = {key: rank for rank, key in enumerate(sorted(set(keys)))}
+            blank = np.array([key[0] for key in keys], dtype=bool)
+            self._add(column, np.array([rank_of[key] for key in keys], dtype=np.int64), blank)
+
+        for column, values in numeric_columns.items():
+            self._add(column, values)
+
+    def _add(self, column, ranks, blank=None):
+        """Nilai kosong tetap di akhir untuk kedua arah; nilai sama tetap
+        berurutan sesuai urutan data (lexsort stabil, kunci terakhir utama)"""
+        if blank is None:
+            blank = np.zeros(len(ranks), dtype=bool)
+        self.orders[column] = {
+            'asc': np.lexsort((ranks, blank)).astype(np.int32),
+            'desc': np.lexsort((-ranks, blank)).astype(np.int32),
+        }
+
+    def order(self, column, direction='asc'):
+        """Permutasi baris untuk kolom; KeyError bila kolom tidak bisa diurutkan"""
+        return self.orders[column]['desc' if direction == 'desc' else 'asc']
+
+    def page(self, column, direction='asc', mask=None, page=1, per_page=10):
+        """Kembalikan (baris untuk halaman ini, total baris yang lolos filter)"""
+        order = self.order(column, direction)
+        if mask is not None:
+            order = order[mask[order]]
+        start = max(page - 1, 0) * per_page
+        return order[start:start + per_page], len(order)
+
+
+FILTER_COLUMNS = ('tempat', 'kelompok', 'status', 'struktur', 'shift_status')
+
+
+class FilterIndex:
+    """Dictionary encoding dan bitmap (array bool NumPy) per nilai untuk kolom
+    kategori. Kombinasi filter cukup OR di dalam kolom lalu AND antar kolom,
+    dan jumlah per nilai (facet) diambil dari kode yang sama."""
+
+    def __init__(self, employees):
+        self.size = len(employees)
+        self.values = {}
+        self.codes = {}
+        self.bitmaps = {}
+
+        for column in FILTER_COLUMNS:
+            raw = np.array([str(emp.get(column, '') or '') for emp in employees], dtype=object)
+            values, codes = np.unique(raw, return_inverse=True)
+            self.values[column] = values.tolist()
+            self.codes[column] = codes.astype(np.int32)
+            self.bitmaps[column] = {value: self.codes[column] == code for code, value in enumerate(self.values[column])}
+
+    def column_mask(self, column, selected):
+        """OR dari bitmap nilai terpilih; None bila kolom tidak difilter"""
+        if isinstance(selected, str):
+            selected = [selected]
+        selected = [str(value) for value in (selected or []) if value not in (None, '', 'all')]
+        if not selected:
+            return None
+
+        mask = np.zeros(self.size, dtype=bool)
+        for value in selected:
+            bitmap = self.bitmaps[column].get(value)
+            if bitmap is not None:
+                mask |= bitmap
+        return mask
+
+    def mask(self, filters, exclude=None):
+        """AND seluruh filter kolom (kecuali `exclude`) menjadi satu mask baris"""
+        result = np.ones(self.size, dtype=bool)
+        for column in FILTER_COLUMNS:
+            if column == exclude:
+                continue
+            column_mask = self.column_mask(column, filters.get(column))
+            if column_mask is not None:
+                result &= column_mask
+        return result
+
+    def counts(self, column, mask=None):
+        """Jumlah pegawai per nilai kolom, opsional dibatasi mask"""
+        codes = self.codes[column] if mask is None else self.codes[column][mask]
+        counts = np.bincount(codes, minlength=len(self.values[column]))
+        return dict(zip(self.values[column], counts.tolist()))
+
+
+class DatasetIndex:
+    """Indeks in-memory untuk dataset yang sedang aktif.
+
+    Kehadiran disimpan sebagai matriks pegawai x bulan global (2022-01 s/d
+    2032-12) beserta prefix-sum kumulatif per pegawai, sehingga total untuk
+    rentang bulan manapun cukup satu pengurangan kolom.
+    """
+
+    def __init__(self, employees, version):
+        self.version = version
+        self.employees = employees
+        self.ids = [str(emp.get('id', '')) for emp in employees]
+        self.row_of_id = {emp_id: row for row, emp_id in enumerate(self.ids)}
+
+        num_months = len(INDEX_MONTHS)
+        self.attendance = np.zeros((len(employees), num_months), dtype=np.int32)
+        for row, emp in enumerate(employees):
+            bulanan = emp.get('bulanan', {})
+            if not isinstance(bulanan, dict):
+                continue
+            for year_data in bulanan.values():
+                if not isinstance(year_data, dict):
+                    continue
+                for month_key, month_data in year_data.items():
+                    pos = MONTH_POSITION.get(month_key)
+                    if pos is None or not isinstance(month_data, dict):
+                        continue
+                    try:
+                        self.attendance[row, pos] = int(month_data.get('value', 0) or 0)
+                    except (ValueError, TypeError):
+                        pass
+
+        # prefix[:, k] = total kehadiran dari bulan ke-0 sampai bulan ke-(k-1)
+        self.prefix = np.zeros((len(employees), num_months + 1), dtype=np.int64)
+        np.cumsum(self.attendance, axis=1, out=self.prefix[:, 1:])
+
+        # Total per tahun & keseluruhan apa adanya dari excel_to_json
+        # (kolom TOTAL/JUMLAH di file bisa berbeda dari jumlah bulanan)
+        self.total_all = np.array([int(emp.get('total_all', 0) or 0) for emp in employees], dtype=np.int64)
+        self.yearly_totals = {
+            year: np.array([int((emp.get('tahunan') or {}).get(year, 0) or 0) for emp in employees], dtype=np.int64)
+            for year in INDEX_YEARS
+        }
+
+        self.rows_of_nik = {}
+        for row, emp in enumerate(employees):
+            self.rows_of_nik.setdefault(str(emp.get('nik', '')).strip(), []).append(row)
+
+        numeric_columns = {'total_all': self.total_all}
+        numeric_columns.update({f'tahun_{year}': totals for year, totals in self.yearly_totals.items()})
+
+        self.search = SearchIndex(employees)
+        self.sort = SortIndex(employees, numeric_columns)
+        self.filters = FilterIndex(employees)
+        self.facets = build_facets(self)
+        self.arrow_table = None
+        # ReportTable seluruh pegawai per periode (tuple bulan), diisi report_table();
+        # LRU kecil karena tiap entri memuat DataFrame seluruh pegawai
+        self.report_tables = OrderedDict()
+        self.report_tables_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.employees)
+
+    def month_span(self, start=None, end=None):
+        """Konversi rentang 'YYYY-MM' menjadi (awal, akhir) kolom prefix, akhir eksklusif"""
+        num_months = len(INDEX_MONTHS)
+        lo = 0 if not start else min(max(month_ordinal(start) - _INDEX_BASE_ORDINAL, 0), num_months)
+        hi = num_months if not end else min(max(month_ordinal(end) - _INDEX_BASE_ORDINAL + 1, 0), num_months)
+        return lo, max(lo, hi)
+
+    def range_totals(self, start=None, end=None, rows=None):
+        """Total kehadiran per pegawai dalam rentang bulan (inklusif)"""
+        lo, hi = self.month_span(start, end)
+        prefix = self.prefix if rows is None else self.prefix[rows]
+        return prefix[:, hi] - prefix[:, lo]
+
+    def cached_report_table(self, months):
+        """ReportTable periode `months` bila sudah ada di memo, selain itu None"""
+        key = tuple(months)
+        with self.report_tables_lock:
+            table = self.report_tables.get(key)
+            if table is not None:
+                self.report_tables.move_to_end(key)
+            return table
+
+    def report_table(self, months):
+        """ReportTable seluruh dataset untuk periode `months`, disimpan agar
+        export berikutnya pada periode yang sama cukup mengiris barisnya"""
+        table = self.cached_report_table(months)
+        if table is None:
+            key = tuple(months)
+            matrix = np.zeros((len(self), len(key)), dtype=np.int64)
+            positions = np.array([MONTH_POSITION.get(month_key, -1) for month_key in key], dtype=np.int64)
+            valid = positions >= 0
+            if valid.any():
+                matrix[:, valid] = self.attendance[:, positions[valid]]
+            table = ReportTable(self.employees, list(key), matrix)
+            with self.report_tables_lock:
+                self.report_tables[key] = table
+                self.report_tables.move_to_end(key)
+                while len(self.report_tables) > REPORT_TABLE_MEMO_SIZE:
+                    self.report_tables.popitem(last=False)
+        return table
+
+    def summary(self, row):
+        """Ringkasan pegawai tanpa data bulanan (untuk respon API yang ringkas)"""
+        emp = self.employees[row]
+        return {
+            'id': self.ids[row],
+            'nama': emp.get('nama', ''),
+            'nik': emp.get('nik', ''),
+            'jabatan': emp.get('jabatan', ''),
+            'struktur': emp.get('struktur', ''),
+            'tempat': emp.get('tempat', ''),
+        }
+
+
+ARROW_DICTIONARY_COLUMNS = ('jk', 'status', 'kelompok', 'jabatan', 'struktur', 'tempat', 'shift_status')
+
+
+def build_arrow_table(index):
+    """Bangun tabel Arrow kolumnar dari indeks dataset (disimpan per versi data).
+
+    Kolom kategori di-dictionary-encode dan kehadiran disimpan sebagai satu
+    kolom int32 per bulan, sehingga bisa dibaca pandas/Arrow JS tanpa parsing.
+    """
+    if index.arrow_table is not None:
+        return index.arrow_table
+
+    employees = index.employees
+    columns = {
+        'id': pa.array(index.ids, type=pa.string()),
+        'nama': pa.array([str(emp.get('nama', '')) for emp in employees], type=pa.string()),
+        'nik': pa.array([str(emp.get('nik', '')) for emp in employees], type=pa.string()),
+    }
+    for field in ARROW_DICTIONARY_COLUMNS:
+        values = pa.array([str(emp.get(field, '')) for emp in employees], type=pa.string())
+        columns[field] = values.dictionary_encode()
+
+    columns['total_all'] = pa.array([int(emp.get('total_all', 0) or 0) for emp in employees], type=pa.int64())
+
+    # Fortran order agar setiap kolom bulan kontigu di memori
+    attendance = np.asfortranarray(index.attendance)
+    for pos, month_key in enumerate(INDEX_MONTHS):
+        columns[month_key] = pa.array(attendance[:, pos])
+
+    table = pa.table(columns)
+    table = table.replace_schema_metadata({
+        'months': json.dumps(INDEX_MONTHS),
+        'dataset_version': str(index.version),
+    })
+    index.arrow_table = table
+    return table
+
+
+def filter_spec_from_args(args):
+    """Ambil spesifikasi filter dari query string (status boleh diulang)"""
+    spec = {column: args.getlist(column) for column in FILTER_COLUMNS if column in args}
+    spec['q'] = args.get('q', '')
+    return spec
+
+
+def resolve_filter_mask(index, spec, exclude=None):
+    """Mask baris untuk spesifikasi filter: bitmap kategori AND hasil pencarian"""
+    mask = index.filters.mask(spec, exclude=exclude)
+    query = str(spec.get('q') or '').strip()
+    if query:
+        search_mask = np.zeros(len(index), dtype=bool)
+        search_mask[index.search.search(query)] = True
+        mask &= search_mask
+    return mask
+
+
+EXPORT_SPEC_KEYS = ('filter', 'ids', 'niks')
+
+
+def attendance_totals(index, spec):
+    """Total kehadiran yang dipakai untuk memisahkan ikut / tidak ikut senam,
+    mengikuti urutan dashboard: filter tahun, lalu rentang waktu, lalu total"""
+    year = str(spec.get('attendance_year') or 'all')
+    date_range = spec.get('date_range') or {}
+    if year != 'all':
+        return index.yearly_totals.get(year, np.zeros(len(index), dtype=np.int64))
+    if date_range.get('active', True) and date_range.get('start') and date_range.get('end'):
+        return index.range_totals(date_range['start'], date_range['end'])
+    return index.total_all
+
+
+def resolve_export_rows(index, spec):
+    """Resolve spesifikasi export menjadi daftar baris dataset.
+
+    Spesifikasi: `filter` (kolom kategori + q), `ids`/`niks` opsional,
+    `attendance` ('none' / 'present') dan `sort` {column, direction}.
+    """
+    mask = resolve_filter_mask(index, spec.get('filter') or {})
+
+    ids = spec.get('ids')
+    id_rows = None
+    if ids is not None:
+        id_rows = [index.row_of_id[str(emp_id)] for emp_id in ids if str(emp_id) in index.row_of_id]
+        id_mask = np.zeros(len(index), dtype=bool)
+        id_mask[id_rows] = True
+        mask &= id_mask
+
+    niks = spec.get('niks')
+    if niks is not None:
+        nik_mask = np.zeros(len(index), dtype=bool)
+        for nik in niks:
+            nik_mask[index.rows_of_nik.get(str(nik).strip(), [])] = True
+        mask &= nik_mask
+
+    attendance = spec.get('attendance')
+    if attendance in ('none', 'present'):
+        totals = attendance_totals(index, spec)
+        mask &= (totals == 0) if attendance == 'none' else (totals > 0)
+
+    sort = spec.get('sort') or {}
+    if sort.get('column'):
+        order = index.sort.order(sort['column'], sort.get('direction', 'asc'))
+        return order[mask[order]].tolist()
+
+    if id_rows is not None:
+        # Pertahankan urutan pilihan user, tanpa duplikat
+        seen = set()
+        return [row for row in id_rows if mask[row] and not (row in seen or seen.add(row))]
+
+    return np.flatnonzero(mask).tolist()
+
+
+def resolve_export_employees(payload, legacy_key='employees'):
+    """Pegawai untuk export beserta pesan error (atau None).
+
+    Browser cukup mengirim spesifikasi ringkas yang diresolve terhadap
+    dataset tersimpan; daftar pegawai lengkap (format lama) tetap diterima.
+    """
+    legacy = payload.get(legacy_key)
+    if legacy:
+        return [emp for emp in legacy if isinstance(emp, dict)], None
+
+    if not any(key in payload for key in EXPORT_SPEC_KEYS):
+        return [], None
+
+    index = get_dataset_index()
+    if index is None:
+        return [], 'Tidak ada data'
 
-@app.route('/api/ping')
-def ping():
     try:
-        from sqlalchemy import text
-        db.session.execute(text('SELECT 1'))
-        return jsonify({"status": "ok", "message": "Database is awake!"})
-    except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+        rows = resolve_export_rows(index, payload)
+    except (KeyError, ValueError) as e:
+        return [], f'Spesifikasi export tidak valid: {e}'
 
-@app.route('/api/upload', methods=['POST'])
-def upload_file():
+    return [index.employees[row] for row in rows], None
+
+
+def build_facets(index, spec=None):
+    """Nilai unik + jumlah pegawai per kolom filter.
+
+    Bila `spec` diberikan, jumlah tiap kolom dihitung terhadap filter aktif
+    pada kolom lain (kolom itu sendiri diabaikan agar pilihan lain tetap
+    terlihat).
+    """
+    facets = {}
+    for column in FILTER_COLUMNS:
+        mask = resolve_filter_mask(index, spec, exclude=column) if spec else None
+        counts = index.filters.counts(column, mask)
+        facets[column] = [{'value': value, 'count': count} for value, count in counts.items() if value]
+    return facets
+
+
+def set_dataset_index(data, version):
+    global _dataset_index
+    index = DatasetIndex(data, version)
+    with _dataset_index_lock:
+        _dataset_index = index
+    return index
+
+
+def reset_dataset_index():
+    global _dataset_index
+    with _dataset_index_lock:
+        _dataset_index = None
+
+
+def upload_version(record):
+    """Versi dataset sebuah baris upload; baris lama tanpa kolom version memakai id"""
+    return record.version or f'id{record.id}'
+
+
+def get_dataset_index():
+    """Ambil indeks dataset terbaru; dibangun ulang bila upload baru terdeteksi
+    (misalnya upload dilakukan di worker gunicorn lain)."""
+    global _dataset_index
     try:
-        if 'file' not in request.files:
-            return jsonify({'success': False, 'message': 'Tidak ada file yang diupload'})
-        
-        file = request.files['file']
-        
-        if file.filename == '':
-            return jsonify({'success': False, 'message': 'Nama file kosong'})
-        
-        if not allowed_file(file.filename):
-            return jsonify({'success': False, 'message': 'Format file tidak didukung'})
-        
-        file.seek(0, 2)
-        file_size = file.tell()
-        file.seek(0)
-        if file_size > 10 * 1024 * 1024:
-            return jsonify({'success': False, 'message': 'Ukuran file terlalu besar'})
-        
-        temp_dir = tempfile.mkdtemp()
-        temp_path = os.path.join(temp_dir, secure_filename(file.filename))
-        file.save(temp_path)
-        
-        clear_temp_data()
-        
-        data = excel_to_json(temp_path)
-        
-        if data is None:
-            shutil.rmtree(temp_dir)
-            return jsonify({'success': False, 'message': 'Gagal memproses file'})
-        
-        if not data:
-            shutil.rmtree(temp_dir)
-            return jsonify({'success': False, 'message': 'Tidak ada data'})
-        
-        success, error_msg = save_temp_data(data)
-        
-        if success:
-            shutil.rmtree(temp_dir)
-            return jsonify({
-                'success': True,
-                'message': f'Data berhasil diupload! {len(data)} pegawai diproses.',
-                'count': len(data),
-                'years': list(data[0]['tahunan'].keys()) if data else []
-            })
-        else:
-            shutil.rmtree(temp_dir)
-            
-            # Format pesan error agar ramah pengguna
-            if "password authentication failed" in error_msg:
-                error_pesan = "Koneksi Database Ditolak: Password database salah. Tolong periksa ulang Environment Variable DATABASE_URL di Vercel."
-            elif "does not exist" in error_msg:
-                error_pesan = "Tabel database belum siap. Coba refresh Vercel (Redeploy)."
-            elif "server closed the connection" in error_msg:
-                error_pesan = "Koneksi ke Database terputus. Pastikan link DATABASE_URL benar dan database sedang aktif."
-            else:
-                error_pesan = f"Gagal menyimpan ke database: {error_msg}"
-                
-            return jsonify({'success': False, 'message': error_pesan})
-            
+        latest = db.session.query(UploadData.id, UploadData.version, UploadData.timestamp).order_by(UploadData.id.desc()).first()
     except Exception as e:
-        print(f"Upload error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
+        print(f"Error checking dataset version: {e}")
+        return None
 
-@app.route('/api/export-pdf', methods=['POST'])
-def export_pdf():
-    """Export PDF 1 HALAMAN A4 PORTRAIT - Format Lengkap"""
-    try:
-        data = request.json
-        employee_data = data.get('employee_data')
-        date_range = data.get('date_range', {})
-        shift_status = data.get('shift_status', 'non_shift')
-        bulanan_data = data.get('bulanan_data', {})
-        selected_year = data.get('selected_year', '2024')
-        
-        if not employee_data:
-            return jsonify({'success': False, 'message': 'Data tidak ditemukan'})
-        
-        # Sort data bulanan
-        sorted_months = sorted(bulanan_data.items(), key=lambda x: x[0])
-        
-        # Hitung analisis
-        total_attendance = sum(month_data.get('value', 0) for _, month_data in sorted_months)
-        months_count = len(sorted_months)
-        
-        # TARGET FIXED - Tidak berubah meskipun jumlah bulan berbeda
-        # Shift: 20 kali (50% dari 40)
-        # Non-Shift: 28 kali (70% dari 40)
-        if shift_status == 'shift':
-            target_attendance = 40  # FIXED
-            percentage_target = 50  # Untuk tampilan di PDF
-        else:
-            target_attendance = 56  # FIXED
-            percentage_target = 70  # Untuk tampilan di PDF
-        
-        status_tercapai = total_attendance >= target_attendance
-        
-        # CREATE PDF - A4 PORTRAIT
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=A4,  # A4 Portrait
-            rightMargin=1.2*cm,
-            leftMargin=1.2*cm,
-            topMargin=0.8*cm,
-            bottomMargin=0.8*cm
-        )
-        
-        story = []
-        styles = getSampleStyleSheet()
-        
-        # CUSTOM STYLES - Disesuaikan untuk A4
-        title_style = ParagraphStyle(
-            'TitleStyle',
-            parent=styles['Heading1'],
-            fontSize=11,  # Dikurangi dari 12
-            alignment=TA_CENTER,
-            spaceAfter=3,
-            textColor=colors.HexColor('#1a237e'),
-            fontName='Helvetica-Bold'
-        )
-        
-        subtitle_style = ParagraphStyle(
-            'SubtitleStyle',
-            parent=styles['Heading2'],
-            fontSize=9,  # Dikurangi dari 10
-            alignment=TA_CENTER,
-            spaceAfter=6,
-            textColor=colors.HexColor('#283593'),
-            fontName='Helvetica-Bold'
-        )
-        
-        # HEADER
-        story.append(Paragraph("RUMAH SAKIT ISLAM SITI KHADIJAH PALEMBANG", title_style))
-        story.append(Paragraph("REKAP ABSENSI SENAM PEGAWAI", subtitle_style))
-        story.append(Spacer(1, 0.1*cm))
-        
-        # Hitung tahun yang BENAR dari data bulanan
-        if sorted_months:
-            years = [month_key.split('-')[0] for month_key, _ in sorted_months]
-            min_year = min(years)
-            max_year = max(years)
-            
-            if min_year == max_year:
-                period_text = min_year
-            else:
-                period_text = f"{min_year}-{max_year}"
-        else:
-            period_text = selected_year
-        
-        # INFO PEGAWAI - 2 KOLOM (Lebar disesuaikan A4)
-        info_data = [
-            ['NAMA', ':', employee_data.get('nama', '-'), 'JABATAN', ':', employee_data.get('jabatan', '-')],
-            ['NIK', ':', employee_data.get('nik', '-'), 'TEMPAT TUGAS', ':', employee_data.get('tempat', '-')],
-            ['STATUS SHIFT', ':', 'SHIFT' if shift_status == 'shift' else 'NON-SHIFT', 'TAHUN', ':', period_text]
-        ]
-        
-        if date_range.get('start') and date_range.get('end'):
-            info_data.append(['PERIODE', ':', f"{date_range['start']} s/d {date_range['end']}", '', '', ''])
-        
-        # Lebar total: 2.2+0.3+4.5+2.2+0.3+4.5 = 14cm (muat A4)
-        info_table = Table(info_data, colWidths=[2.2*cm, 0.3*cm, 4.5*cm, 2.2*cm, 0.3*cm, 4.5*cm])
-        info_table.setStyle(TableStyle([
-            ('FONTNAME', (0,0), (0,-1), 'Helvetica-Bold'),
-            ('FONTNAME', (3,0), (3,-1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0,0), (-1,-1), 6.5),  # Font dikecilkan
-            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 2),
-            ('TOPPADDING', (0,0), (-1,-1), 2),
-        ]))
-        
-        story.append(info_table)
-        story.append(Spacer(1, 0.25*cm))
-        
-        # TABEL KEHADIRAN - TETAP 3 KOLOM dengan STATUS (Lebar disesuaikan)
-        if len(sorted_months) > 0:
-            rows_per_col = math.ceil(len(sorted_months) / 3)
-            
-            table_data = []
-            for row_idx in range(rows_per_col):
-                row = []
-                for col_idx in range(3):
-                    month_idx = col_idx * rows_per_col + row_idx
-                    if month_idx < len(sorted_months):
-                        month_key, month_data = sorted_months[month_idx]
-                        # Singkat nama bulan: Jan 2024, Feb 2024, dll
-                        month_name = month_data.get('nama', '')[:3] + ' ' + month_key.split('-')[0]
-                        value = month_data.get('value', 0)
-                        status = month_data.get('status', 'Tidak Hadir')
-                        
-                        row.extend([month_name, str(value), status])
+    if not latest or datetime.now() - latest.timestamp >= timedelta(hours=24):
+        return None
+
+    version = upload_version(latest)
+    index = _dataset_index
+    if index is not None and index.version == version:
+        return index
+
+    with _dataset_index_lock:
+        if _dataset_index is None or _dataset_index.version != version:
+            record = db.session.get(UploadData, latest.id)
+            if record is None:
+                return None
+            _dataset_index = DatasetIndex(json.loads(record.data_json), upload_version(record))
+        return _dataset_index
+
+
+# ============================================
+# TABEL LAPORAN (dipakai semua export Excel & PDF)
+# ============================================
+
+REPORT_INFO_COLUMNS = (
+    ('nama', 'NAMA'),
+    ('nik', 'NIK'),
+    ('jabatan', 'JABATAN'),
+    ('struktur', 'STRUKTUR_LINI'),
+    ('tempat', 'TEMPAT_TUGAS'),
+)
+
+
+def month_key(ordinal):
+    """Kebalikan month_ordinal: ordinal bulan -> 'YYYY-MM'"""
+    return f"{ordinal // 12}-{str(ordinal % 12 + 1).zfill(2)}"
+
+
+def months_in_range(date_range):
+    """Semua bulan 'YYYY-MM' dari date_range['start'] s/d date_range['end']"""
+    if not date_range.get('start') or not date_range.get('end'):
+        return []
+    first = month_ordinal(date_range['start'])
+    last = month_ordinal(date_range['end'])
+    return [month_key(ordinal) for ordinal in range(first, last + 1)]
+
+
+# ============================================
+# MESIN TARGET (kepatuhan senam, satu aturan untuk semua export & API)
+# ============================================
+
+KEGIATAN_PER_TAHUN = 40
+# Persentase kegiatan periode yang wajib dihadiri; urutan = kolom hasil evaluasi
+TARGET_PERSEN = {'non_shift': 70, 'shift': 50}
+SHIFT_COLUMNS = tuple(TARGET_PERSEN)
+# Periode laporan individu bila rentang tanggal tidak aktif (24 bulan terakhir)
+DEFAULT_REPORT_MONTHS = 24
+
+
+def period_months(date_range):
+    """Jumlah bulan periode laporan: rentang tanggal, atau 24 bulan terakhir"""
+    return len(months_in_range(date_range)) or DEFAULT_REPORT_MONTHS
+
+
+def latest_report_month(index):
+    """Bulan laporan terbaru: bulan terakhir yang sudah berisi kehadiran
+    (tidak melewati bulan berjalan)"""
+    current = datetime.now().strftime('%Y-%m')
+    limit = MONTH_POSITION.get(current, len(INDEX_MONTHS) - 1)
+    filled = np.flatnonzero(index.attendance[:, :limit + 1].any(axis=0))
+    return INDEX_MONTHS[filled[-1]] if len(filled) else current
+
+
+def period_targets(num_months):
+    """(total kegiatan dalam periode, array target per kolom SHIFT_COLUMNS).
+
+    Target = persentase dari 40 kegiatan/tahun x jumlah bulan, dibulatkan ke
+    bawah dengan aritmetika bilangan bulat (float bisa terpotong satu angka).
+    """
+    total_kegiatan = KEGIATAN_PER_TAHUN / 12 * num_months
+    persen = np.array([TARGET_PERSEN[column] for column in SHIFT_COLUMNS], dtype=np.int64)
+    return total_kegiatan, KEGIATAN_PER_TAHUN * num_months * persen // 1200
+
+
+class Compliance:
+    """Evaluasi target seluruh pegawai untuk satu periode sekaligus.
+
+    `gaps` dan `passed` berukuran pegawai x kolom (NON-SHIFT, SHIFT) hasil
+    satu broadcast NumPy; `own_*` memilih kolom sesuai status shift tiap
+    pegawai (`is_shift`, default semua NON-SHIFT).
+    """
+
+    def __init__(self, totals, num_months, is_shift=None):
+        self.totals = np.asarray(totals, dtype=np.int64)
+        self.num_months = num_months
+        self.total_kegiatan, self.targets = period_targets(num_months)
+
+        self.gaps = np.maximum(self.targets[np.newaxis, :] - self.totals[:, np.newaxis], 0)
+        self.passed = self.gaps == 0
+
+        if is_shift is None:
+            is_shift = np.zeros(len(self.totals), dtype=bool)
+        self.is_shift = np.asarray(is_shift, dtype=bool)
+        columns = self.is_shift.astype(np.intp)
+        rows = np.arange(len(self.totals))
+        self.own_target = self.targets[columns]
+        self.own_gap = self.gaps[rows, columns]
+        self.own_passed = self.passed[rows, columns]
+
+    def __len__(self):
+        return len(self.totals)
+
+    def target(self, shift_status):
+        return int(self.targets[SHIFT_COLUMNS.index(shift_status)])
+
+    def gap(self, shift_status):
+        return self.gaps[:, SHIFT_COLUMNS.index(shift_status)]
+
+
+def target_status_labels(gaps):
+    """'✓ Tercapai' / '✗ Kurang Nx' untuk array kekurangan dari target"""
+    gaps = np.asarray(gaps)
+    shortfall = np.char.add(np.char.add('✗ Kurang ', gaps.astype(str)), 'x')
+    return np.where(gaps <= 0, '✓ Tercapai', shortfall)
+
+
+class ReportTable:
+    """Tabel laporan: pegawai x bulan dalam periode export.
+
+    Berisi matriks kehadiran, total per pegawai & per bulan, kekurangan dari
+    target shift/non-shift, serta DataFrame dengan semua kolom tersebut.
+    """
+
+    def __init__(self, employees, months, matrix, frame=None):
+        self.employees = employees
+        self.months = months
+        self.matrix = matrix
+        self.totals = matrix.sum(axis=1)
+        self.month_totals = matrix.sum(axis=0)
+        self.grand_total = int(self.totals.sum())
+
+        self.compliance = Compliance(self.totals, len(months))
+        self.total_kegiatan = self.compliance.total_kegiatan
+        self.target_non_shift = self.compliance.target('non_shift')
+        self.target_shift = self.compliance.target('shift')
+        self.gap_non_shift = self.compliance.gap('non_shift')
+        self.gap_shift = self.compliance.gap('shift')
+
+        if frame is not None:
+            self.frame = frame
+            return
+
+        info = {label: [emp.get(key, '-') for emp in employees] for key, label in REPORT_INFO_COLUMNS}
+        frame = pd.concat([pd.DataFrame(info), pd.DataFrame(matrix, columns=months)], axis=1)
+        frame['TOTAL'] = self.totals
+        frame['KURANG_NON_SHIFT'] = self.gap_non_shift
+        frame['KURANG_SHIFT'] = self.gap_shift
+        frame['STATUS_NON_SHIFT'] = target_status_labels(self.gap_non_shift)
+        frame['STATUS_SHIFT'] = target_status_labels(self.gap_shift)
+        self.frame = frame
+
+    def __len__(self):
+        return len(self.employees)
+
+    def subset(self, rows):
+        """ReportTable untuk sebagian baris (mis. satu struktur lini), diiris
+        dari matriks dan DataFrame yang sudah ada; periode & target tetap sama"""
+        frame = self.frame.iloc[rows].reset_index(drop=True)
+        return ReportTable([self.employees[row] for row in rows], self.months, self.matrix[rows], frame)
+
+    def report_frame(self, info_labels):
+        """Kolom info terpilih + kolom bulan + TOTAL (salinan, aman diubah)"""
+        return self.frame[list(info_labels) + self.months + ['TOTAL']].copy()
+
+
+def dataset_rows_for(index, employees):
+    """Baris indeks untuk pegawai yang berasal dari dataset tersimpan,
+    atau None bila ada pegawai yang dikirim dari browser (format lama)"""
+    if index is None:
+        return None
+    rows = []
+    for emp in employees:
+        row = index.row_of_id.get(str(emp.get('id', '')))
+        if row is None or index.employees[row] is not emp:
+            return None
+        rows.append(row)
+    return rows
+
+
+def build_report_table(employees, months_list):
+    """Bangun ReportTable; pegawai dari dataset cukup diiris dari matriks indeks"""
+    matrix = np.zeros((len(employees), len(months_list)), dtype=np.int64)
+    rows = dataset_rows_for(_dataset_index, employees)
+
+    if rows is not None:
+        # Tabel seluruh dataset untuk periode ini sudah dihitung (pemanasan cache)
+        full = _dataset_index.cached_report_table(months_list)
+        if full is not None:
+            return full.subset(rows)
+
+        positions = np.array([MONTH_POSITION.get(month_key, -1) for month_key in months_list], dtype=np.int64)
+        valid = positions >= 0
+        if rows and valid.any():
+            matrix[:, valid] = _dataset_index.attendance[np.ix_(rows, positions[valid])]
+    else:
+        for row, emp in enumerate(employees):
+            bulanan = emp.get('bulanan', {})
+            if not isinstance(bulanan, dict):
+                continue
+            for col, month_key in enumerate(months_list):
+                year_data = bulanan.get(month_key.split('-')[0])
+                month_data = year_data.get(month_key) if isinstance(year_data, dict) else None
+                if isinstance(month_data, dict):
+                    try:
+                        matrix[row, col] = int(month_data.get('value', 0) or 0)
+                    except (ValueError, TypeError):
+                        pass
+
+    return ReportTable(employees, months_list, matrix)
+
+
+XLSX_HEADER_FONT = Font(bold=True)
+XLSX_HEADER_BORDER = Border(left=Side(style='thin'), right=Side(style='thin'),
+                            top=Side(style='thin'), bottom=Side(style='thin'))
+XLSX_HEADER_ALIGNMENT = Alignment(horizontal='center', vertical='top')
+
+
+def xlsx_column_widths(df):
+    """Lebar kolom dari teks terpanjang per kolom (+2, maks 30), dihitung
+    langsung dari array kolom tanpa membaca ulang sel worksheet"""
+    widths = []
+    for position, column in enumerate(df.columns):
+        longest = len(str(column))
+        if len(df):
+            longest = max(longest, int(df.iloc[:, position].astype(str).str.len().max()))
+        widths.append(min(longest + 2, 30))
+    return widths
+
+
+def write_xlsx_sheet(workbook, sheet_name, df):
+    """Tambah satu sheet ke workbook write-only; baris ditulis langsung
+    ke file sementara openpyxl sehingga memori tidak ikut membesar"""
+    worksheet = workbook.create_sheet(sheet_name)
+
+    # Mode write-only: lebar kolom harus diset sebelum baris pertama
+    for position, width in enumerate(xlsx_column_widths(df), 1):
+        worksheet.column_dimensions[get_column_letter(position)].width = width
+
+    header = []
+    for column in df.columns:
+        cell = WriteOnlyCell(worksheet, value=str(column))
+        cell.font = XLSX_HEADER_FONT
+        cell.border = XLSX_HEADER_BORDER
+        cell.alignment = XLSX_HEADER_ALIGNMENT
+        header.append(cell)
+    worksheet.append(header)
+
+    for row in df.itertuples(index=False, name=None):
+        worksheet.append([None if isinstance(value, float) and math.isnan(value) else value for value in row])
+
+    return worksheet
+
+
+def xlsx_tempfile(workbook):
+    """Simpan workbook ke file sementara (terhapus otomatis saat ditutup)
+    dan kembalikan file yang siap dibaca; send_file mengirimnya per blok
+    sehingga isi XLSX tidak pernah utuh di memori"""
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return output
+
+
+def dataframe_to_xlsx(df, sheet_name):
+    """Tulis DataFrame ke XLSX memakai worksheet write-only (memori konstan)"""
+    workbook = Workbook(write_only=True)
+    write_xlsx_sheet(workbook, sheet_name, df)
+    return xlsx_tempfile(workbook)
+
+
+# Jumlah baris per potongan CSV yang dikirim ke client
+CSV_CHUNK_ROWS = 1000
+
+
+def dataframe_csv_chunks(df):
+    """CSV UTF-8 dari DataFrame, dikirim per potongan baris (header dulu)"""
+    yield df.iloc[:0].to_csv(index=False).encode('utf-8')
+    for start in range(0, len(df), CSV_CHUNK_ROWS):
+        yield df.iloc[start:start + CSV_CHUNK_ROWS].to_csv(index=False, header=False).encode('utf-8')
+
+
+def stream_download(chunks, filename, mimetype):
+    """Respons unduhan dari generator bytes; potongan pertama langsung dikirim"""
+    return Response(
+        chunks,
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+def dataframe_to_parquet(df):
+    """Tulis DataFrame ke Parquet (kolumnar, kompresi zstd) di file sementara.
+    Kolom teks campuran (mis. NIK angka/teks) disimpan sebagai string."""
+    df = df.copy()
+    for column in df.columns[df.dtypes == object]:
+        df[column] = df[column].astype(str)
+    output = tempfile.TemporaryFile()
+    pa_parquet.write_table(pa.Table.from_pandas(df, preserve_index=False), output, compression='zstd')
+    output.seek(0)
+    return output
+
+
+# Format export tabel: kolom sama persis, hanya wadahnya yang berbeda
+TABLE_EXPORT_FORMATS = ('xlsx', 'csv', 'parquet')
+
+
+def table_export_format_error(output_format):
+    """Pesan error untuk format export tabel yang tidak bisa dilayani, atau None"""
+    if output_format not in TABLE_EXPORT_FORMATS:
+        return f'Format export tidak dikenal: {output_format}'
+    if output_format == 'parquet' and pa_parquet is None:
+        return 'Export Parquet membutuhkan paket pyarrow'
+    return None
+
+
+def render_table_file(df, output_format, sheet_name):
+    """Isi file tabel laporan sebagai bytes (dijalankan di process pool oleh
+    bundel export)"""
+    if output_format == 'csv':
+        return b''.join(dataframe_csv_chunks(df))
+    output = dataframe_to_parquet(df) if output_format == 'parquet' else dataframe_to_xlsx(df, sheet_name)
+    with output:
+        return output.read()
+
+
+def table_export_response(df, basename, output_format, sheet_name):
+    """Unduhan tabel laporan: xlsx, csv (di-stream) atau parquet"""
+    if output_format == 'csv':
+        return stream_download(dataframe_csv_chunks(df), f'{basename}.csv', 'text/csv')
+    if output_format == 'parquet':
+        return send_file(dataframe_to_parquet(df), as_attachment=True,
+                         download_name=f'{basename}.parquet', mimetype='application/vnd.apache.parquet')
+    return send_file(
+        dataframe_to_xlsx(df, sheet_name),
+        as_attachment=True,
+        download_name=f'{basename}.xlsx',
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+
+# ============================================
+# REGISTRY STYLE PDF (dibuat sekali, dipakai ulang semua export)
+# ============================================
+
+PDF_SAMPLE_STYLES = getSampleStyleSheet()
+_pdf_style_cache = {}
+
+
+def pdf_style(**attrs):
+    """ParagraphStyle bersama untuk kombinasi atribut yang sama; style
+    tidak lagi dibuat ulang untuk setiap baris pegawai"""
+    key = tuple(sorted(attrs.items()))
+    style = _pdf_style_cache.get(key)
+    if style is None:
+        style = _pdf_style_cache.setdefault(key, ParagraphStyle(f'Cached{len(_pdf_style_cache)}', **attrs))
+    return style
+
+
+def pdf_cell_style(font_size):
+    """Style sel data tabel (teks biasa, boleh wrap)"""
+    return pdf_style(fontSize=font_size, leading=font_size + 1, wordWrap='CJK')
+
+
+def pdf_text_cell(value, width, style):
+    """Isi sel tabel: string polos bila muat satu baris pada lebar kolom
+    (tanpa padding), Paragraph dengan style bersama bila perlu wrap"""
+    text = str(value)
+    if '\n' not in text and pdfmetrics.stringWidth(text, style.fontName, style.fontSize) <= width:
+        return text
+    return Paragraph(escape(text), style)
+
+
+# ============================================
+# TABEL PDF PER HALAMAN (layout linear untuk daftar pegawai besar)
+# ============================================
+
+PDF_FRAME_PADDING = 12  # padding atas + bawah Frame bawaan SimpleDocTemplate (6 + 6)
+PDF_CELL_LEADING = 12   # leading bawaan sel Table reportlab (tidak ikut FONTSIZE)
+
+
+def pdf_frame_height(doc):
+    """Tinggi area isi satu halaman SimpleDocTemplate"""
+    return doc.height - PDF_FRAME_PADDING
+
+
+def pdf_story_height(story, width, height):
+    """Tinggi flowable yang sudah ada di story (sisa ruang halaman pertama).
+    Spasi sebelum/sesudah selalu dihitung sehingga hasilnya tidak pernah kurang."""
+    return sum(
+        flowable.wrap(width, height)[1] + flowable.getSpaceBefore() + flowable.getSpaceAfter()
+        for flowable in story
+    )
+
+
+def pdf_row_height(row, inner_widths, vpadding):
+    """Tinggi satu baris tabel seperti yang dihitung reportlab: string memakai
+    leading sel per baris teks, Paragraph diukur pada lebar isi kolomnya"""
+    height = 0
+    for cell, width in zip(row, inner_widths):
+        if isinstance(cell, str):
+            height = max(height, (cell.count('\n') + 1) * PDF_CELL_LEADING)
+        elif cell is not None:
+            height = max(height, cell.wrap(width, 1e6)[1])
+    return height + 2 * vpadding
+
+
+def paged_pdf_tables(header, rows, col_widths, commands, first_height, page_height,
+                     hpadding, vpadding, zebra=None, last_commands=()):
+    """Pecah tabel besar menjadi satu Table per halaman dengan header berulang.
+
+    Tinggi setiap baris dihitung sekali, lalu baris dibagi per halaman dari
+    sisa ruang halaman pertama (first_height) dan tinggi halaman berikutnya
+    (page_height). Setiap Table memakai rowHeights tetap sehingga reportlab
+    tidak perlu mengukur dan memecah ulang satu tabel raksasa di setiap
+    halaman. `commands` berlaku untuk semua potongan (baris data = 1..-1),
+    `last_commands` hanya untuk potongan terakhir (mis. baris TOTAL), dan
+    `zebra` adalah warna ROWBACKGROUNDS yang urutannya dijaga lintas halaman."""
+    inner_widths = [width - 2 * hpadding for width in col_widths]
+    header_height = pdf_row_height(header, inner_widths, vpadding)
+    heights = [pdf_row_height(row, inner_widths, vpadding) for row in rows]
+
+    # Bagi baris per halaman (minimal satu baris per potongan)
+    slices = []
+    start, used = 0, 0
+    budget = first_height - header_height
+    new_page_first = False
+    for position, height in enumerate(heights):
+        if used + height > budget:
+            if position > start:
+                slices.append((start, position))
+                start = position
+            elif not slices:
+                # Baris pertama tidak muat di sisa halaman pertama: tabel dimulai
+                # di halaman baru, bukan dipecah reportlab ke halaman tambahan
+                new_page_first = True
+            used = 0
+            budget = page_height - header_height
+        used += height
+    slices.append((start, len(rows)))
+
+    flowables = [PageBreak()] if new_page_first else []
+    for number, (start, end) in enumerate(slices):
+        chunk_commands = list(commands)
+        if zebra:
+            # Pertahankan urutan warna selang-seling seperti pada tabel utuh
+            shift = start % len(zebra)
+            chunk_commands.append(('ROWBACKGROUNDS', (0, 1), (-1, -1), zebra[shift:] + zebra[:shift]))
+        if number == len(slices) - 1:
+            chunk_commands.extend(last_commands)
+
+        table = Table(
+            [header] + rows[start:end],
+            colWidths=col_widths,
+            rowHeights=[header_height] + heights[start:end],
+            repeatRows=1
+        )
+        table.setStyle(TableStyle(chunk_commands))
+        if number:
+            flowables.append(PageBreak())
+        flowables.append(table)
+
+    return flowables
+
+
+# ============================================
+# BLOK STATIS PDF (form XObject, digambar sekali per dokumen)
+# ============================================
+
+def pdf_form_name(key):
+    """Nama form XObject untuk blok statis; isi blok yang sama = nama yang sama"""
+    return 'Blok' + hashlib.md5(key.encode('utf-8')).hexdigest()[:16]
+
+
+class FormBlock(Flowable):
+    """Blok statis (kop, keterangan, tanda tangan) untuk story platypus.
+
+    Isi blok digambar sekali sebagai form XObject pada kemunculan pertama di
+    sebuah dokumen; kemunculan berikutnya dengan `key` yang sama hanya berupa
+    referensi doForm. Form terikat pada canvas, jadi setiap dokumen membuat
+    form-nya sendiri dan instance FormBlock tidak dipakai lintas dokumen."""
+
+    def __init__(self, key, flowables):
+        Flowable.__init__(self)
+        self.name = pdf_form_name(key)
+        self.flowables = flowables
+        self._placed = []
+
+    def wrap(self, avail_width, avail_height):
+        # Susun isi seperti Frame: jarak antar flowable = max(spaceAfter, spaceBefore)
+        placed, height, previous_after = [], 0, None
+        for flowable in self.flowables:
+            width, flowable_height = flowable.wrap(avail_width, avail_height)
+            if previous_after is not None:
+                height += max(previous_after, flowable.getSpaceBefore())
+            placed.append((flowable, width, flowable_height, height))
+            height += flowable_height
+            previous_after = flowable.getSpaceAfter()
+        self.width, self.height = avail_width, height
+        self._placed = placed
+        return self.width, self.height
+
+    def getSpaceBefore(self):
+        return self.flowables[0].getSpaceBefore() if self.flowables else 0
+
+    def getSpaceAfter(self):
+        return self.flowables[-1].getSpaceAfter() if self.flowables else 0
+
+    def draw(self):
+        canvas = self.canv
+        if not canvas.hasForm(self.name):
+            canvas.beginForm(self.name, 0, 0, self.width, self.height)
+            for flowable, width, height, offset in self._placed:
+                align = getattr(flowable, 'hAlign', 'LEFT')
+                if align == 'CENTER':
+                    x = (self.width - width) / 2
+                elif align == 'RIGHT':
+                    x = self.width - width
+                else:
+                    x = 0
+                flowable.drawOn(canvas, x, self.height - offset - height)
+            canvas.endForm()
+        canvas.doForm(self.name)
+
+
+def pdf_letterhead(subtitle, title_style, subtitle_style):
+    """Kop laporan (nama rumah sakit + judul) sebagai blok statis"""
+    return FormBlock(f'kop:{subtitle}', [
+        Paragraph("RUMAH SAKIT ISLAM SITI KHADIJAH PALEMBANG", title_style),
+        Paragraph(subtitle, subtitle_style),
+    ])
+
+
+# ============================================
+# RENDER PDF PARALEL (bagian per halaman di process pool, lalu digabung)
+# ============================================
+
+# Setiap proses gunicorn punya pool sendiri: default membagi core di antara
+# WEB_CONCURRENCY worker web (maksimal 2 per worker) agar total proses render
+# tidak melebihi jumlah core. Atur PDF_WORKERS langsung untuk host tertentu.
+WEB_CONCURRENCY = max(1, int(os.environ.get('WEB_CONCURRENCY', '1')))
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', max(1, min(2, (os.cpu_count() or 1) // WEB_CONCURRENCY))))
+PDF_PARALLEL_MIN_PAGES = int(os.environ.get('PDF_PARALLEL_MIN_PAGES', '20'))
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def get_pdf_pool():
+    """Process pool render PDF, dibuat saat pertama dipakai (per proses gunicorn).
+    Memakai 'spawn' agar proses anak tidak mewarisi koneksi DB / lock thread."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=PDF_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pdf_pool
+
+
+def draw_page_number_at(canvas, pagesize, right_margin, bottom_margin, number):
+    canvas.saveState()
+    canvas.setFont('Helvetica', 6)
+    canvas.setFillColor(colors.grey)
+    canvas.drawRightString(pagesize[0] - right_margin, bottom_margin / 2, f"Halaman {number}")
+    canvas.restoreState()
+
+
+def draw_page_number(canvas, doc):
+    """Nomor halaman di margin bawah (onPage SimpleDocTemplate)"""
+    draw_page_number_at(canvas, doc.pagesize, doc.rightMargin, doc.bottomMargin, doc.page)
+
+
+def pdf_doc_options(doc):
+    return {
+        'pagesize': doc.pagesize,
+        'leftMargin': doc.leftMargin,
+        'rightMargin': doc.rightMargin,
+        'topMargin': doc.topMargin,
+        'bottomMargin': doc.bottomMargin,
+    }
+
+
+def pdf_page_numbers(doc, count):
+    """PDF berisi nomor halaman saja (1..count) untuk dicap ke PDF gabungan"""
+    buffer = io.BytesIO()
+    canvas = pdf_canvas.Canvas(buffer, pagesize=doc.pagesize)
+    for number in range(1, count + 1):
+        draw_page_number_at(canvas, doc.pagesize, doc.rightMargin, doc.bottomMargin, number)
+        canvas.showPage()
+    canvas.save()
+    return buffer.getvalue()
+
+
+def render_pdf_section(story, doc_options):
+    """Render satu bagian story menjadi PDF tersendiri (dijalankan di process pool)"""
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer, **doc_options).build(story)
+    return buffer.getvalue()
+
+
+def split_pdf_story(story, sections):
+    """Bagi story di batas PageBreak menjadi `sections` bagian berurutan dengan
+    jumlah halaman kurang lebih sama"""
+    segments = [[]]
+    for flowable in story:
+        if isinstance(flowable, PageBreak):
+            segments.append([])
+        else:
+            segments[-1].append(flowable)
+
+    sections = max(1, min(sections, len(segments)))
+    bounds = [round(len(segments) * part / sections) for part in range(sections + 1)]
+    parts = []
+    for start, end in zip(bounds, bounds[1:]):
+        part = []
+        for segment in segments[start:end]:
+            if part:
+                part.append(PageBreak())
+            part.extend(segment)
+        parts.append(part)
+    return parts
+
+
+def build_pdf_story(doc, story, workers=None):
+    """Bangun story ke doc (bernomor halaman). Story yang sudah dipecah per
+    halaman (paged_pdf_tables) dan cukup panjang dirender paralel: setiap
+    bagian halaman dibuat di process pool lalu digabung dengan pypdf.
+
+    Jumlah halaman tiap bagian baru diketahui setelah dirender (blok penutup
+    unit bisa meluber ke halaman berikutnya), jadi nomor halaman dicap sesudah
+    penggabungan dengan posisi yang sama seperti draw_page_number. Content
+    stream hasil cap dikompres ulang dan objek kembar (font tiap bagian)
+    disimpan sekali agar ukuran file setara render berurutan."""
+    workers = PDF_WORKERS if workers is None else workers
+    pages = 1 + sum(isinstance(flowable, PageBreak) for flowable in story)
+    if PdfWriter is None or workers < 2 or pages < PDF_PARALLEL_MIN_PAGES:
+        doc.build(story, onFirstPage=draw_page_number, onLaterPages=draw_page_number)
+        return
+
+    options = pdf_doc_options(doc)
+    pool = get_pdf_pool()
+    futures = [pool.submit(render_pdf_section, part, options) for part in split_pdf_story(story, workers)]
+
+    writer = PdfWriter()
+    for future in futures:
+        writer.append(PdfReader(io.BytesIO(future.result())))
+
+    numbers = PdfReader(io.BytesIO(pdf_page_numbers(doc, len(writer.pages))))
+    for page, number in zip(writer.pages, numbers.pages):
+        page.merge_page(number)
+        page.compress_content_streams()
+    writer.compress_identical_objects()
+    writer.write(doc.filename)
+    print(f"DEBUG: PDF dirender paralel: {len(futures)} bagian, {len(writer.pages)} halaman")
+
+
+# ============================================
+# RENDERER CANVAS (jalur cepat PDF tabel absensi)
+# ============================================
+
+PDF_RENDERERS = ('platypus', 'canvas')
+
+# Sel dengan warna/tebal khusus untuk CanvasReport.table (mis. kolom status)
+CanvasCell = namedtuple('CanvasCell', ['text', 'color', 'bold'])
+
+
+def canvas_wrap(text, font_name, font_size, width):
+    """Pecah teks menjadi baris selebar kolom; kata yang lebih panjang dari
+    kolom dipotong per karakter (setara wordWrap='CJK' di platypus)"""
+    lines = []
+    for line in simpleSplit(text, font_name, font_size, width) or ['']:
+        while len(line) > 1 and pdfmetrics.stringWidth(line, font_name, font_size) > width:
+            cut = len(line) - 1
+            while cut > 1 and pdfmetrics.stringWidth(line[:cut], font_name, font_size) > width:
+                cut -= 1
+            lines.append(line[:cut])
+            line = line[cut:]
+        lines.append(line)
+    return lines
+
+
+def canvas_status_cell(gap):
+    """Sel status target (warna sama dengan versi platypus)"""
+    if gap == 0:
+        return CanvasCell('✓ Tercapai', colors.HexColor('#2e7d32'), True)
+    return CanvasCell(f'✗ Kurang {gap}x', colors.HexColor('#c62828'), False)
+
+
+class CanvasReport:
+    """PDF yang digambar langsung di canvas reportlab dari koordinat yang
+    dihitung di muka, tanpa flowable/frame platypus. Margin dan area isi
+    sama dengan SimpleDocTemplate yang dipakai export platypus."""
+
+    def __init__(self, buffer, pagesize=A4, left=1.2*cm, right=1.2*cm, top=0.8*cm, bottom=1.5*cm,
+                 page_numbers=False):
+        self.canvas = pdf_canvas.Canvas(buffer, pagesize=pagesize)
+        page_width, page_height = pagesize
+        # Posisi nomor halaman sama dengan draw_page_number (platypus)
+        self.page_numbers = page_numbers
+        self.number_x = page_width - right
+        self.number_y = bottom / 2
+        # Padding frame platypus (6pt) ikut dihitung agar posisi isi sama
+        self.left = left + 6
+        self.width = page_width - left - right - 12
+        self.top = page_height - top - 6
+        self.bottom = bottom + 6
+        self.page_width, self.page_height = pagesize
+        self.y = self.top
+        self._widths = {}
+        self._forms = {}
+        self._in_form = False
+
+    def string_width(self, text, font_name, font_size):
+        """stringWidth dengan cache; isi tabel absensi sangat berulang (0, 1, 2, ...)"""
+        key = (text, font_name, font_size)
+        width = self._widths.get(key)
+        if width is None:
+            width = self._widths[key] = pdfmetrics.stringWidth(text, font_name, font_size)
+        return width
+
+    def page_number(self):
+        if self.page_numbers:
+            self.canvas.setFont('Helvetica', 6)
+            self.canvas.setFillColor(colors.grey)
+            self.canvas.drawRightString(self.number_x, self.number_y, f"Halaman {self.canvas.getPageNumber()}")
+
+    def new_page(self):
+        self.page_number()
+        self.canvas.showPage()
+        self.y = self.top
+
+    def ensure(self, height):
+        """Pindah halaman bila blok setinggi `height` tidak muat lagi"""
+        if self.y - height < self.bottom and self.y < self.top and not self._in_form:
+            self.new_page()
+
+    def space(self, height):
+        self.y -= height
+
+    def heading(self, text, font_size, color, space_after=0):
+        """Judul satu baris, rata tengah, tebal"""
+        leading = font_size * 1.2
+        self.ensure(leading)
+        self.y -= leading
+        self.canvas.setFillColor(color)
+        self.canvas.setFont('Helvetica-Bold', font_size)
+        self.canvas.drawCentredString(self.left + self.width / 2, self.y + font_size * 0.25, text)
+        self.y -= space_after
+
+    def text_right(self, text, font_size, color):
+        """Satu baris teks rata kanan (footer 'Dicetak pada')"""
+        leading = font_size * 1.2
+        self.ensure(leading)
+        self.y -= leading
+        self.canvas.setFillColor(color)
+        self.canvas.setFont('Helvetica', font_size)
+        self.canvas.drawRightString(self.left + self.width, self.y + font_size * 0.25, text)
+
+    def block(self, key, draw):
+        """Blok statis sebagai form XObject: `draw` dijalankan sekali per
+        dokumen (digambar dari self.top ke bawah), setiap kemunculan
+        berikutnya hanya doForm yang digeser ke posisi y saat ini"""
+        name = pdf_form_name(key)
+        c = self.canvas
+        if name not in self._forms:
+            y, self.y = self.y, self.top
+            self._in_form = True
+            c.beginForm(name, 0, 0, self.page_width, self.page_height)
+            draw()
+            c.endForm()
+            self._in_form = False
+            self._forms[name] = self.top - self.y
+            self.y = y
+        height = self._forms[name]
+        self.ensure(height)
+        c.saveState()
+        c.translate(0, self.y - self.top)
+        c.doForm(name)
+        c.restoreState()
+        self.y -= height
+
+    def letterhead(self, subtitle, title_color, subtitle_color):
+        """Kop laporan: nama rumah sakit + judul laporan"""
+        def draw():
+            self.heading("RUMAH SAKIT ISLAM SITI KHADIJAH PALEMBANG", 11, title_color, space_after=3)
+            self.heading(subtitle, 9, subtitle_color, space_after=6)
+        self.block(f'kop:{subtitle}', draw)
+        self.space(0.2*cm)
+
+    def info_table(self, info_data):
+        """Blok info (struktur lini, filter shift, jumlah pegawai, periode)"""
+        self.table(info_data, [2.8*cm, 0.3*cm, 4*cm, 2.8*cm, 0.3*cm, 4*cm], 7, grid=None, bold_columns=(0, 3))
+        self.space(0.3*cm)
+
+    def signature(self, signature_data):
+        """Blok tanda tangan + keterangan waktu cetak (di luar blok statis)"""
+        self.block(f'ttd:{signature_data!r}', lambda: self.table(
+            signature_data, [7.5*cm, 7.5*cm], 7, align='CENTER', grid=None, bold_rows=(1,)))
+        self.space(0.15*cm)
+        self.text_right(f"Dicetak pada: {datetime.now().strftime('%d %B %Y %H:%M:%S')}", 6, colors.grey)
+
+    def paragraph_box(self, paragraph, width, fill, border, hpad=6, vpad=5, static=False):
+        """Paragraph (boleh berisi markup) di dalam kotak berwarna; `static`
+        untuk kotak yang isinya tetap (legend keterangan) agar jadi blok statis"""
+        if static and not self._in_form:
+            key = f'kotak:{paragraph.text}:{width}:{fill}:{border}'
+            self.block(key, lambda: self.paragraph_box(paragraph, width, fill, border, hpad, vpad))
+            return
+        _, height = paragraph.wrap(width - 2 * hpad, self.top - self.bottom)
+        total = height + 2 * vpad
+        self.ensure(total)
+        x = self.left + (self.width - width) / 2
+        self.canvas.setFillColor(fill)
+        self.canvas.setStrokeColor(border)
+        self.canvas.setLineWidth(1)
+        self.canvas.rect(x, self.y - total, width, total, stroke=1, fill=1)
+        paragraph.drawOn(self.canvas, x + hpad, self.y - vpad - height)
+        self.y -= total
+
+    def table(self, rows, col_widths, font_size, hpad=2, vpad=2, align='LEFT', header=None,
+              header_fill=None, header_color=colors.white, header_font_size=None, zebra=None,
+              header_align=None, grid=colors.grey, bold_columns=(), bold_rows=(), wrap_columns=(),
+              footer=None, footer_fill=None, footer_font_size=None):
+        """Gambar tabel baris demi baris. Tinggi baris = jumlah baris teks x
+        leading; header diulang di setiap halaman baru. `align` boleh satu
+        nilai atau list per kolom ('LEFT' / 'CENTER'; header memakai
+        `header_align` bila diisi), `wrap_columns` adalah
+        kolom teks yang boleh turun baris, `footer` adalah baris TOTAL."""
+        c = self.canvas
+        aligns = list(align) if isinstance(align, (list, tuple)) else [align] * len(col_widths)
+        header_aligns = [header_align] * len(col_widths) if header_align else aligns
+        lefts = [0]
+        for width in col_widths:
+            lefts.append(lefts[-1] + width)
+        table_width = lefts[-1]
+        x0 = self.left + (self.width - table_width) / 2
+
+        def layout(cells, size, bold):
+            laid = []
+            for col, cell in enumerate(cells):
+                color, cell_bold = None, bold or col in bold_columns
+                if isinstance(cell, CanvasCell):
+                    color = cell.color
+                    cell_bold = cell_bold or cell.bold
+                    cell = cell.text
+                cell_font = 'Helvetica-Bold' if cell_bold else 'Helvetica'
+                text = '' if cell is None else str(cell)
+                if col in wrap_columns and (
+                        '\n' in text or self.string_width(text, cell_font, size) > col_widths[col] - 2 * hpad):
+                    lines = canvas_wrap(text, cell_font, size, col_widths[col] - 2 * hpad)
+                else:
+                    lines = text.split('\n')
+                laid.append((lines, cell_font, color))
+            height = max(len(lines) for lines, _, _ in laid) * size * 1.2 + 2 * vpad
+            return laid, height
+
+        def draw(laid, height, size, fill, default_color, row_aligns):
+            top = self.y
+            if fill is not None:
+                c.setFillColor(fill)
+                c.rect(x0, top - height, table_width, height, stroke=0, fill=1)
+            leading = size * 1.2
+            # Satu text object per baris; font & warna hanya diset saat berubah
+            text = c.beginText()
+            state = None
+            for col, (lines, font, color) in enumerate(laid):
+                if not lines or lines == ['']:
+                    continue
+                color = color or default_color
+                if state != (font, color):
+                    text.setFont(font, size)
+                    text.setFillColor(color)
+                    state = (font, color)
+                # Rata tengah vertikal
+                baseline = top - (height - len(lines) * leading) / 2 - leading + size * 0.25
+                for line in lines:
+                    if row_aligns[col] == 'CENTER':
+                        x = x0 + lefts[col] + (col_widths[col] - self.string_width(line, font, size)) / 2
                     else:
-                        row.extend(['', '', ''])
-                table_data.append(row)
+                        x = x0 + lefts[col] + hpad
+                    text.setTextOrigin(x, baseline)
+                    text.textOut(line)
+                    baseline -= leading
+            c.drawText(text)
+            self.y -= height
+
+        def close_segment(segment_top):
+            if grid is None or segment_top == self.y:
+                return
+            c.setStrokeColor(grid)
+            c.setLineWidth(0.3)
+            for offset in lefts:
+                c.line(x0 + offset, segment_top, x0 + offset, self.y)
+            c.line(x0, segment_top, x0 + table_width, segment_top)
+
+        header_row = None
+        if header is not None:
+            header_size = header_font_size or font_size
+            header_row = layout(header, header_size, True) + (header_size,)
+
+        def start_segment():
+            segment_top = self.y
+            if header_row is not None:
+                laid, height, size = header_row
+                draw(laid, height, size, header_fill, header_color, header_aligns)
+                row_line()
+            return segment_top
+
+        def row_line():
+            if grid is not None:
+                c.setStrokeColor(grid)
+                c.setLineWidth(0.3)
+                c.line(x0, self.y, x0 + table_width, self.y)
+
+        body = [(row, font_size, position in bold_rows) for position, row in enumerate(rows)]
+        if footer is not None:
+            body.append((footer, footer_font_size or font_size, True))
+
+        header_height = header_row[1] if header_row is not None else 0
+        first_height = layout(body[0][0], body[0][1], body[0][2])[1] if body else 0
+        self.ensure(header_height + first_height)
+        segment_top = start_segment()
+        for position, (row, size, bold) in enumerate(body):
+            laid, height = layout(row, size, bold)
+            if self.y - height < self.bottom and not self._in_form:
+                close_segment(segment_top)
+                self.new_page()
+                segment_top = start_segment()
+            if footer is not None and position == len(body) - 1:
+                fill = footer_fill
+            else:
+                fill = zebra[position % len(zebra)] if zebra else None
+            draw(laid, height, size, fill, colors.black, aligns)
+            row_line()
+        close_segment(segment_top)
+
+    def save(self):
+        self.page_number()
+        self.canvas.save()
+
+
+# ============================================
+# LAPORAN KELOMPOK (export PDF kelompok & paket struktur lini)
+# ============================================
+
+MONTH_NAMES_SHORT = {
+    '01': 'Jan', '02': 'Feb', '03': 'Mar', '04': 'Apr',
+    '05': 'Mei', '06': 'Jun', '07': 'Jul', '08': 'Ags',
+    '09': 'Sep', '10': 'Okt', '11': 'Nov', '12': 'Des'
+}
+
+SHIFT_TEXT_MAP = {
+    'all': 'Semua (Shift & Non-Shift)',
+    'shift': 'Shift',
+    'non_shift': 'Non-Shift'
+}
+
+# Bagian laporan kelompok yang dipakai renderer platypus maupun canvas
+GroupReportParts = namedtuple('GroupReportParts', [
+    'info_data', 'header', 'col_widths', 'header_font_size', 'data_font_size',
+    'analysis_data', 'keterangan_text', 'keterangan_para', 'signature_data'
+])
+
+SIGNATURE_DATA = [
+    ['', ''],
+    ['KABAG SDM', 'KASUBAG KEPEGAWAIAN'],
+    ['', ''],
+    ['', ''],
+    ['Dewi Nashrulloh, SKM.M.Kes', 'Rahmawati, SH'],
+    ['NIK: 011205226', 'NIK: 022708322']
+]
+
+
+def group_report_parts(report, date_range, shift_filter, struktur_lini):
+    """Info, header & lebar kolom tabel, analisis, keterangan dan tanda tangan
+    laporan kelompok untuk satu ReportTable"""
+    styles = PDF_SAMPLE_STYLES
+    months_list = report.months
+    num_months = len(months_list)
+    
+    # INFO KELOMPOK - Compact
+    info_data = [
+        ['STRUKTUR LINI', ':', struktur_lini, 'FILTER SHIFT', ':', SHIFT_TEXT_MAP.get(shift_filter, 'Semua')],
+        ['JUMLAH PEGAWAI', ':', str(len(report)), 'PERIODE', ':', f"{date_range.get('start', '-')} s/d {date_range.get('end', '-')}"]
+    ]
+    
+    # Tentukan ukuran font dan padding berdasarkan jumlah bulan
+    if num_months <= 12:
+        # 12 bulan atau kurang - ukuran normal
+        header_font_size = 5
+        data_font_size = 5.5
+        month_col_width = 0.55*cm
+        show_year_in_header = True
+    elif num_months <= 18:
+        # 13-18 bulan - ukuran sedang
+        header_font_size = 4.5
+        data_font_size = 5
+        month_col_width = 0.50*cm
+        show_year_in_header = True
+    elif num_months <= 24:
+        # 19-24 bulan - ukuran kecil
+        header_font_size = 4
+        data_font_size = 4.5
+        month_col_width = 0.45*cm
+        show_year_in_header = False  # Hanya bulan, tanpa tahun
+    else:
+        # Lebih dari 24 bulan - sangat kecil
+        header_font_size = 3.5
+        data_font_size = 4
+        month_col_width = 0.40*cm
+        show_year_in_header = False
+    
+    # Header tabel dengan 2 kolom status (Non-Shift dan Shift)
+    header = ['NO', 'NAMA', 'NIK', 'TEMPAT TUGAS']
+    for month_key in months_list:
+        year, month = month_key.split('-')
+        if show_year_in_header:
+            header.append(f"{MONTH_NAMES_SHORT[month]}\n'{year[2:]}")
+        else:
+            header.append(f"{MONTH_NAMES_SHORT[month]}")
+    header.extend(['TOTAL', 'NON-SHIFT', 'SHIFT'])
+    
+    # ===== PERBAIKAN: Hitung lebar kolom DINAMIS =====
+    # Total width: 18cm - NO(0.5) - NAMA(2.5) - NIK(1.5) - TEMPAT(2.5) - TOTAL(0.8) - NON-SHIFT(1.6) - SHIFT(1.6) = sisa untuk bulan
+    fixed_width = 0.5 + 2.5 + 1.5 + 2.5 + 0.8 + 1.6 + 1.6  # = 11.0cm
+    available_for_months = 18 - fixed_width  # = 7cm
+    
+    # Hitung lebar kolom bulan
+    if num_months > 0:
+        month_col_width = min(month_col_width, available_for_months / num_months)
+    
+    col_widths = [
+        0.5*cm,    # NO
+        2.5*cm,    # NAMA
+        1.5*cm,    # NIK
+        2.5*cm,    # TEMPAT TUGAS
+    ] + [month_col_width*cm] * num_months + [
+        0.8*cm,    # TOTAL
+        1.6*cm,    # NON-SHIFT
+        1.6*cm     # SHIFT
+    ]
+    
+    # ===== Target berdasarkan JUMLAH BULAN AKTUAL (mesin target, ReportTable.compliance) =====
+    kegiatan_per_bulan = KEGIATAN_PER_TAHUN / 12
+    total_kegiatan_dalam_periode = report.total_kegiatan
+    
+    # TARGET DAN ANALISIS - DINAMIS
+    avg_attendance = report.grand_total / len(report) if len(report) > 0 else 0
+    
+    analysis_data = [
+        ['KETERANGAN', 'NILAI'],
+        ['Total Pegawai', f'{len(report)} orang'],
+        ['Periode', f'{num_months} bulan ({date_range.get("start")} s/d {date_range.get("end")})'],
+        ['Total Kehadiran', f'{report.grand_total} kali'],
+        ['Rata-rata per Pegawai', f'{avg_attendance:.1f} kali'],
+    ]
+    
+    # KETERANGAN TARGET - DINAMIS
+    keterangan_style = ParagraphStyle(
+        'Keterangan',
+        parent=styles['Normal'],
+        fontSize=6.5,
+        leading=8,
+        leftIndent=8,
+        rightIndent=8,
+        spaceAfter=2
+    )
+    
+    keterangan_text = f"""
+    <b>KETERANGAN STATUS:</b><br/>
+    • <b>Periode:</b> {num_months} bulan dari {date_range.get('start')} sampai {date_range.get('end')}<br/>
+    • <b>Total Kegiatan Senam dalam periode:</b> {total_kegiatan_dalam_periode:.1f} kali ({kegiatan_per_bulan:.2f} kali/bulan × {num_months} bulan)<br/>
+    • <b>Target NON-SHIFT:</b> {report.target_non_shift} kali ({TARGET_PERSEN['non_shift']}% dari {total_kegiatan_dalam_periode:.1f})<br/>
+    • <b>Target SHIFT:</b> {report.target_shift} kali ({TARGET_PERSEN['shift']}% dari {total_kegiatan_dalam_periode:.1f})<br/>
+    • Status <font color="#2e7d32"><b>✓ Tercapai</b></font> = Kehadiran mencapai/melebihi target<br/>
+    • Status <font color="#c62828"><b>✗ Kurang Nx</b></font> = Kehadiran kurang N kali dari target
+    """
+    
+    return GroupReportParts(
+        info_data=info_data,
+        header=header,
+        col_widths=col_widths,
+        header_font_size=header_font_size,
+        data_font_size=data_font_size,
+        analysis_data=analysis_data,
+        keterangan_text=keterangan_text,
+        keterangan_para=Paragraph(keterangan_text, keterangan_style),
+        signature_data=SIGNATURE_DATA
+    )
+
+
+def group_report_rows(report):
+    """Baris pegawai laporan: (no, pegawai, kehadiran per bulan, total, kurang non-shift, kurang shift)"""
+    return zip(
+        range(1, len(report) + 1),
+        report.employees,
+        report.matrix.tolist(),
+        report.totals.tolist(),
+        report.gap_non_shift.tolist(),
+        report.gap_shift.tolist()
+    )
+
+
+def draw_group_report_canvas(pdf, report, parts):
+    """Laporan kelompok lewat renderer canvas (CanvasReport)"""
+    num_months = len(report.months)
+    canvas_rows = [
+        [str(idx), emp.get('nama', f'Pegawai {idx}'), emp.get('nik', '-'), emp.get('tempat', '-')]
+        + values + [employee_total, canvas_status_cell(kurang_non_shift), canvas_status_cell(kurang_shift)]
+        for idx, emp, values, employee_total, kurang_non_shift, kurang_shift in group_report_rows(report)
+    ]
+    
+    pdf.letterhead("REKAP ABSENSI SENAM PEGAWAI PER KELOMPOK", colors.HexColor('#1a237e'), colors.HexColor('#283593'))
+    pdf.info_table(parts.info_data)
+    pdf.table(
+        canvas_rows, parts.col_widths, parts.data_font_size, hpad=1.5, vpad=2,
+        align=['CENTER', 'LEFT', 'CENTER', 'LEFT'] + ['CENTER'] * (num_months + 3),
+        header=parts.header, header_align='CENTER', header_fill=colors.HexColor('#1976d2'),
+        header_font_size=parts.header_font_size, zebra=[colors.white, colors.HexColor('#f5f5f5')],
+        wrap_columns=(1, 2, 3),
+        footer=['', 'TOTAL', '', ''] + report.month_totals.tolist() + [report.grand_total, '', ''],
+        footer_fill=colors.HexColor('#e3f2fd'), footer_font_size=6
+    )
+    pdf.space(0.4*cm)
+    pdf.table(
+        parts.analysis_data[1:], [10*cm, 5*cm], 7, vpad=3, align=['LEFT', 'CENTER'],
+        header=parts.analysis_data[0], header_fill=colors.HexColor('#e3f2fd'), header_color=colors.black,
+        zebra=[colors.white, colors.HexColor('#fafafa')]
+    )
+    pdf.space(0.25*cm)
+    pdf.paragraph_box(parts.keterangan_para, 15*cm, colors.HexColor('#fff9c4'), colors.HexColor('#f9a825'), static=True)
+    pdf.space(0.4*cm)
+    pdf.signature(parts.signature_data)
+
+
+def group_report_story(doc, report, parts):
+    """Story platypus laporan kelompok, dimulai di halaman baru. Tabel pegawai
+    dipecah per halaman sehingga story bisa disambung (paket struktur lini)
+    dan dirender paralel per bagian halaman."""
+    styles = PDF_SAMPLE_STYLES
+    data_font_size = parts.data_font_size
+    story = []
+    
+    # CUSTOM STYLES
+    title_style = ParagraphStyle(
+        'TitleStyle',
+        parent=styles['Heading1'],
+        fontSize=11,
+        alignment=TA_CENTER,
+        spaceAfter=3,
+        textColor=colors.HexColor('#1a237e'),
+        fontName='Helvetica-Bold'
+    )
+    
+    subtitle_style = ParagraphStyle(
+        'SubtitleStyle',
+        parent=styles['Heading2'],
+        fontSize=9,
+        alignment=TA_CENTER,
+        spaceAfter=6,
+        textColor=colors.HexColor('#283593'),
+        fontName='Helvetica-Bold'
+    )
+    
+    # HEADER
+    story.append(pdf_letterhead("REKAP ABSENSI SENAM PEGAWAI PER KELOMPOK", title_style, subtitle_style))
+    story.append(Spacer(1, 0.2*cm))
+    
+    info_table = Table(parts.info_data, colWidths=[2.8*cm, 0.3*cm, 4*cm, 2.8*cm, 0.3*cm, 4*cm])
+    info_table.setStyle(TableStyle([
+        ('FONTNAME', (0,0), (0,-1), 'Helvetica-Bold'),
+        ('FONTNAME', (3,0), (3,-1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0,0), (-1,-1), 7),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+        ('BOTTOMPADDING', (0,0), (-1,-1), 2),
+        ('TOPPADDING', (0,0), (-1,-1), 2),
+    ]))
+    
+    story.append(info_table)
+    story.append(Spacer(1, 0.3*cm))
+    
+    # Style dari registry: dibuat sekali per ukuran font, bukan per baris
+    cell_style = pdf_cell_style(data_font_size)
+    status_good_style = pdf_style(
+        fontSize=data_font_size,
+        textColor=colors.HexColor('#2e7d32'),
+        fontName='Helvetica-Bold',
+        alignment=TA_CENTER
+    )
+    status_bad_style = pdf_style(
+        fontSize=data_font_size,
+        textColor=colors.HexColor('#c62828'),
+        alignment=TA_CENTER
+    )
+    # Lebar isi sel NAMA/NIK/TEMPAT = lebar kolom - padding kiri/kanan (1.5 + 1.5)
+    nama_width, nik_width, tempat_width = 2.5*cm - 3, 1.5*cm - 3, 2.5*cm - 3
+    
+    table_rows = []
+    for idx, emp, values, employee_total, kurang_non_shift, kurang_shift in group_report_rows(report):
+        try:
+            nama = emp.get('nama', f'Pegawai {idx}')
+            nik = emp.get('nik', '-')
+            tempat = emp.get('tempat', '-')
             
+            # String polos bila muat, Paragraph hanya untuk teks yang perlu wrap
+            row = [
+                str(idx),
+                pdf_text_cell(nama, nama_width, cell_style),
+                pdf_text_cell(nik, nik_width, cell_style),
+                pdf_text_cell(tempat, tempat_width, cell_style)
+            ]
+            row.extend(str(value) for value in values)
+            row.append(str(employee_total))
+            
+            # Status NON-SHIFT (target dinamis)
+            if kurang_non_shift == 0:
+                status_non_shift = Paragraph('✓ Tercapai', status_good_style)
+            else:
+                status_non_shift = Paragraph(f'✗ Kurang {kurang_non_shift}x', status_bad_style)
+            
+            # Status SHIFT (target dinamis)
+            if kurang_shift == 0:
+                status_shift = Paragraph('✓ Tercapai', status_good_style)
+            else:
+                status_shift = Paragraph(f'✗ Kurang {kurang_shift}x', status_bad_style)
+            
+            row.extend([status_non_shift, status_shift])
+            table_rows.append(row)
+            
+        except Exception as e:
+            print(f"ERROR processing employee {idx}: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            continue
+    
+    # Total row
+    total_row = ['', Paragraph('<b>TOTAL</b>', pdf_style(
+        fontSize=6,
+        fontName='Helvetica-Bold'
+    )), '', '']
+    
+    total_row.extend(str(month_total) for month_total in report.month_totals.tolist())
+    
+    total_row.extend([str(report.grand_total), '', ''])
+    table_rows.append(total_row)
+    
+    # Satu tabel per halaman (header berulang), baris per halaman dihitung di muka
+    story.extend(paged_pdf_tables(
+        parts.header, table_rows, parts.col_widths,
+        [
             # Header
-            header = ['BULAN', 'HADIR', 'KETERANGAN'] * 3
-            table_data.insert(0, header)
+            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#1976d2')),
+            ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0,0), (-1,0), parts.header_font_size),
+            ('ALIGN', (0,0), (-1,0), 'CENTER'),
+            ('VALIGN', (0,0), (-1,0), 'MIDDLE'),
             
-            # Lebar disesuaikan A4: (2.5+0.8+2) * 3 = 15.9cm (muat!)
-            col_widths = [2.5*cm, 0.8*cm, 2*cm] * 3
+            # Data rows
+            ('FONTSIZE', (0,1), (-1,-1), data_font_size),
+            ('ALIGN', (0,1), (0,-1), 'CENTER'),  # NO
+            ('ALIGN', (2,1), (2,-1), 'CENTER'),  # NIK
+            ('ALIGN', (4,1), (-1,-1), 'CENTER'),  # Bulan, Total, Status
+            ('VALIGN', (0,1), (-1,-1), 'MIDDLE'),
             
-            attendance_table = Table(table_data, colWidths=col_widths, repeatRows=1)
-            attendance_table.setStyle(TableStyle([
-                ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#1976d2')),
-                ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-                ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0,0), (-1,0), 6),  # Font header kecil
-                ('ALIGN', (0,0), (-1,0), 'CENTER'),
-                ('FONTSIZE', (0,1), (-1,-1), 5.5),  # Font isi kecil
-                ('ALIGN', (0,1), (-1,-1), 'LEFT'),
-                ('ALIGN', (1,1), (1,-1), 'CENTER'),
-                ('ALIGN', (4,1), (4,-1), 'CENTER'),
-                ('ALIGN', (7,1), (7,-1), 'CENTER'),
-                ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-                ('GRID', (0,0), (-1,-1), 0.3, colors.grey),
-                ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.white, colors.HexColor('#f5f5f5')]),
-                ('BOTTOMPADDING', (0,0), (-1,-1), 1.5),
-                ('TOPPADDING', (0,0), (-1,-1), 1.5),
-            ]))
+            # Grid
+            ('GRID', (0,0), (-1,-1), 0.3, colors.grey),
             
-            story.append(attendance_table)
-            story.append(Spacer(1, 0.2*cm))
+            # Padding
+            ('BOTTOMPADDING', (0,0), (-1,-1), 2),
+            ('TOPPADDING', (0,0), (-1,-1), 2),
+            ('LEFTPADDING', (0,0), (-1,-1), 1.5),
+            ('RIGHTPADDING', (0,0), (-1,-1), 1.5),
+        ],
+        first_height=pdf_frame_height(doc) - pdf_story_height(story, doc.width, doc.height),
+        page_height=pdf_frame_height(doc),
+        hpadding=1.5,
+        vpadding=2,
+        zebra=[colors.white, colors.HexColor('#f5f5f5')],
+        # Total row (hanya di tabel halaman terakhir)
+        last_commands=[
+            ('BACKGROUND', (0,-1), (-1,-1), colors.HexColor('#e3f2fd')),
+            ('FONTNAME', (0,-1), (-1,-1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0,-1), (-1,-1), 6),
+            ('ALIGN', (2,-1), (2,-1), 'LEFT'),
+            ('ALIGN', (4,-1), (-1,-1), 'CENTER'),
+        ]
+    ))
+    story.append(Spacer(1, 0.4*cm))
+    
+    analysis_table = Table(parts.analysis_data, colWidths=[10*cm, 5*cm])
+    analysis_table.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#e3f2fd')),
+        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0,0), (-1,-1), 7),
+        ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+        ('ALIGN', (1,0), (1,-1), 'CENTER'),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+        ('GRID', (0,0), (-1,-1), 0.3, colors.grey),
+        ('BOTTOMPADDING', (0,0), (-1,-1), 3),
+        ('TOPPADDING', (0,0), (-1,-1), 3),
+        ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.white, colors.HexColor('#fafafa')]),
+    ]))
+    
+    story.append(analysis_table)
+    story.append(Spacer(1, 0.25*cm))
+    
+    keterangan_table = Table([[parts.keterangan_para]], colWidths=[15*cm])
+    keterangan_table.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#fff9c4')),
+        ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#f9a825')),
+        ('LEFTPADDING', (0,0), (-1,-1), 6),
+        ('RIGHTPADDING', (0,0), (-1,-1), 6),
+        ('TOPPADDING', (0,0), (-1,-1), 5),
+        ('BOTTOMPADDING', (0,0), (-1,-1), 5),
+    ]))
+    
+    story.append(FormBlock(f'keterangan:{parts.keterangan_text}', [keterangan_table]))
+    story.append(Spacer(1, 0.4*cm))
+    story.extend(pdf_signature_story(parts.signature_data))
+    return story
+
+
+def write_group_report_pdf(output, report, parts, renderer='platypus'):
+    """Tulis PDF laporan kelompok (A4 portrait) ke file `output`"""
+    if renderer == 'canvas':
+        # Digambar langsung tanpa flowable platypus
+        pdf = CanvasReport(output, page_numbers=True)
+        draw_group_report_canvas(pdf, report, parts)
+        pdf.save()
+        return
+
+    doc = SimpleDocTemplate(
+        output,
+        pagesize=A4,
+        rightMargin=1.2*cm,
+        leftMargin=1.2*cm,
+        topMargin=0.8*cm,
+        bottomMargin=1.5*cm
+    )
+    story = group_report_story(doc, report, parts)
+    print(f"DEBUG: Building PDF with {len(story)} elements")
+    build_pdf_story(doc, story)
+
+
+def pdf_signature_story(signature_data):
+    """Blok tanda tangan (blok statis) + keterangan waktu cetak"""
+    signature_table = Table(signature_data, colWidths=[7.5*cm, 7.5*cm])
+    signature_table.setStyle(TableStyle([
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+        ('FONTSIZE', (0,0), (-1,-1), 7),
+        ('FONTSIZE', (0,1), (-1,1), 7),
+        ('FONTNAME', (0,1), (-1,1), 'Helvetica-Bold'),
+        ('TOPPADDING', (0,1), (-1,1), 0),
+        ('TOPPADDING', (0,4), (-1,5), 3),
+    ]))
+    
+    # FOOTER
+    footer_style = pdf_style(fontSize=6, alignment=TA_RIGHT, textColor=colors.grey)
+    return [
+        FormBlock(f'ttd:{signature_data!r}', [signature_table]),
+        Spacer(1, 0.15*cm),
+        Paragraph(f"Dicetak pada: {datetime.now().strftime('%d %B %Y %H:%M:%S')}", footer_style),
+    ]
+
+
+# ============================================
+# CACHE HASIL EXPORT (file di disk, LRU, per versi dataset)
+# ============================================
+
+EXPORT_CACHE_FOLDER = os.environ.get('EXPORT_CACHE_DIR', '/tmp/export_cache' if is_vercel else 'data/export_cache')
+EXPORT_CACHE_MAX_BYTES = int(float(os.environ.get('EXPORT_CACHE_MAX_MB', '200')) * 1024 * 1024)
+
+# hits: dari cache, coalesced: menunggu render identik yang sedang berjalan
+# (keduanya = render yang tidak perlu dilakukan), misses: render baru,
+# warmed: render oleh pemanasan cache setelah upload
+export_cache_stats = {'hits': 0, 'coalesced': 0, 'misses': 0, 'warmed': 0, 'stores': 0, 'evictions': 0}
+_export_cache_lock = threading.Lock()
+_export_flights = {}
+
+
+def count_export_cache(name, amount=1):
+    with _export_cache_lock:
+        export_cache_stats[name] += amount
+
+
+def response_filename(response, default):
+    """Nama file dari header Content-Disposition respons send_file"""
+    _, options = parse_options_header(response.headers.get('Content-Disposition', ''))
+    return options.get('filename') or default
+
+
+# Kunci payload yang hanya informasi tampilan dashboard (tidak dibaca view)
+EXPORT_CACHE_IGNORED_KEYS = ('filters',)
+
+
+def normalize_export_payload(payload):
+    """Bentuk kanonik payload export untuk kunci cache: nilai filter kategori
+    diurutkan tanpa duplikat/kosong/'all', kunci tanpa isi dibuang"""
+    normalized = {}
+    for key, value in payload.items():
+        if key in EXPORT_CACHE_IGNORED_KEYS:
+            continue
+        if key == 'filter' and isinstance(value, dict):
+            value = normalize_export_filter(value)
+        if value in (None, '', [], {}):
+            continue
+        normalized[key] = value
+    return normalized
+
+
+def normalize_export_filter(spec):
+    normalized = {}
+    for column, selected in spec.items():
+        if isinstance(selected, (list, tuple)):
+            selected = sorted({str(value) for value in selected if value not in (None, '', 'all')})
+        elif isinstance(selected, str):
+            selected = selected.strip()
+            if column != 'q' and selected == 'all':
+                selected = ''
+        if selected not in (None, '', []):
+            normalized[column] = selected
+    return normalized
+
+
+def export_cache_key(endpoint, payload):
+    """Versi dataset (uuid per upload, dibaca ulang dari database setiap
+    permintaan) + hash (endpoint, payload ternormalisasi). Upload baru di
+    proses mana pun mengganti versi, jadi render dari data lama hanya bisa
+    tersimpan di bawah kunci versi lama yang tidak pernah dicari lagi."""
+    index = get_dataset_index()
+    version = index.version if index is not None else 0
+    spec = json.dumps(normalize_export_payload(payload), sort_keys=True, ensure_ascii=False, default=str)
+    digest = hashlib.sha256(f'{endpoint}\n{spec}'.encode('utf-8')).hexdigest()
+    return f'v{version}-{digest[:40]}'
+
+
+def export_cache_paths(key):
+    base = os.path.join(EXPORT_CACHE_FOLDER, key)
+    return f'{base}.bin', f'{base}.json'
+
+
+def export_cache_get(key):
+    """(file terbuka, metadata) bila ada di cache; waktu akses diperbarui (LRU).
+    File langsung dibuka agar tetap terbaca walau entri dihapus proses lain
+    (eviction / upload baru) sebelum respons selesai dikirim."""
+    path, meta_path = export_cache_paths(key)
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        file = open(path, 'rb')
+    except (OSError, ValueError):
+        return None
+    with contextlib.suppress(OSError):
+        os.utime(path)
+        os.utime(meta_path)
+    return file, meta
+
+
+def export_cache_commit(key, temp_path, filename, mimetype, size):
+    """Jadikan file sementara yang sudah lengkap sebagai entri cache (rename
+    agar atomik bagi proses lain), kemudian pangkas cache sampai di bawah
+    batas ukuran"""
+    path, meta_path = export_cache_paths(key)
+    fd, meta_temp = tempfile.mkstemp(dir=EXPORT_CACHE_FOLDER, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(json.dumps({'filename': filename, 'mimetype': mimetype, 'size': size}).encode('utf-8'))
+    os.replace(temp_path, path)
+    os.replace(meta_temp, meta_path)
+    count_export_cache('stores')
+    evict_export_cache()
+
+
+class ExportCacheTee:
+    """Body respons export yang diteruskan ke client apa adanya sambil
+    disalin ke file sementara di folder cache. Entri cache dibuat hanya bila
+    body terkirim utuh; `release` (lepas single-flight) dipanggil sekali,
+    saat body habis atau saat respons ditutup."""
+
+    def __init__(self, key, body, filename, mimetype, release):
+        self.key = key
+        self.body = body
+        self.filename = filename
+        self.mimetype = mimetype
+        self.release = release
+        self.size = 0
+        self.file = None
+        try:
+            os.makedirs(EXPORT_CACHE_FOLDER, exist_ok=True)
+            fd, self.temp_path = tempfile.mkstemp(dir=EXPORT_CACHE_FOLDER, suffix='.tmp')
+            self.file = os.fdopen(fd, 'wb')
+        except OSError as e:
+            print(f"Export cache error: {e}")
+
+    def __iter__(self):
+        for chunk in self.body:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if self.file is not None:
+                self.size += len(chunk)
+                try:
+                    if self.size > EXPORT_CACHE_MAX_BYTES:
+                        raise OSError('melebihi batas ukuran cache')
+                    self.file.write(chunk)
+                except OSError as e:
+                    print(f"Export cache skip {self.filename}: {e}")
+                    self.discard()
+            yield chunk
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            try:
+                export_cache_commit(self.key, self.temp_path, self.filename, self.mimetype, self.size)
+            except Exception as e:
+                print(f"Export cache error: {e}")
+                with contextlib.suppress(OSError):
+                    os.remove(self.temp_path)
+        self.finish()
+
+    def discard(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            with contextlib.suppress(OSError):
+                os.remove(self.temp_path)
+
+    def finish(self):
+        release, self.release = self.release, None
+        if release is not None:
+            release()
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            # Unduhan terputus sebelum selesai: file sementara tidak dipakai
+            self.discard()
+            self.finish()
+
+
+def evict_export_cache():
+    """Hapus entri yang paling lama tidak dipakai sampai total ukuran <= batas"""
+    entries = []
+    total = 0
+    for entry in os.scandir(EXPORT_CACHE_FOLDER):
+        if entry.name.endswith('.bin'):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+    entries.sort()
+    for _, size, path in entries:
+        if total <= EXPORT_CACHE_MAX_BYTES:
+            break
+        for target in (path, path[:-4] + '.json', path[:-4] + '.lock'):
+            with contextlib.suppress(OSError):
+                os.remove(target)
+        total -= size
+        count_export_cache('evictions')
+
+
+def clear_export_cache():
+    """Kosongkan cache export (dipanggil saat upload baru / data dihapus)"""
+    try:
+        if os.path.isdir(EXPORT_CACHE_FOLDER):
+            for entry in os.scandir(EXPORT_CACHE_FOLDER):
+                with contextlib.suppress(OSError):
+                    os.remove(entry.path)
+    except Exception as e:
+        print(f"Error clearing export cache: {e}")
+
+
+# Batas tunggu (detik) render identik yang sedang berjalan; lewat dari itu
+# permintaan merender sendiri tanpa cache (mis. unduhan pertama sangat lambat)
+EXPORT_SINGLE_FLIGHT_WAIT = float(os.environ.get('EXPORT_SINGLE_FLIGHT_WAIT', '120'))
+
+
+def flock_until(lock_file, deadline):
+    """flock eksklusif, menunggu paling lama sampai `deadline` (monotonic)"""
+    while True:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+
+@contextlib.contextmanager
+def export_single_flight(key):
+    """Satu render per kunci cache. Thread lain di proses ini menunggu lock
+    per kunci, proses lain (worker gunicorn) menunggu flock pada file kunci
+    di folder cache; setelah giliran didapat, pemanggil memeriksa cache lagi.
+    Yield False bila batas tunggu habis sebelum giliran didapat."""
+    with _export_cache_lock:
+        flight = _export_flights.get(key)
+        if flight is None:
+            flight = _export_flights[key] = [threading.Lock(), 0]
+        flight[1] += 1
+
+    deadline = time.monotonic() + EXPORT_SINGLE_FLIGHT_WAIT
+    locked = flight[0].acquire(timeout=EXPORT_SINGLE_FLIGHT_WAIT)
+    lock_file = None
+    try:
+        if locked and fcntl is not None:
+            try:
+                os.makedirs(EXPORT_CACHE_FOLDER, exist_ok=True)
+                lock_file = open(os.path.join(EXPORT_CACHE_FOLDER, f'{key}.lock'), 'a')
+                if not flock_until(lock_file, deadline):
+                    lock_file.close()
+                    lock_file = None
+                    flight[0].release()
+                    locked = False
+            except OSError as e:
+                print(f"Export cache lock error: {e}")
+        yield locked
+    finally:
+        if lock_file is not None:
+            with contextlib.suppress(OSError):
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+        if locked:
+            flight[0].release()
+        with _export_cache_lock:
+            flight[1] -= 1
+            if flight[1] == 0:
+                del _export_flights[key]
+
+
+def cached_export_response(view, cached, status):
+    file, meta = cached
+    print(f"DEBUG: Export cache {status} {view.__name__}: {meta['filename']}")
+    response = send_file(file, as_attachment=True, download_name=meta['filename'], mimetype=meta['mimetype'])
+    response.content_length = os.fstat(file.fileno()).st_size
+    response.headers['X-Export-Cache'] = status
+    return response
+
+
+def cached_export(view):
+    """Decorator view export: hasil file disajikan dari cache disk bila
+    permintaan identik pernah dirender untuk versi dataset yang sama
+    (dilewati bila environ 'export.nocache' diisi, mis. benchmark).
+    Permintaan identik yang datang saat render masih berjalan menunggu
+    hasil render itu (single-flight) alih-alih merender ulang."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if EXPORT_CACHE_MAX_BYTES <= 0 or request.environ.get('export.nocache'):
+            return view(*args, **kwargs)
+
+        try:
+            key = export_cache_key(view.__name__, request.get_json(silent=True) or {})
+            cached = export_cache_get(key)
+        except Exception as e:
+            print(f"Export cache error: {e}")
+            return view(*args, **kwargs)
+
+        if cached is not None:
+            count_export_cache('hits')
+            return cached_export_response(view, cached, 'HIT')
+
+        # Single-flight dilepas setelah body selesai dikirim (body bisa berupa
+        # stream yang baru dirender saat dikirim), bukan saat view selesai
+        flight = contextlib.ExitStack()
+        with flight:
+            if not flight.enter_context(export_single_flight(key)):
+                print(f"DEBUG: Export cache {view.__name__}: menunggu render lain terlalu lama, render sendiri")
+                count_export_cache('misses')
+                return view(*args, **kwargs)
+
+            # Render identik yang sedang berjalan mungkin baru saja selesai
+            cached = export_cache_get(key)
+            if cached is not None:
+                count_export_cache('coalesced')
+                return cached_export_response(view, cached, 'COALESCED')
+
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.mimetype == 'application/json':
+                return response
+
+            count_export_cache('warmed' if request.environ.get('export.warm') else 'misses')
+            filename = response_filename(response, f'{view.__name__}.bin')
+            response.response = ExportCacheTee(key, response.response, filename, response.mimetype,
+                                               flight.pop_all().close)
+        response.headers['X-Export-Cache'] = 'MISS'
+        return response
+
+    return wrapper
+
+
+@app.route('/')
+def index():
+    return render_template('index.html')
+
+@app.route('/api/data')
+def api_data():
+    data = load_temp_data()
+    return jsonify(data)
+
+@app.route('/api/data/stream')
+def api_data_stream():
+    """Dataset sebagai NDJSON: satu pegawai per baris, dikirim bertahap"""
+    index = get_dataset_index()
+    employees = index.employees if index is not None else []
+
+    def generate():
+        for emp in employees:
+            yield json.dumps(emp, ensure_ascii=False) + '\n'
+
+    return Response(
+        generate(),
+        mimetype='application/x-ndjson',
+        headers={'X-Total-Count': str(len(employees))}
+    )
+
+@app.route('/api/data/arrow')
+def api_data_arrow():
+    """Dataset dalam format Arrow IPC (file/Feather v2 atau stream)"""
+    try:
+        if pa is None:
+            return jsonify({'success': False, 'message': 'Export Arrow membutuhkan paket pyarrow'}), 501
+
+        index = get_dataset_index()
+        if index is None:
+            return jsonify({'success': False, 'message': 'Tidak ada data'})
+
+        table = build_arrow_table(index)
+        ipc_format = request.args.get('format', 'file')
+        compression = request.args.get('compression') or None
+        if compression not in (None, 'lz4', 'zstd'):
+            return jsonify({'success': False, 'message': 'Kompresi tidak didukung (lz4/zstd)'})
+
+        sink = pa.BufferOutputStream()
+        options = pa_ipc.IpcWriteOptions(compression=compression)
+        if ipc_format == 'stream':
+            with pa_ipc.new_stream(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+            mimetype = 'application/vnd.apache.arrow.stream'
+            extension = 'arrows'
+        else:
+            with pa_ipc.new_file(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+            mimetype = 'application/vnd.apache.arrow.file'
+            extension = 'arrow'
+
+        output = io.BytesIO(sink.getvalue().to_pybytes())
+        filename = f"rekap_senam_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+        return send_file(
+            output,
+            as_attachment=True,
+            download_name=filename,
+            mimetype=mimetype
+        )
+
+    except Exception as e:
+        print(f"Arrow Export error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
+
+@app.route('/api/attendance-range')
+def api_attendance_range():
+    """Daftar pegawai yang ikut dan tidak ikut senam dalam rentang bulan"""
+    try:
+        index = get_dataset_index()
+        if index is None:
+            return jsonify({'success': False, 'message': 'Tidak ada data'})
+
+        start = request.args.get('start')
+        end = request.args.get('end')
+        try:
+            totals = index.range_totals(start, end)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Format rentang waktu tidak valid (gunakan YYYY-MM)'})
+
+        attendance = []
+        no_attendance = []
+        for row, total in enumerate(totals.tolist()):
+            item = index.summary(row)
+            item['total'] = total
+            if total > 0:
+                attendance.append(item)
+            else:
+                no_attendance.append(item)
+
+        return jsonify({
+            'success': True,
+            'date_range': {'start': start, 'end': end},
+            'attendance_count': len(attendance),
+            'no_attendance_count': len(no_attendance),
+            'attendance': attendance,
+            'no_attendance': no_attendance
+        })
+
+    except Exception as e:
+        print(f"Attendance range error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
+
+@app.route('/api/compliance', methods=['GET', 'POST'])
+def api_compliance():
+    """Target, kekurangan & status tercapai pegawai untuk satu periode.
+
+    Parameter (query string atau JSON): spesifikasi export (filter / ids /
+    niks, default seluruh pegawai), start & end 'YYYY-MM' (default 24 bulan
+    sampai bulan terakhir berisi data), shift_status 'own' (status masing-
+    masing pegawai, default), 'shift' atau 'non_shift', dan employees=0 untuk
+    ringkasan saja.
+    """
+    try:
+        index = get_dataset_index()
+        if index is None:
+            return jsonify({'success': False, 'message': 'Tidak ada data'})
+
+        if request.method == 'POST':
+            params = request.json or {}
+        else:
+            params = {'filter': filter_spec_from_args(request.args)}
+            for key in ('ids', 'niks'):
+                if key in request.args:
+                    params[key] = request.args.getlist(key)
+            params.update({key: request.args[key] for key in ('start', 'end', 'shift_status', 'employees') if key in request.args})
+
+        shift_status = params.get('shift_status') or 'own'
+        if shift_status not in ('own',) + SHIFT_COLUMNS:
+            return jsonify({'success': False, 'message': f'Status shift tidak dikenal: {shift_status}'})
+
+        end = params.get('end') or latest_report_month(index)
+        try:
+            start = params.get('start') or month_key(month_ordinal(end) - DEFAULT_REPORT_MONTHS + 1)
+            num_months = len(months_in_range({'start': start, 'end': end}))
+            rows = resolve_export_rows(index, params) if any(key in params for key in EXPORT_SPEC_KEYS) else list(range(len(index)))
+        except (KeyError, ValueError) as e:
+            return jsonify({'success': False, 'message': f'Parameter tidak valid: {e}'})
+        if num_months == 0:
+            return jsonify({'success': False, 'message': 'Rentang waktu kosong (start setelah end)'})
+
+        rows = np.asarray(rows, dtype=np.int64)
+        if shift_status == 'own':
+            shift_mask = index.filters.column_mask('shift_status', 'shift')
+            is_shift = shift_mask[rows] if shift_mask is not None else np.zeros(len(rows), dtype=bool)
+        else:
+            is_shift = np.full(len(rows), shift_status == 'shift')
+
+        # Satu evaluasi vektor untuk seluruh pegawai terpilih
+        compliance = Compliance(index.range_totals(start, end, rows), num_months, is_shift)
+
+        passed_by_status = np.bincount(compliance.is_shift.astype(np.intp), weights=compliance.own_passed, minlength=2)
+        count_by_status = np.bincount(compliance.is_shift.astype(np.intp), minlength=2)
+        passed = int(compliance.own_passed.sum())
+        result = {
+            'success': True,
+            'period': {'start': start, 'end': end, 'months': num_months},
+            'total_kegiatan': round(float(compliance.total_kegiatan), 2),
+            'targets': {column: compliance.target(column) for column in SHIFT_COLUMNS},
+            'summary': {
+                'count': len(compliance),
+                'passed': passed,
+                'percent': round(passed / len(compliance) * 100, 1) if len(compliance) else 0.0,
+                'by_shift_status': {
+                    column: {'count': int(count_by_status[position]), 'passed': int(passed_by_status[position])}
+                    for position, column in enumerate(SHIFT_COLUMNS)
+                },
+            },
+        }
+
+        if str(params.get('employees', '1')).lower() not in ('0', 'false'):
+            employees = []
+            for row, total, is_shift_row, target, gap, ok in zip(
+                    rows.tolist(), compliance.totals.tolist(), compliance.is_shift.tolist(),
+                    compliance.own_target.tolist(), compliance.own_gap.tolist(), compliance.own_passed.tolist()):
+                item = index.summary(row)
+                item.update({
+                    'total': total,
+                    'target_shift_status': 'shift' if is_shift_row else 'non_shift',
+                    'target': target,
+                    'gap': gap,
+                    'passed': ok,
+                })
+                employees.append(item)
+            result['employees'] = employees
+
+        return jsonify(result)
+
+    except Exception as e:
+        print(f"Compliance error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
+
+@app.route('/api/search')
+def api_search():
+    """Cari pegawai berdasarkan nama, NIK, jabatan atau tempat tugas"""
+    try:
+        index = get_dataset_index()
+        if index is None:
+            return jsonify({'success': True, 'query': '', 'count': 0, 'ids': []})
+
+        query = request.args.get('q', '')
+        started = time.perf_counter()
+        rows = index.search.search(query)
+        took_ms = (time.perf_counter() - started) * 1000
+
+        return jsonify({
+            'success': True,
+            'query': query,
+            'count': len(rows),
+            'ids': [index.ids[row] for row in rows],
+            'took_ms': round(took_ms, 3)
+        })
+
+    except Exception as e:
+        print(f"Search error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
+
+@app.route('/api/employees')
+def api_employees():
+    """Satu halaman pegawai terurut, memakai permutasi urut yang sudah dihitung"""
+    try:
+        index = get_dataset_index()
+        if index is None:
+            return jsonify({'success': True, 'total': 0, 'page': 1, 'per_page': 0, 'data': []})
+
+        column = request.args.get('sort', 'nama')
+        direction = request.args.get('direction', 'asc')
+        try:
+            page = max(int(request.args.get('page', 1)), 1)
+            per_page = min(max(int(request.args.get('per_page', 10)), 1), 1000)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'Parameter halaman tidak valid'})
+
+        mask = resolve_filter_mask(index, filter_spec_from_args(request.args))
+
+        try:
+            rows, total = index.sort.page(column, direction, mask, page, per_page)
+        except KeyError:
+            return jsonify({'success': False, 'message': f'Kolom tidak bisa diurutkan: {column}'})
+
+        return jsonify({
+            'success': True,
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'sort': column,
+            'direction': direction,
+            'data': [index.employees[row] for row in rows.tolist()]
+        })
+
+    except Exception as e:
+        print(f"Employees page error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
+
+@app.route('/api/filter', methods=['GET', 'POST'])
+def api_filter():
+    """Id pegawai yang lolos kombinasi filter tempat/kelompok/status/struktur/shift"""
+    try:
+        index = get_dataset_index()
+        if index is None:
+            return jsonify({'success': True, 'count': 0, 'ids': []})
+
+        if request.method == 'POST':
+            spec = request.json or {}
+        else:
+            spec = filter_spec_from_args(request.args)
+
+        mask = resolve_filter_mask(index, spec)
+        rows = np.flatnonzero(mask)
+
+        return jsonify({
+            'success': True,
+            'count': int(len(rows)),
+            'ids': [index.ids[row] for row in rows.tolist()]
+        })
+
+    except Exception as e:
+        print(f"Filter error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
+
+@app.route('/api/facets')
+def api_facets():
+    """Pilihan filter beserta jumlah pegawai (tanpa perlu mengunduh roster)"""
+    try:
+        index = get_dataset_index()
+        if index is None:
+            return jsonify({'success': True, 'total': 0, 'facets': {column: [] for column in FILTER_COLUMNS}})
+
+        spec = filter_spec_from_args(request.args)
+        is_conditioned = any(spec.get(column) for column in FILTER_COLUMNS) or spec.get('q', '').strip()
+
+        if is_conditioned:
+            facets = build_facets(index, spec)
+            total = int(resolve_filter_mask(index, spec).sum())
+        else:
+            facets = index.facets
+            total = len(index)
+
+        return jsonify({'success': True, 'total': total, 'facets': facets})
+
+    except Exception as e:
+        print(f"Facets error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
+
+@app.route('/api/sort-order')
+def api_sort_order():
+    """Urutan id pegawai untuk satu kolom (dipakai sortTable di dashboard)"""
+    try:
+        index = get_dataset_index()
+        if index is None:
+            return jsonify({'success': True, 'ids': []})
+
+        column = request.args.get('column', 'nama')
+        direction = request.args.get('direction', 'asc')
+        try:
+            order = index.sort.order(column, direction)
+        except KeyError:
+            return jsonify({'success': False, 'message': f'Kolom tidak bisa diurutkan: {column}'})
+
+        return jsonify({
+            'success': True,
+            'column': column,
+            'direction': direction,
+            'ids': [index.ids[row] for row in order.tolist()]
+        })
+
+    except Exception as e:
+        print(f"Sort order error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
+
+@app.route('/api/ping')
+def ping():
+    try:
+        from sqlalchemy import text
+        db.session.execute(text('SELECT 1'))
+        return jsonify({"status": "ok", "message": "Database is awake!"})
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/upload', methods=['POST'])
+def upload_file():
+    try:
+        if 'file' not in request.files:
+            return jsonify({'success': False, 'message': 'Tidak ada file yang diupload'})
         
-        # ANALISIS KEHADIRAN
-        analysis_title = ParagraphStyle(
-            'AnalysisTitle',
-            parent=styles['Heading3'],
-            fontSize=9,
-            textColor=colors.HexColor('#1565c0'),
-            spaceAfter=4,
-            fontName='Helvetica-Bold'
-        )
+        file = request.files['file']
         
-        story.append(Paragraph("", analysis_title))
+        if file.filename == '':
+            return jsonify({'success': False, 'message': 'Nama file kosong'})
         
-        # Gunakan perhitungan target yang benar
-        percentage_target = 50 if shift_status == 'shift' else 70
+        if not allowed_file(file.filename):
+            return jsonify({'success': False, 'message': 'Format file tidak didukung'})
         
-        analysis_data = [
-            ['KETERANGAN', 'NILAI'],
-            ['Total Kegiatan Senam (2 Tahun)', '80 kali'],
-            [f'Target Kehadiran ({percentage_target}%)', f'{target_attendance} kali'],
-            ['Total Kehadiran Aktual', f'{total_attendance} kali'],
-            ['Persentase Kehadiran', f'{(total_attendance/target_attendance*100) if target_attendance > 0 else 0:.1f}%'],
-            ['Selisih dari Target', f'{total_attendance - target_attendance:+d} kali']
-        ]
+        file.seek(0, 2)
+        file_size = file.tell()
+        file.seek(0)
+        if file_size > 10 * 1024 * 1024:
+            return jsonify({'success': False, 'message': 'Ukuran file terlalu besar'})
         
-        # Lebar: 9+5 = 14cm (muat A4)
-        analysis_table = Table(analysis_data, colWidths=[9*cm, 5*cm])
-        analysis_table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#e3f2fd')),
-            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0,0), (-1,-1), 7),  # Font kecil
-            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-            ('ALIGN', (1,0), (1,-1), 'CENTER'),
-            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-            ('GRID', (0,0), (-1,-1), 0.3, colors.grey),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 3),
-            ('TOPPADDING', (0,0), (-1,-1), 3),
-            ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.white, colors.HexColor('#fafafa')]),
-        ]))
+        temp_dir = tempfile.mkdtemp()
+        temp_path = os.path.join(temp_dir, secure_filename(file.filename))
+        file.save(temp_path)
         
-        story.append(analysis_table)
-        story.append(Spacer(1, 0.2*cm))
+        clear_temp_data()
         
-        # KESIMPULAN
-        if status_tercapai:
-            conclusion_text = f"""
-            <b>✓ KESIMPULAN: TELAH MENCUKUPI TARGET</b><br/>
-            Pegawai <b>TELAH MEMENUHI</b> target kehadiran senam.<br/>
-            Total kehadiran: <b>{total_attendance} kali</b> dari target <b>{target_attendance} kali</b><br/>
-            Persentase pencapaian: <b>{(total_attendance/target_attendance*100) if target_attendance > 0 else 0:.1f}%</b> dari target {percentage_target}%
-            """
-            conclusion_color = colors.HexColor('#2e7d32')
-            bg_color = colors.HexColor('#e8f5e9')
-        else:
-            shortfall = target_attendance - total_attendance
-            conclusion_text = f"""
-            <b>✗ KESIMPULAN: BELUM MENCUKUPI TARGET</b><br/>
-            Pegawai <b>BELUM MEMENUHI</b> target kehadiran senam.<br/>
-            Kurang <b>{shortfall} kali</b> dari target <b>{target_attendance} kali</b><br/>
-            Persentase pencapaian: <b>{(total_attendance/target_attendance*100) if target_attendance > 0 else 0:.1f}%</b> dari target {percentage_target}%
-            """
-            conclusion_color = colors.HexColor('#c62828')
-            bg_color = colors.HexColor('#ffebee')
-        
-        conclusion_style = ParagraphStyle(
-            'Conclusion',
-            parent=styles['Normal'],
-            fontSize=7.5,  # Font kecil
-            textColor=conclusion_color,
-            spaceBefore=3,
-            spaceAfter=5,
-            fontName='Helvetica-Bold',
-            leftIndent=6,
-            rightIndent=6
-        )
+        data = excel_to_json(temp_path)
         
-        conclusion_para = Paragraph(conclusion_text, conclusion_style)
-        # Lebar: 14cm (muat A4)
-        conclusion_table = Table([[conclusion_para]], colWidths=[14*cm])
-        conclusion_table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,-1), bg_color),
-            ('BOX', (0,0), (-1,-1), 1.5, conclusion_color),
-            ('LEFTPADDING', (0,0), (-1,-1), 6),
-            ('RIGHTPADDING', (0,0), (-1,-1), 6),
-            ('TOPPADDING', (0,0), (-1,-1), 5),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 5),
-        ]))
+        if data is None:
+            shutil.rmtree(temp_dir)
+            return jsonify({'success': False, 'message': 'Gagal memproses file'})
         
-        story.append(conclusion_table)
-        story.append(Spacer(1, 0.25*cm))
+        if not data:
+            shutil.rmtree(temp_dir)
+            return jsonify({'success': False, 'message': 'Tidak ada data'})
         
-        # TANDA TANGAN - TANPA GARIS
-        signature_data = [
-            ['', ''],
-            ['KABAG SDM', 'KASUBAG KEPEGAWAIAN'],
-            ['', ''],
-            ['', ''],
-            ['', ''],
-            ['Dewi Nashrulloh, SKM.M.Kes', 'Rahmawati, SH'],
-            ['NIK: 011205226', 'NIK: 022708322']
-        ]
+        success, error_msg = save_temp_data(data)
         
-        # Lebar: 7+7 = 14cm
-        signature_table = Table(signature_data, colWidths=[7*cm, 7*cm])
-        signature_table.setStyle(TableStyle([
-            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+        if success:
+            shutil.rmtree(temp_dir)
+            start_export_warming()
+            return jsonify({
+                'success': True,
+                'message': f'Data berhasil diupload! {len(data)} pegawai diproses.',
+                'count': len(data),
+                'years': list(data[0]['tahunan'].keys()) if data else []
+            })
+        else:
+            shutil.rmtree(temp_dir)
+            
+            # Format pesan error agar ramah pengguna
+            if "password authentication failed" in error_msg:
+                error_pesan = "Koneksi Database Ditolak: Password database salah. Tolong periksa ulang Environment Variable DATABASE_URL di Vercel."
+            elif "does not exist" in error_msg:
+                error_pesan = "Tabel database belum siap. Coba refresh Vercel (Redeploy)."
+            elif "server closed the connection" in error_msg:
+                error_pesan = "Koneksi ke Database terputus. Pastikan link DATABASE_URL benar dan database sedang aktif."
+            else:
+                error_pesan = f"Gagal menyimpan ke database: {error_msg}"
+                
+            return jsonify({'success': False, 'message': error_pesan})
+            
+    except Exception as e:
+        print(f"Upload error: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
+
+def employee_report_pdf(employee_data, bulanan_data, date_range, shift_status='non_shift', selected_year='2024'):
+    """PDF laporan individu 1 halaman A4 portrait (isi file). Dipakai export
+    per pegawai dan export massal (dijalankan di process pool)."""
+    # Sort data bulanan
+    sorted_months = sorted(bulanan_data.items(), key=lambda x: x[0])
+    
+    # Hitung analisis
+    total_attendance = sum(month_data.get('value', 0) for _, month_data in sorted_months)
+    months_count = len(sorted_months)
+    
+    # Target dari mesin target: rentang tanggal, atau 24 bulan terakhir
+    # (NON-SHIFT 56 / SHIFT 40 kali untuk 24 bulan)
+    shift_status = 'shift' if shift_status == 'shift' else 'non_shift'
+    compliance = Compliance([total_attendance], period_months(date_range), [shift_status == 'shift'])
+    target_attendance = int(compliance.own_target[0])
+    percentage_target = TARGET_PERSEN[shift_status]  # Untuk tampilan di PDF
+    
+    status_tercapai = bool(compliance.own_passed[0])
+    
+    # CREATE PDF - A4 PORTRAIT
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,  # A4 Portrait
+        rightMargin=1.2*cm,
+        leftMargin=1.2*cm,
+        topMargin=0.8*cm,
+        bottomMargin=0.8*cm
+    )
+    
+    story = []
+    styles = PDF_SAMPLE_STYLES
+    
+    # CUSTOM STYLES - Disesuaikan untuk A4
+    title_style = ParagraphStyle(
+        'TitleStyle',
+        parent=styles['Heading1'],
+        fontSize=11,  # Dikurangi dari 12
+        alignment=TA_CENTER,
+        spaceAfter=3,
+        textColor=colors.HexColor('#1a237e'),
+        fontName='Helvetica-Bold'
+    )
+    
+    subtitle_style = ParagraphStyle(
+        'SubtitleStyle',
+        parent=styles['Heading2'],
+        fontSize=9,  # Dikurangi dari 10
+        alignment=TA_CENTER,
+        spaceAfter=6,
+        textColor=colors.HexColor('#283593'),
+        fontName='Helvetica-Bold'
+    )
+    
+    # HEADER
+    story.append(pdf_letterhead("REKAP ABSENSI SENAM PEGAWAI", title_style, subtitle_style))
+    story.append(Spacer(1, 0.1*cm))
+    
+    # Hitung tahun yang BENAR dari data bulanan
+    if sorted_months:
+        years = [month_key.split('-')[0] for month_key, _ in sorted_months]
+        min_year = min(years)
+        max_year = max(years)
+    
+        if min_year == max_year:
+            period_text = min_year
+        else:
+            period_text = f"{min_year}-{max_year}"
+    else:
+        period_text = selected_year
+    
+    # INFO PEGAWAI - 2 KOLOM (Lebar disesuaikan A4)
+    info_data = [
+        ['NAMA', ':', employee_data.get('nama', '-'), 'JABATAN', ':', employee_data.get('jabatan', '-')],
+        ['NIK', ':', employee_data.get('nik', '-'), 'TEMPAT TUGAS', ':', employee_data.get('tempat', '-')],
+        ['STATUS SHIFT', ':', 'SHIFT' if shift_status == 'shift' else 'NON-SHIFT', 'TAHUN', ':', period_text]
+    ]
+    
+    if date_range.get('start') and date_range.get('end'):
+        info_data.append(['PERIODE', ':', f"{date_range['start']} s/d {date_range['end']}", '', '', ''])
+    
+    # Lebar total: 2.2+0.3+4.5+2.2+0.3+4.5 = 14cm (muat A4)
+    info_table = Table(info_data, colWidths=[2.2*cm, 0.3*cm, 4.5*cm, 2.2*cm, 0.3*cm, 4.5*cm])
+    info_table.setStyle(TableStyle([
+        ('FONTNAME', (0,0), (0,-1), 'Helvetica-Bold'),
+        ('FONTNAME', (3,0), (3,-1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0,0), (-1,-1), 6.5),  # Font dikecilkan
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+        ('BOTTOMPADDING', (0,0), (-1,-1), 2),
+        ('TOPPADDING', (0,0), (-1,-1), 2),
+    ]))
+    
+    story.append(info_table)
+    story.append(Spacer(1, 0.25*cm))
+    
+    # TABEL KEHADIRAN - TETAP 3 KOLOM dengan STATUS (Lebar disesuaikan)
+    if len(sorted_months) > 0:
+        rows_per_col = math.ceil(len(sorted_months) / 3)
+    
+        table_data = []
+        for row_idx in range(rows_per_col):
+            row = []
+            for col_idx in range(3):
+                month_idx = col_idx * rows_per_col + row_idx
+                if month_idx < len(sorted_months):
+                    month_key, month_data = sorted_months[month_idx]
+                    # Singkat nama bulan: Jan 2024, Feb 2024, dll
+                    month_name = month_data.get('nama', '')[:3] + ' ' + month_key.split('-')[0]
+                    value = month_data.get('value', 0)
+                    status = month_data.get('status', 'Tidak Hadir')
+    
+                    row.extend([month_name, str(value), status])
+                else:
+                    row.extend(['', '', ''])
+            table_data.append(row)
+    
+        # Header
+        header = ['BULAN', 'HADIR', 'KETERANGAN'] * 3
+        table_data.insert(0, header)
+    
+        # Lebar disesuaikan A4: (2.5+0.8+2) * 3 = 15.9cm (muat!)
+        col_widths = [2.5*cm, 0.8*cm, 2*cm] * 3
+    
+        attendance_table = Table(table_data, colWidths=col_widths, repeatRows=1)
+        attendance_table.setStyle(TableStyle([
+            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#1976d2')),
+            ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0,0), (-1,0), 6),  # Font header kecil
+            ('ALIGN', (0,0), (-1,0), 'CENTER'),
+            ('FONTSIZE', (0,1), (-1,-1), 5.5),  # Font isi kecil
+            ('ALIGN', (0,1), (-1,-1), 'LEFT'),
+            ('ALIGN', (1,1), (1,-1), 'CENTER'),
+            ('ALIGN', (4,1), (4,-1), 'CENTER'),
+            ('ALIGN', (7,1), (7,-1), 'CENTER'),
             ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-            ('FONTSIZE', (0,0), (-1,-1), 7),  # Font kecil
-            ('FONTSIZE', (0,1), (-1,1), 7),
-            ('FONTNAME', (0,1), (-1,1), 'Helvetica-Bold'),
-            ('TOPPADDING', (0,1), (-1,1), 0),
-            ('TOPPADDING', (0,5), (-1,6), 3),
+            ('GRID', (0,0), (-1,-1), 0.3, colors.grey),
+            ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.white, colors.HexColor('#f5f5f5')]),
+            ('BOTTOMPADDING', (0,0), (-1,-1), 1.5),
+            ('TOPPADDING', (0,0), (-1,-1), 1.5),
         ]))
+    
+        story.append(attendance_table)
+        story.append(Spacer(1, 0.2*cm))
+    
+    # ANALISIS KEHADIRAN
+    analysis_title = ParagraphStyle(
+        'AnalysisTitle',
+        parent=styles['Heading3'],
+        fontSize=9,
+        textColor=colors.HexColor('#1565c0'),
+        spaceAfter=4,
+        fontName='Helvetica-Bold'
+    )
+    
+    story.append(Paragraph("", analysis_title))
+    
+    # Total kegiatan periode (24 bulan = 80 kali)
+    period_text_kegiatan = '2 Tahun' if compliance.num_months == DEFAULT_REPORT_MONTHS else f'{compliance.num_months} Bulan'
+    total_kegiatan_text = f'{compliance.total_kegiatan:.1f}'.removesuffix('.0')
+    analysis_data = [
+        ['KETERANGAN', 'NILAI'],
+        [f'Total Kegiatan Senam ({period_text_kegiatan})', f'{total_kegiatan_text} kali'],
+        [f'Target Kehadiran ({percentage_target}%)', f'{target_attendance} kali'],
+        ['Total Kehadiran Aktual', f'{total_attendance} kali'],
+        ['Persentase Kehadiran', f'{(total_attendance/target_attendance*100) if target_attendance > 0 else 0:.1f}%'],
+        ['Selisih dari Target', f'{total_attendance - target_attendance:+d} kali']
+    ]
+    
+    # Lebar: 9+5 = 14cm (muat A4)
+    analysis_table = Table(analysis_data, colWidths=[9*cm, 5*cm])
+    analysis_table.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#e3f2fd')),
+        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0,0), (-1,-1), 7),  # Font kecil
+        ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+        ('ALIGN', (1,0), (1,-1), 'CENTER'),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+        ('GRID', (0,0), (-1,-1), 0.3, colors.grey),
+        ('BOTTOMPADDING', (0,0), (-1,-1), 3),
+        ('TOPPADDING', (0,0), (-1,-1), 3),
+        ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.white, colors.HexColor('#fafafa')]),
+    ]))
+    
+    story.append(analysis_table)
+    story.append(Spacer(1, 0.2*cm))
+    
+    # KESIMPULAN
+    if status_tercapai:
+        conclusion_text = f"""
+        <b>✓ KESIMPULAN: TELAH MENCUKUPI TARGET</b><br/>
+        Pegawai <b>TELAH MEMENUHI</b> target kehadiran senam.<br/>
+        Total kehadiran: <b>{total_attendance} kali</b> dari target <b>{target_attendance} kali</b><br/>
+        Persentase pencapaian: <b>{(total_attendance/target_attendance*100) if target_attendance > 0 else 0:.1f}%</b> dari target {percentage_target}%
+        """
+        conclusion_color = colors.HexColor('#2e7d32')
+        bg_color = colors.HexColor('#e8f5e9')
+    else:
+        shortfall = target_attendance - total_attendance
+        conclusion_text = f"""
+        <b>✗ KESIMPULAN: BELUM MENCUKUPI TARGET</b><br/>
+        Pegawai <b>BELUM MEMENUHI</b> target kehadiran senam.<br/>
+        Kurang <b>{shortfall} kali</b> dari target <b>{target_attendance} kali</b><br/>
+        Persentase pencapaian: <b>{(total_attendance/target_attendance*100) if target_attendance > 0 else 0:.1f}%</b> dari target {percentage_target}%
+        """
+        conclusion_color = colors.HexColor('#c62828')
+        bg_color = colors.HexColor('#ffebee')
+    
+    conclusion_style = ParagraphStyle(
+        'Conclusion',
+        parent=styles['Normal'],
+        fontSize=7.5,  # Font kecil
+        textColor=conclusion_color,
+        spaceBefore=3,
+        spaceAfter=5,
+        fontName='Helvetica-Bold',
+        leftIndent=6,
+        rightIndent=6
+    )
+    
+    conclusion_para = Paragraph(conclusion_text, conclusion_style)
+    # Lebar: 14cm (muat A4)
+    conclusion_table = Table([[conclusion_para]], colWidths=[14*cm])
+    conclusion_table.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,-1), bg_color),
+        ('BOX', (0,0), (-1,-1), 1.5, conclusion_color),
+        ('LEFTPADDING', (0,0), (-1,-1), 6),
+        ('RIGHTPADDING', (0,0), (-1,-1), 6),
+        ('TOPPADDING', (0,0), (-1,-1), 5),
+        ('BOTTOMPADDING', (0,0), (-1,-1), 5),
+    ]))
+    
+    story.append(conclusion_table)
+    story.append(Spacer(1, 0.25*cm))
+    
+    # TANDA TANGAN - TANPA GARIS
+    signature_data = [
+        ['', ''],
+        ['KABAG SDM', 'KASUBAG KEPEGAWAIAN'],
+        ['', ''],
+        ['', ''],
+        ['', ''],
+        ['Dewi Nashrulloh, SKM.M.Kes', 'Rahmawati, SH'],
+        ['NIK: 011205226', 'NIK: 022708322']
+    ]
+    
+    # Lebar: 7+7 = 14cm
+    signature_table = Table(signature_data, colWidths=[7*cm, 7*cm])
+    signature_table.setStyle(TableStyle([
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+        ('FONTSIZE', (0,0), (-1,-1), 7),  # Font kecil
+        ('FONTSIZE', (0,1), (-1,1), 7),
+        ('FONTNAME', (0,1), (-1,1), 'Helvetica-Bold'),
+        ('TOPPADDING', (0,1), (-1,1), 0),
+        ('TOPPADDING', (0,5), (-1,6), 3),
+    ]))
+    
+    story.append(FormBlock(f'ttd:{signature_data!r}', [signature_table]))
+    
+    # FOOTER
+    footer_style = ParagraphStyle(
+        'Footer',
+        parent=styles['Normal'],
+        fontSize=6,
+        alignment=TA_RIGHT,
+        textColor=colors.grey
+    )
+    
+    story.append(Spacer(1, 0.15*cm))
+    story.append(Paragraph(
+        f"Dicetak pada: {datetime.now().strftime('%d %B %Y %H:%M:%S')}",
+        footer_style
+    ))
+    
+    # BUILD PDF
+    doc.build(story)
+    return buffer.getvalue()
+
+
+@app.route('/api/export-pdf', methods=['POST'])
+@cached_export
+def export_pdf():
+    """Export PDF 1 HALAMAN A4 PORTRAIT - Format Lengkap"""
+    try:
+        data = request.json
+        employee_data = data.get('employee_data')
+        date_range = data.get('date_range', {})
+        shift_status = data.get('shift_status', 'non_shift')
+        bulanan_data = data.get('bulanan_data', {})
+        selected_year = data.get('selected_year', '2024')
         
-        story.append(signature_table)
-        
-        # FOOTER
-        footer_style = ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=6,
-            alignment=TA_RIGHT,
-            textColor=colors.grey
-        )
-        
-        story.append(Spacer(1, 0.15*cm))
-        story.append(Paragraph(
-            f"Dicetak pada: {datetime.now().strftime('%d %B %Y %H:%M:%S')}",
-            footer_style
-        ))
-        
-        # BUILD PDF
-        doc.build(story)
+        if not employee_data:
+            return jsonify({'success': False, 'message': 'Data tidak ditemukan'})
         
-        buffer.seek(0)
+        buffer = io.BytesIO(employee_report_pdf(employee_data, bulanan_data, date_range, shift_status, selected_year))
         
         filename = f"rekap_senam_{employee_data.get('nik', 'unknown')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
         
@@ -719,93 +3330,216 @@ def export_pdf():
         traceback.print_exc()
         return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
     
+# ============================================
+# EXPORT MASSAL LAPORAN INDIVIDU (ZIP, dirender di process pool)
+# ============================================
+
+class ZipStream(io.RawIOBase):
+    """Tujuan tulis zipfile yang tidak bisa di-seek: data yang sudah ditulis
+    diambil per potongan (pop) untuk langsung dikirim ke client"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+# Ukuran blok saat menyalin file ke dalam ZIP yang di-stream
+ZIP_STREAM_BLOCK = 256 * 1024
+
+
+def stream_zip_files(files):
+    """ZIP (tanpa kompresi) dari file yang sudah jadi [(nama, file)], dikirim
+    per blok; file sumber ditutup setelah disalin atau bila unduhan putus"""
+    stream = ZipStream()
+    try:
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for name, source in files:
+                with archive.open(name, 'w') as member:
+                    for block in iter(functools.partial(source.read, ZIP_STREAM_BLOCK), b''):
+                        member.write(block)
+                        yield stream.pop()
+                source.close()
+        yield stream.pop()
+    finally:
+        for _, source in files:
+            source.close()
+
+
+def employee_bulanan_export(emp, date_range):
+    """Data bulanan laporan individu, sama seperti exportEmployeePDF di
+    dashboard: bulan dalam rentang tanggal bila filter aktif, selain itu
+    24 bulan terakhir"""
+    active = date_range.get('active') and date_range.get('start') and date_range.get('end')
+    months = []
+    for year_data in (emp.get('bulanan') or {}).values():
+        for month_key, month_data in year_data.items():
+            if active and not (date_range['start'] <= month_key <= date_range['end']):
+                continue
+            months.append((month_key, month_data))
+    months.sort(key=lambda item: item[0])
+    if not active:
+        months = months[-24:]
+    return dict(months)
+
+
+def employee_report_filename(emp, idx, used):
+    """Nama file PDF per pegawai di dalam ZIP (unik)"""
+    base = secure_filename(f"rekap_senam_{emp.get('nik', '')}_{emp.get('nama', '')}") or f'rekap_senam_{idx}'
+    name, number = f'{base}.pdf', 2
+    while name in used:
+        name = f'{base}_{number}.pdf'
+        number += 1
+    used.add(name)
+    return name
+
+
+def stream_employee_pdfs(tasks):
+    """Render laporan individu dan kirim ZIP sedikit demi sedikit; setiap PDF
+    masuk ZIP begitu selesai (urutan selesai, bukan urutan pegawai)"""
+    stream = ZipStream()
+    archive = zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_STORED)
+    futures = {}
+
+    def completed():
+        if PDF_WORKERS > 1 and len(tasks) > 1:
+            # Hanya 2 x PDF_WORKERS PDF yang antre/selesai sekaligus; PDF dilepas
+            # dari memori begitu masuk ZIP, tugas berikutnya baru dikirim
+            pool = get_pdf_pool()
+            pending = iter(tasks)
+
+            def submit_next():
+                task = next(pending, None)
+                if task is not None:
+                    name, args = task
+                    futures[pool.submit(employee_report_pdf, *args)] = name
+
+            for _ in range(2 * PDF_WORKERS):
+                submit_next()
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = futures.pop(future)
+                    error = future.exception()
+                    yield name, None if error else future.result(), error
+                    submit_next()
+        else:
+            for name, args in tasks:
+                try:
+                    yield name, employee_report_pdf(*args), None
+                except Exception as e:
+                    yield name, None, e
+
+    failed = []
+    try:
+        for name, content, error in completed():
+            if error is None:
+                archive.writestr(name, content)
+            else:
+                print(f"Bulk PDF error ({name}): {str(error)}")
+                failed.append(f'{name}: {error}')
+            yield stream.pop()
+
+        # PDF yang gagal dicatat di dalam ZIP (header respons sudah terkirim)
+        if failed:
+            archive.writestr('GAGAL.txt', '\n'.join(failed))
+        archive.close()
+        yield stream.pop()
+        print(f"DEBUG: ZIP laporan individu selesai: {len(tasks) - len(failed)} PDF, {len(failed)} gagal")
+    finally:
+        # Client memutus unduhan: batalkan PDF yang belum mulai dirender
+        for future in futures:
+            future.cancel()
+
+
+@app.route('/api/export-employee-pdfs', methods=['POST'])
+def export_employee_pdfs():
+    """Export massal laporan individu: satu PDF per pegawai dalam satu ZIP"""
+    try:
+        data = request.json or {}
+        employees, error = resolve_export_employees(data)
+        date_range = data.get('date_range') or {}
+        shift_status = data.get('shift_status')
+        selected_year = data.get('selected_year', str(datetime.now().year))
+        
+        if error:
+            return jsonify({'success': False, 'message': error})
+        if not employees:
+            return jsonify({'success': False, 'message': 'Tidak ada data pegawai'})
+        
+        # Rentang tanggal yang dicetak di laporan (sama dengan export per pegawai)
+        report_range = date_range if date_range.get('active') else {'start': None, 'end': None}
+        
+        used = set()
+        tasks = [
+            (employee_report_filename(emp, idx, used), (
+                emp,
+                employee_bulanan_export(emp, date_range),
+                report_range,
+                shift_status or emp.get('shift_status', 'non_shift'),
+                selected_year
+            ))
+            for idx, emp in enumerate(employees, 1)
+        ]
+        print(f"DEBUG: Export massal laporan individu: {len(tasks)} pegawai")
+        
+        filename = f"laporan_individu_{len(tasks)}_pegawai_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+        
+        return stream_download(stream_employee_pdfs(tasks), filename, 'application/zip')
+        
+    except Exception as e:
+        print(f"Bulk PDF Export error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
+    
 @app.route('/api/export-no-attendance-excel', methods=['POST'])
+@cached_export
 def export_no_attendance_excel():
-    """Export Excel untuk pegawai yang tidak ikut senam sama sekali"""
+    """Export Excel untuk pegawai yang tidak ikut senam sama sekali.
+    format: 'xlsx' (default), 'csv' atau 'parquet'"""
     try:
         data = request.json
-        employees = data.get('employees', [])
+        employees, error = resolve_export_employees(data)
         date_range = data.get('date_range', {})
         struktur_lini = data.get('struktur_lini', 'Semua')
+        output_format = data.get('format', 'xlsx')
         
+        if error:
+            return jsonify({'success': False, 'message': error})
+        format_error = table_export_format_error(output_format)
+        if format_error:
+            return jsonify({'success': False, 'message': format_error})
         if not employees:
             return jsonify({'success': False, 'message': 'Tidak ada data pegawai'})
         
-        # Ambil bulan dari rentang waktu
-        months_list = []
-        if date_range.get('start') and date_range.get('end'):
-            start_year, start_month = map(int, date_range['start'].split('-'))
-            end_year, end_month = map(int, date_range['end'].split('-'))
-            
-            current_year = start_year
-            current_month = start_month
-            
-            while (current_year < end_year) or (current_year == end_year and current_month <= end_month):
-                month_key = f"{current_year}-{str(current_month).zfill(2)}"
-                months_list.append(month_key)
-                
-                current_month += 1
-                if current_month > 12:
-                    current_month = 1
-                    current_year += 1
+        table = build_report_table(employees, months_in_range(date_range))
         
         # Buat data untuk Excel
-        rows = []
-        for emp in employees:
-            row = {
-                'NAMA': emp.get('nama', '-'),
-                'NIK': emp.get('nik', '-'),
-                'JABATAN': emp.get('jabatan', '-'),
-                'STRUKTUR_LINI': emp.get('struktur', '-'),
-                'TEMPAT_TUGAS': emp.get('tempat', '-'),
-            }
-            
-            employee_total = 0
-            for month_key in months_list:
-                year, month = month_key.split('-')
-                value = 0
-                
-                if year in emp.get('bulanan', {}):
-                    month_data = emp['bulanan'][year].get(month_key, {})
-                    value = month_data.get('value', 0)
-                
-                row[month_key] = value
-                employee_total += value
-            
-            row['TOTAL'] = employee_total
-            row['STATUS'] = 'TIDAK IKUT SENAM' if employee_total == 0 else f'RENDAH ({employee_total}x)'
-            rows.append(row)
-        
-        df = pd.DataFrame(rows)
-        
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Pegawai Tidak Ikut Senam')
-            
-            worksheet = writer.sheets['Pegawai Tidak Ikut Senam']
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 30)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-        
-        output.seek(0)
+        df = table.report_frame(['NAMA', 'NIK', 'JABATAN', 'STRUKTUR_LINI', 'TEMPAT_TUGAS'])
+        df['STATUS'] = np.where(
+            table.totals == 0,
+            'TIDAK IKUT SENAM',
+            'RENDAH (' + df['TOTAL'].astype(str) + 'x)'
+        )
         
         struktur_safe = struktur_lini.replace(' ', '_').replace('/', '-')
-        filename = f"pegawai_tidak_ikut_senam_{struktur_safe}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        
-        return send_file(
-            output,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        basename = f"pegawai_tidak_ikut_senam_{struktur_safe}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        return table_export_response(df, basename, output_format, 'Pegawai Tidak Ikut Senam')
         
     except Exception as e:
         print(f"No Attendance Excel Export error: {str(e)}")
@@ -813,24 +3547,27 @@ def export_no_attendance_excel():
 
 
 @app.route('/api/export-no-attendance-pdf', methods=['POST'])
+@cached_export
 def export_no_attendance_pdf():
     """Export PDF untuk pegawai yang tidak ikut senam sama sekali"""
     try:
         data = request.json
-        employees = data.get('employees', [])
+        employees, error = resolve_export_employees(data)
         date_range = data.get('date_range', {})
         shift_filter = data.get('shift_filter', 'all')
         struktur_lini = data.get('struktur_lini', 'Semua')
+        renderer = data.get('renderer', 'platypus')
         
+        if error:
+            return jsonify({'success': False, 'message': error})
+        if renderer not in PDF_RENDERERS:
+            return jsonify({'success': False, 'message': f'Renderer PDF tidak dikenal: {renderer}'})
         if not employees:
             return jsonify({'success': False, 'message': 'Tidak ada data pegawai'})
         
         if not date_range.get('start') or not date_range.get('end'):
             return jsonify({'success': False, 'message': 'Rentang waktu belum ditentukan'})
         
-        import copy
-        employees = copy.deepcopy(employees)
-        
         # Filter berdasarkan shift status jika bukan "all"
         if shift_filter != 'all':
             filtered_employees = []
@@ -859,7 +3596,7 @@ def export_no_attendance_pdf():
         )
         
         story = []
-        styles = getSampleStyleSheet()
+        styles = PDF_SAMPLE_STYLES
         
         title_style = ParagraphStyle(
             'TitleStyle',
@@ -882,8 +3619,7 @@ def export_no_attendance_pdf():
         )
         
         # HEADER
-        story.append(Paragraph("RUMAH SAKIT ISLAM SITI KHADIJAH PALEMBANG", title_style))
-        story.append(Paragraph("DAFTAR PEGAWAI YANG TIDAK IKUT SENAM", subtitle_style))
+        story.append(pdf_letterhead("DAFTAR PEGAWAI YANG TIDAK IKUT SENAM", title_style, subtitle_style))
         story.append(Spacer(1, 0.2*cm))
         
         shift_text_map = {
@@ -913,67 +3649,10 @@ def export_no_attendance_pdf():
         story.append(Spacer(1, 0.3*cm))
         
         # TABEL DATA PEGAWAI
+        report = build_report_table(employees, months_in_range(date_range))
         header = ['NO', 'NAMA', 'NIK', 'JABATAN', 'TEMPAT TUGAS', 'TOTAL', 'STATUS']
         table_data = [header]
         
-        for idx, emp in enumerate(employees, 1):
-            try:
-                if not isinstance(emp, dict):
-                    continue
-                
-                nama = emp.get('nama', f'Pegawai {idx}')
-                nik = emp.get('nik', '-')
-                jabatan = emp.get('jabatan', '-')
-                tempat = emp.get('tempat', '-')
-                
-                nama_para = Paragraph(str(nama), ParagraphStyle(
-                    'NamaStyle',
-                    fontSize=6,
-                    leading=7,
-                    wordWrap='CJK'
-                ))
-                
-                nik_para = Paragraph(str(nik), ParagraphStyle(
-                    'NikStyle',
-                    fontSize=6,
-                    leading=7,
-                    wordWrap='CJK'
-                ))
-                
-                jabatan_para = Paragraph(str(jabatan), ParagraphStyle(
-                    'JabatanStyle',
-                    fontSize=6,
-                    leading=7,
-                    wordWrap='CJK'
-                ))
-                
-                tempat_para = Paragraph(str(tempat), ParagraphStyle(
-                    'TempatStyle',
-                    fontSize=6,
-                    leading=7,
-                    wordWrap='CJK'
-                ))
-                
-                row = [
-                    str(idx),
-                    nama_para,
-                    nik_para,
-                    jabatan_para,
-                    tempat_para,
-                    '0',
-                    Paragraph('<font color="#c62828"><b>TIDAK SENAM</b></font>', ParagraphStyle(
-                        'StatusBad',
-                        fontSize=6,
-                        alignment=TA_CENTER
-                    ))
-                ]
-                
-                table_data.append(row)
-                
-            except Exception as e:
-                print(f"ERROR processing employee {idx}: {str(e)}")
-                continue
-        
         col_widths = [
             0.5*cm,   # NO
             3*cm,     # NAMA
@@ -984,35 +3663,8 @@ def export_no_attendance_pdf():
             2*cm      # STATUS
         ]
         
-        data_table = Table(table_data, colWidths=col_widths, repeatRows=1)
-        data_table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#c62828')),
-            ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0,0), (-1,0), 6),
-            ('ALIGN', (0,0), (-1,0), 'CENTER'),
-            ('VALIGN', (0,0), (-1,0), 'MIDDLE'),
-            ('FONTSIZE', (0,1), (-1,-1), 6),
-            ('ALIGN', (0,1), (0,-1), 'CENTER'),
-            ('ALIGN', (5,1), (-1,-1), 'CENTER'),
-            ('VALIGN', (0,1), (-1,-1), 'MIDDLE'),
-            ('GRID', (0,0), (-1,-1), 0.3, colors.grey),
-            ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.white, colors.HexColor('#ffebee')]),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 3),
-            ('TOPPADDING', (0,0), (-1,-1), 3),
-            ('LEFTPADDING', (0,0), (-1,-1), 2),
-            ('RIGHTPADDING', (0,0), (-1,-1), 2),
-        ]))
-        
-        story.append(data_table)
-        story.append(Spacer(1, 0.4*cm))
-        
         # ANALISIS
-        num_months = 0
-        if date_range.get('start') and date_range.get('end'):
-            start_year, start_month = map(int, date_range['start'].split('-'))
-            end_year, end_month = map(int, date_range['end'].split('-'))
-            num_months = (end_year - start_year) * 12 + (end_month - start_month) + 1
+        num_months = len(report.months)
         
         analysis_data = [
             ['KETERANGAN', 'NILAI'],
@@ -1021,23 +3673,6 @@ def export_no_attendance_pdf():
             ['Status', 'TIDAK PERNAH IKUT SENAM'],
         ]
         
-        analysis_table = Table(analysis_data, colWidths=[10*cm, 5*cm])
-        analysis_table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#ffebee')),
-            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0,0), (-1,-1), 7),
-            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-            ('ALIGN', (1,0), (1,-1), 'CENTER'),
-            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-            ('GRID', (0,0), (-1,-1), 0.3, colors.grey),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 3),
-            ('TOPPADDING', (0,0), (-1,-1), 3),
-            ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.white, colors.HexColor('#fafafa')]),
-        ]))
-        
-        story.append(analysis_table)
-        story.append(Spacer(1, 0.25*cm))
-        
         # KETERANGAN
         keterangan_style = ParagraphStyle(
             'Keterangan',
@@ -1057,6 +3692,134 @@ def export_no_attendance_pdf():
         """
         
         keterangan_para = Paragraph(keterangan_text, keterangan_style)
+        
+        # TANDA TANGAN
+        signature_data = [
+            ['', ''],
+            ['KABAG SDM', 'KASUBAG KEPEGAWAIAN'],
+            ['', ''],
+            ['', ''],
+            ['Dewi Nashrulloh, SKM.M.Kes', 'Rahmawati, SH'],
+            ['NIK: 011205226', 'NIK: 022708322']
+        ]
+        
+        struktur_safe = struktur_lini.replace(' ', '_').replace('/', '-')
+        shift_safe = shift_filter.replace('_', '-')
+        filename = f"pegawai_tidak_ikut_senam_{struktur_safe}_{shift_safe}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        
+        # ===== RENDERER CANVAS: digambar langsung tanpa flowable platypus =====
+        if renderer == 'canvas':
+            status_cell = CanvasCell('TIDAK SENAM', colors.HexColor('#c62828'), True)
+            canvas_rows = [
+                [str(idx), emp.get('nama', f'Pegawai {idx}'), emp.get('nik', '-'), emp.get('jabatan', '-'), emp.get('tempat', '-'),
+                 emp_total, status_cell]
+                for idx, (emp, emp_total) in enumerate(zip(employees, report.totals.tolist()), 1)
+            ]
+            
+            pdf = CanvasReport(buffer)
+            pdf.letterhead("DAFTAR PEGAWAI YANG TIDAK IKUT SENAM", colors.HexColor('#c62828'), colors.HexColor('#d32f2f'))
+            pdf.info_table(info_data)
+            pdf.table(
+                canvas_rows, col_widths, 6, hpad=2, vpad=3,
+                align=['CENTER', 'LEFT', 'LEFT', 'LEFT', 'LEFT', 'CENTER', 'CENTER'],
+                header=header, header_align='CENTER', header_fill=colors.HexColor('#c62828'),
+                zebra=[colors.white, colors.HexColor('#ffebee')], wrap_columns=(1, 2, 3, 4)
+            )
+            pdf.space(0.4*cm)
+            pdf.table(
+                analysis_data[1:], [10*cm, 5*cm], 7, vpad=3, align=['LEFT', 'CENTER'],
+                header=analysis_data[0], header_fill=colors.HexColor('#ffebee'), header_color=colors.black,
+                zebra=[colors.white, colors.HexColor('#fafafa')]
+            )
+            pdf.space(0.25*cm)
+            pdf.paragraph_box(keterangan_para, 15*cm, colors.HexColor('#fff3cd'), colors.HexColor('#f9a825'), static=True)
+            pdf.space(0.4*cm)
+            pdf.signature(signature_data)
+            pdf.save()
+            buffer.seek(0)
+            
+            return send_file(
+                buffer,
+                as_attachment=True,
+                download_name=filename,
+                mimetype='application/pdf'
+            )
+        
+        # Style sel diambil dari registry; teks pendek tetap string polos
+        cell_style = pdf_cell_style(6)
+        # Lebar isi sel = lebar kolom - LEFTPADDING/RIGHTPADDING (2 + 2)
+        nama_width, nik_width, jabatan_width, tempat_width = (width - 4 for width in col_widths[1:5])
+        
+        for idx, (emp, emp_total) in enumerate(zip(employees, report.totals.tolist()), 1):
+            try:
+                nama = emp.get('nama', f'Pegawai {idx}')
+                nik = emp.get('nik', '-')
+                jabatan = emp.get('jabatan', '-')
+                tempat = emp.get('tempat', '-')
+                
+                row = [
+                    str(idx),
+                    pdf_text_cell(nama, nama_width, cell_style),
+                    pdf_text_cell(nik, nik_width, cell_style),
+                    pdf_text_cell(jabatan, jabatan_width, cell_style),
+                    pdf_text_cell(tempat, tempat_width, cell_style),
+                    str(emp_total),
+                    'TIDAK SENAM'
+                ]
+                
+                table_data.append(row)
+                
+            except Exception as e:
+                print(f"ERROR processing employee {idx}: {str(e)}")
+                continue
+        
+        # Satu tabel per halaman (header berulang), baris per halaman dihitung di muka
+        story.extend(paged_pdf_tables(
+            table_data[0], table_data[1:], col_widths,
+            [
+                ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#c62828')),
+                ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+                ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0,0), (-1,0), 6),
+                ('ALIGN', (0,0), (-1,0), 'CENTER'),
+                ('VALIGN', (0,0), (-1,0), 'MIDDLE'),
+                ('FONTSIZE', (0,1), (-1,-1), 6),
+                ('ALIGN', (0,1), (0,-1), 'CENTER'),
+                ('ALIGN', (5,1), (-1,-1), 'CENTER'),
+                ('VALIGN', (0,1), (-1,-1), 'MIDDLE'),
+                ('TEXTCOLOR', (6,1), (6,-1), colors.HexColor('#c62828')),
+                ('FONTNAME', (6,1), (6,-1), 'Helvetica-Bold'),
+                ('GRID', (0,0), (-1,-1), 0.3, colors.grey),
+                ('BOTTOMPADDING', (0,0), (-1,-1), 3),
+                ('TOPPADDING', (0,0), (-1,-1), 3),
+                ('LEFTPADDING', (0,0), (-1,-1), 2),
+                ('RIGHTPADDING', (0,0), (-1,-1), 2),
+            ],
+            first_height=pdf_frame_height(doc) - pdf_story_height(story, doc.width, doc.height),
+            page_height=pdf_frame_height(doc),
+            hpadding=2,
+            vpadding=3,
+            zebra=[colors.white, colors.HexColor('#ffebee')]
+        ))
+        story.append(Spacer(1, 0.4*cm))
+        
+        analysis_table = Table(analysis_data, colWidths=[10*cm, 5*cm])
+        analysis_table.setStyle(TableStyle([
+            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#ffebee')),
+            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0,0), (-1,-1), 7),
+            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
+            ('ALIGN', (1,0), (1,-1), 'CENTER'),
+            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+            ('GRID', (0,0), (-1,-1), 0.3, colors.grey),
+            ('BOTTOMPADDING', (0,0), (-1,-1), 3),
+            ('TOPPADDING', (0,0), (-1,-1), 3),
+            ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.white, colors.HexColor('#fafafa')]),
+        ]))
+        
+        story.append(analysis_table)
+        story.append(Spacer(1, 0.25*cm))
+        
         keterangan_table = Table([[keterangan_para]], colWidths=[15*cm])
         keterangan_table.setStyle(TableStyle([
             ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#fff3cd')),
@@ -1067,19 +3830,9 @@ def export_no_attendance_pdf():
             ('BOTTOMPADDING', (0,0), (-1,-1), 5),
         ]))
         
-        story.append(keterangan_table)
+        story.append(FormBlock(f'keterangan:{keterangan_text}', [keterangan_table]))
         story.append(Spacer(1, 0.4*cm))
         
-        # TANDA TANGAN
-        signature_data = [
-            ['', ''],
-            ['KABAG SDM', 'KASUBAG KEPEGAWAIAN'],
-            ['', ''],
-            ['', ''],
-            ['Dewi Nashrulloh, SKM.M.Kes', 'Rahmawati, SH'],
-            ['NIK: 011205226', 'NIK: 022708322']
-        ]
-        
         signature_table = Table(signature_data, colWidths=[7.5*cm, 7.5*cm])
         signature_table.setStyle(TableStyle([
             ('ALIGN', (0,0), (-1,-1), 'CENTER'),
@@ -1091,7 +3844,7 @@ def export_no_attendance_pdf():
             ('TOPPADDING', (0,4), (-1,5), 3),
         ]))
         
-        story.append(signature_table)
+        story.append(FormBlock(f'ttd:{signature_data!r}', [signature_table]))
         
         # FOOTER
         footer_style = ParagraphStyle(
@@ -1113,10 +3866,6 @@ def export_no_attendance_pdf():
         
         buffer.seek(0)
         
-        struktur_safe = struktur_lini.replace(' ', '_').replace('/', '-')
-        shift_safe = shift_filter.replace('_', '-')
-        filename = f"pegawai_tidak_ikut_senam_{struktur_safe}_{shift_safe}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        
         return send_file(
             buffer,
             as_attachment=True,
@@ -1131,65 +3880,33 @@ def export_no_attendance_pdf():
         return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
     
 @app.route('/api/export-attendance-excel', methods=['POST'])
+@cached_export
 def export_attendance_excel():
-    """Export Excel untuk pegawai yang IKUT senam"""
+    """Export Excel untuk pegawai yang IKUT senam.
+    format: 'xlsx' (default), 'csv' atau 'parquet'"""
     try:
         data = request.json
-        employees = data.get('employees', [])
+        employees, error = resolve_export_employees(data)
         date_range = data.get('date_range', {})
         struktur_lini = data.get('struktur_lini', 'Semua')
+        output_format = data.get('format', 'xlsx')
 
+        if error:
+            return jsonify({'success': False, 'message': error})
+        format_error = table_export_format_error(output_format)
+        if format_error:
+            return jsonify({'success': False, 'message': format_error})
         if not employees:
             return jsonify({'success': False, 'message': 'Tidak ada data pegawai'})
 
-        months_list = []
-        if date_range.get('start') and date_range.get('end'):
-            start_year, start_month = map(int, date_range['start'].split('-'))
-            end_year, end_month = map(int, date_range['end'].split('-'))
-            current_year, current_month = start_year, start_month
-            while (current_year < end_year) or (current_year == end_year and current_month <= end_month):
-                months_list.append(f"{current_year}-{str(current_month).zfill(2)}")
-                current_month += 1
-                if current_month > 12:
-                    current_month = 1
-                    current_year += 1
+        table = build_report_table(employees, months_in_range(date_range))
 
-        rows = []
-        for emp in employees:
-            row = {
-                'NAMA': emp.get('nama', '-'),
-                'NIK': emp.get('nik', '-'),
-                'JABATAN': emp.get('jabatan', '-'),
-                'STRUKTUR_LINI': emp.get('struktur', '-'),
-                'TEMPAT_TUGAS': emp.get('tempat', '-'),
-            }
-            employee_total = 0
-            for month_key in months_list:
-                year, month = month_key.split('-')
-                value = 0
-                if year in emp.get('bulanan', {}):
-                    month_data = emp['bulanan'][year].get(month_key, {})
-                    value = month_data.get('value', 0)
-                row[month_key] = value
-                employee_total += value
-            row['TOTAL'] = employee_total
-            row['STATUS'] = f'IKUT SENAM ({employee_total}x)'
-            rows.append(row)
+        df = table.report_frame(['NAMA', 'NIK', 'JABATAN', 'STRUKTUR_LINI', 'TEMPAT_TUGAS'])
+        df['STATUS'] = 'IKUT SENAM (' + df['TOTAL'].astype(str) + 'x)'
 
-        df = pd.DataFrame(rows)
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Pegawai Ikut Senam')
-            worksheet = writer.sheets['Pegawai Ikut Senam']
-            for column in worksheet.columns:
-                max_length = max((len(str(cell.value)) for cell in column if cell.value), default=0)
-                worksheet.column_dimensions[column[0].column_letter].width = min(max_length + 2, 30)
-
-        output.seek(0)
         struktur_safe = struktur_lini.replace(' ', '_').replace('/', '-')
-        filename = f"pegawai_ikut_senam_{struktur_safe}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        return send_file(output, as_attachment=True, download_name=filename,
-                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        basename = f"pegawai_ikut_senam_{struktur_safe}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        return table_export_response(df, basename, output_format, 'Pegawai Ikut Senam')
 
     except Exception as e:
         print(f"Attendance Excel Export error: {str(e)}")
@@ -1197,23 +3914,26 @@ def export_attendance_excel():
 
 
 @app.route('/api/export-attendance-pdf', methods=['POST'])
+@cached_export
 def export_attendance_pdf():
     """Export PDF untuk pegawai yang IKUT senam"""
     try:
         data = request.json
-        employees = data.get('employees', [])
+        employees, error = resolve_export_employees(data)
         date_range = data.get('date_range', {})
         shift_filter = data.get('shift_filter', 'all')
         struktur_lini = data.get('struktur_lini', 'Semua')
+        renderer = data.get('renderer', 'platypus')
 
+        if error:
+            return jsonify({'success': False, 'message': error})
+        if renderer not in PDF_RENDERERS:
+            return jsonify({'success': False, 'message': f'Renderer PDF tidak dikenal: {renderer}'})
         if not employees:
             return jsonify({'success': False, 'message': 'Tidak ada data pegawai'})
         if not date_range.get('start') or not date_range.get('end'):
             return jsonify({'success': False, 'message': 'Rentang waktu belum ditentukan'})
 
-        import copy
-        employees = copy.deepcopy(employees)
-
         if shift_filter != 'all':
             employees = [e for e in employees if isinstance(e, dict) and e.get('shift_status', 'non_shift') == shift_filter]
 
@@ -1225,7 +3945,7 @@ def export_attendance_pdf():
                                 rightMargin=1.2*cm, leftMargin=1.2*cm,
                                 topMargin=0.8*cm, bottomMargin=1.5*cm)
         story = []
-        styles = getSampleStyleSheet()
+        styles = PDF_SAMPLE_STYLES
 
         title_style = ParagraphStyle('TitleStyle', parent=styles['Heading1'],
                                      fontSize=11, alignment=TA_CENTER, spaceAfter=3,
@@ -1234,8 +3954,7 @@ def export_attendance_pdf():
                                         fontSize=9, alignment=TA_CENTER, spaceAfter=6,
                                         textColor=colors.HexColor('#2e7d32'), fontName='Helvetica-Bold')
 
-        story.append(Paragraph("RUMAH SAKIT ISLAM SITI KHADIJAH PALEMBANG", title_style))
-        story.append(Paragraph("DAFTAR PEGAWAI YANG IKUT SENAM", subtitle_style))
+        story.append(pdf_letterhead("DAFTAR PEGAWAI YANG IKUT SENAM", title_style, subtitle_style))
         story.append(Spacer(1, 0.2*cm))
 
         shift_text_map = {'all': 'Semua (Shift & Non-Shift)', 'shift': 'Shift', 'non_shift': 'Non-Shift'}
@@ -1258,85 +3977,123 @@ def export_attendance_pdf():
         story.append(info_table)
         story.append(Spacer(1, 0.3*cm))
 
-        # Hitung total kehadiran per pegawai dalam rentang
-        months_list = []
-        start_year, start_month = map(int, date_range['start'].split('-'))
-        end_year, end_month = map(int, date_range['end'].split('-'))
-        current_year, current_month = start_year, start_month
-        while (current_year < end_year) or (current_year == end_year and current_month <= end_month):
-            months_list.append(f"{current_year}-{str(current_month).zfill(2)}")
-            current_month += 1
-            if current_month > 12:
-                current_month = 1
-                current_year += 1
-        num_months = len(months_list)
+        # Total kehadiran per pegawai dalam rentang
+        report = build_report_table(employees, months_in_range(date_range))
+        num_months = len(report.months)
 
         header = ['NO', 'NAMA', 'NIK', 'JABATAN', 'TEMPAT TUGAS', 'TOTAL', 'STATUS']
         table_data = [header]
 
-        for idx, emp in enumerate(employees, 1):
-            if not isinstance(emp, dict):
-                continue
+        col_widths = [0.5*cm, 3*cm, 2*cm, 3*cm, 3*cm, 1*cm, 2*cm]
+
+        analysis_data = [
+            ['KETERANGAN', 'NILAI'],
+            ['Total Pegawai Ikut Senam', f'{len(employees)} orang'],
+            ['Periode', f'{num_months} bulan ({date_range.get("start")} s/d {date_range.get("end")})'],
+            ['Status', 'AKTIF MENGIKUTI SENAM'],
+        ]
+        keterangan_style = ParagraphStyle('Ket', parent=styles['Normal'],
+                                          fontSize=6.5, leading=8, leftIndent=8, rightIndent=8)
+        keterangan_text = f"""
+        <b>KETERANGAN:</b><br/>
+        • Daftar ini menampilkan pegawai yang <font color="#1b5e20"><b>AKTIF</b></font> mengikuti senam dalam periode yang ditentukan<br/>
+        • Periode: {num_months} bulan dari {date_range.get('start')} sampai {date_range.get('end')}<br/>
+        """
+        keterangan_para = Paragraph(keterangan_text, keterangan_style)
+        signature_data = [
+            ['', ''],
+            ['KABAG SDM', 'KASUBAG KEPEGAWAIAN'],
+            ['', ''], ['', ''],
+            ['Dewi Nashrulloh, SKM.M.Kes', 'Rahmawati, SH'],
+            ['NIK: 011205226', 'NIK: 022708322']
+        ]
 
-            # Hitung total dalam rentang
-            emp_total = 0
-            for month_key in months_list:
-                year = month_key.split('-')[0]
-                bulanan = emp.get('bulanan', {})
-                if year in bulanan:
-                    month_data = bulanan[year].get(month_key, {})
-                    emp_total += int(month_data.get('value', 0) or 0)
+        struktur_safe = struktur_lini.replace(' ', '_').replace('/', '-')
+        shift_safe = shift_filter.replace('_', '-')
+        filename = f"pegawai_ikut_senam_{struktur_safe}_{shift_safe}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
 
-            cell_style = ParagraphStyle('cs', fontSize=6, leading=7, wordWrap='CJK')
-            row = [
-                str(idx),
-                Paragraph(str(emp.get('nama', '-')), cell_style),
-                Paragraph(str(emp.get('nik', '-')), cell_style),
-                Paragraph(str(emp.get('jabatan', '-')), cell_style),
-                Paragraph(str(emp.get('tempat', '-')), cell_style),
-                str(emp_total),
-                Paragraph(f'<font color="#1b5e20"><b>{emp_total}x SENAM</b></font>',
-                          ParagraphStyle('st', fontSize=6, alignment=TA_CENTER))
+        # ===== RENDERER CANVAS: digambar langsung tanpa flowable platypus =====
+        if renderer == 'canvas':
+            canvas_rows = [
+                [str(idx), emp.get('nama', '-'), emp.get('nik', '-'), emp.get('jabatan', '-'), emp.get('tempat', '-'),
+                 emp_total, CanvasCell(f'{emp_total}x SENAM', colors.HexColor('#1b5e20'), True)]
+                for idx, (emp, emp_total) in enumerate(zip(employees, report.totals.tolist()), 1)
             ]
-            table_data.append(row)
 
-        col_widths = [0.5*cm, 3*cm, 2*cm, 3*cm, 3*cm, 1*cm, 2*cm]
-        data_table = Table(table_data, colWidths=col_widths, repeatRows=1)
-        data_table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#2e7d32')),
-            ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0,0), (-1,0), 6),
-            ('ALIGN', (0,0), (-1,0), 'CENTER'),
-            ('VALIGN', (0,0), (-1,0), 'MIDDLE'),
-            ('FONTSIZE', (0,1), (-1,-1), 6),
-            ('ALIGN', (0,1), (0,-1), 'CENTER'),
-            ('ALIGN', (5,1), (-1,-1), 'CENTER'),
-            ('VALIGN', (0,1), (-1,-1), 'MIDDLE'),
-            ('GRID', (0,0), (-1,-1), 0.3, colors.grey),
-            ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.white, colors.HexColor('#e8f5e9')]),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 3),
-            ('TOPPADDING', (0,0), (-1,-1), 3),
-            ('LEFTPADDING', (0,0), (-1,-1), 2),
-            ('RIGHTPADDING', (0,0), (-1,-1), 2),
-        ]))
-        story.append(data_table)
-        story.append(Spacer(1, 0.4*cm))
+            pdf = CanvasReport(buffer)
+            pdf.letterhead("DAFTAR PEGAWAI YANG IKUT SENAM", colors.HexColor('#1b5e20'), colors.HexColor('#2e7d32'))
+            pdf.info_table(info_data)
+            pdf.table(
+                canvas_rows, col_widths, 6, hpad=2, vpad=3,
+                align=['CENTER', 'LEFT', 'LEFT', 'LEFT', 'LEFT', 'CENTER', 'CENTER'],
+                header=header, header_align='CENTER', header_fill=colors.HexColor('#2e7d32'),
+                zebra=[colors.white, colors.HexColor('#e8f5e9')], wrap_columns=(1, 2, 3, 4)
+            )
+            pdf.space(0.4*cm)
+            pdf.table(
+                analysis_data[1:], [10*cm, 5*cm], 7, vpad=3, align=['LEFT', 'CENTER'],
+                header=analysis_data[0], header_fill=colors.HexColor('#e8f5e9'), header_color=colors.black,
+                zebra=[colors.white, colors.HexColor('#fafafa')]
+            )
+            pdf.space(0.25*cm)
+            pdf.paragraph_box(keterangan_para, 15*cm, colors.HexColor('#e8f5e9'), colors.HexColor('#2e7d32'), static=True)
+            pdf.space(0.4*cm)
+            pdf.signature(signature_data)
+            pdf.save()
+            buffer.seek(0)
+
+            return send_file(
+                buffer,
+                as_attachment=True,
+                download_name=filename,
+                mimetype='application/pdf'
+            )
+
+        cell_style = pdf_cell_style(6)
+        # Lebar isi sel = lebar kolom - padding kiri/kanan (2 + 2)
+        nama_width, nik_width, jabatan_width, tempat_width = (width - 4 for width in col_widths[1:5])
+
+        for idx, (emp, emp_total) in enumerate(zip(employees, report.totals.tolist()), 1):
+            row = [
+                str(idx),
+                pdf_text_cell(emp.get('nama', '-'), nama_width, cell_style),
+                pdf_text_cell(emp.get('nik', '-'), nik_width, cell_style),
+                pdf_text_cell(emp.get('jabatan', '-'), jabatan_width, cell_style),
+                pdf_text_cell(emp.get('tempat', '-'), tempat_width, cell_style),
+                str(emp_total),
+                f'{emp_total}x SENAM'
+            ]
+            table_data.append(row)
 
-        # Total kehadiran keseluruhan
-        grand_total = sum(
-            sum(int(bulanan.get(m, {}).get('value', 0) or 0)
-                for year_data in emp.get('bulanan', {}).values()
-                for m, bulanan in [(mk, year_data) for mk in months_list if mk.split('-')[0] in emp.get('bulanan', {})])
-            for emp in employees if isinstance(emp, dict)
-        )
+        story.extend(paged_pdf_tables(
+            table_data[0], table_data[1:], col_widths,
+            [
+                ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#2e7d32')),
+                ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+                ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0,0), (-1,0), 6),
+                ('ALIGN', (0,0), (-1,0), 'CENTER'),
+                ('VALIGN', (0,0), (-1,0), 'MIDDLE'),
+                ('FONTSIZE', (0,1), (-1,-1), 6),
+                ('ALIGN', (0,1), (0,-1), 'CENTER'),
+                ('ALIGN', (5,1), (-1,-1), 'CENTER'),
+                ('VALIGN', (0,1), (-1,-1), 'MIDDLE'),
+                ('TEXTCOLOR', (6,1), (6,-1), colors.HexColor('#1b5e20')),
+                ('FONTNAME', (6,1), (6,-1), 'Helvetica-Bold'),
+                ('GRID', (0,0), (-1,-1), 0.3, colors.grey),
+                ('BOTTOMPADDING', (0,0), (-1,-1), 3),
+                ('TOPPADDING', (0,0), (-1,-1), 3),
+                ('LEFTPADDING', (0,0), (-1,-1), 2),
+                ('RIGHTPADDING', (0,0), (-1,-1), 2),
+            ],
+            first_height=pdf_frame_height(doc) - pdf_story_height(story, doc.width, doc.height),
+            page_height=pdf_frame_height(doc),
+            hpadding=2,
+            vpadding=3,
+            zebra=[colors.white, colors.HexColor('#e8f5e9')]
+        ))
+        story.append(Spacer(1, 0.4*cm))
 
-        analysis_data = [
-            ['KETERANGAN', 'NILAI'],
-            ['Total Pegawai Ikut Senam', f'{len(employees)} orang'],
-            ['Periode', f'{num_months} bulan ({date_range.get("start")} s/d {date_range.get("end")})'],
-            ['Status', 'AKTIF MENGIKUTI SENAM'],
-        ]
         analysis_table = Table(analysis_data, colWidths=[10*cm, 5*cm])
         analysis_table.setStyle(TableStyle([
             ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#e8f5e9')),
@@ -1352,14 +4109,6 @@ def export_attendance_pdf():
         story.append(analysis_table)
         story.append(Spacer(1, 0.25*cm))
 
-        keterangan_style = ParagraphStyle('Ket', parent=styles['Normal'],
-                                          fontSize=6.5, leading=8, leftIndent=8, rightIndent=8)
-        keterangan_text = f"""
-        <b>KETERANGAN:</b><br/>
-        • Daftar ini menampilkan pegawai yang <font color="#1b5e20"><b>AKTIF</b></font> mengikuti senam dalam periode yang ditentukan<br/>
-        • Periode: {num_months} bulan dari {date_range.get('start')} sampai {date_range.get('end')}<br/>
-        """
-        keterangan_para = Paragraph(keterangan_text, keterangan_style)
         keterangan_table = Table([[keterangan_para]], colWidths=[15*cm])
         keterangan_table.setStyle(TableStyle([
             ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#e8f5e9')),
@@ -1369,16 +4118,9 @@ def export_attendance_pdf():
             ('TOPPADDING', (0,0), (-1,-1), 5),
             ('BOTTOMPADDING', (0,0), (-1,-1), 5),
         ]))
-        story.append(keterangan_table)
+        story.append(FormBlock(f'keterangan:{keterangan_text}', [keterangan_table]))
         story.append(Spacer(1, 0.4*cm))
 
-        signature_data = [
-            ['', ''],
-            ['KABAG SDM', 'KASUBAG KEPEGAWAIAN'],
-            ['', ''], ['', ''],
-            ['Dewi Nashrulloh, SKM.M.Kes', 'Rahmawati, SH'],
-            ['NIK: 011205226', 'NIK: 022708322']
-        ]
         signature_table = Table(signature_data, colWidths=[7.5*cm, 7.5*cm])
         signature_table.setStyle(TableStyle([
             ('ALIGN', (0,0), (-1,-1), 'CENTER'),
@@ -1387,7 +4129,7 @@ def export_attendance_pdf():
             ('FONTNAME', (0,1), (-1,1), 'Helvetica-Bold'),
             ('TOPPADDING', (0,4), (-1,5), 3),
         ]))
-        story.append(signature_table)
+        story.append(FormBlock(f'ttd:{signature_data!r}', [signature_table]))
         story.append(Spacer(1, 0.15*cm))
         story.append(Paragraph(f"Dicetak pada: {datetime.now().strftime('%d %B %Y %H:%M:%S')}",
                                ParagraphStyle('Footer', parent=styles['Normal'], fontSize=6,
@@ -1396,9 +4138,6 @@ def export_attendance_pdf():
         doc.build(story)
         buffer.seek(0)
 
-        struktur_safe = struktur_lini.replace(' ', '_').replace('/', '-')
-        shift_safe = shift_filter.replace('_', '-')
-        filename = f"pegawai_ikut_senam_{struktur_safe}_{shift_safe}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
         return send_file(buffer, as_attachment=True, download_name=filename, mimetype='application/pdf')
 
     except Exception as e:
@@ -1409,510 +4148,70 @@ def export_attendance_pdf():
     
 
 @app.route('/api/export-group-pdf', methods=['POST'])
+@cached_export
 def export_group_pdf():
     """Export PDF untuk kelompok pegawai - A4 PORTRAIT - FLEKSIBEL RENTANG WAKTU"""
     try:
         data = request.json
-        employees = data.get('employees', [])
+        employees, error = resolve_export_employees(data)
         date_range = data.get('date_range', {})
         shift_filter = data.get('shift_filter', 'all')
         struktur_lini = data.get('struktur_lini', 'Semua')
+        renderer = data.get('renderer', 'platypus')
         
-        print(f"DEBUG: Shift filter received: {shift_filter}")
-        print(f"DEBUG: Total employees before filter: {len(employees)}")
-        print(f"DEBUG: Date range: {date_range}")
-        
-        if not employees:
-            return jsonify({'success': False, 'message': 'Tidak ada data pegawai'})
-        
-        # DEEP COPY employees untuk menghindari modifikasi data asli
-        import copy
-        employees = copy.deepcopy(employees)
-        
-        # Filter berdasarkan shift status jika bukan "all"
-        if shift_filter != 'all':
-            filtered_employees = []
-            for emp in employees:
-                if not isinstance(emp, dict):
-                    print(f"WARNING: Invalid employee data type: {type(emp)}")
-                    continue
-                
-                emp_shift_status = emp.get('shift_status', 'non_shift')
-                print(f"DEBUG: Employee {emp.get('nama', 'UNKNOWN')} - shift_status: {emp_shift_status}")
-                
-                if emp_shift_status == shift_filter:
-                    filtered_employees.append(emp)
-            
-            employees = filtered_employees
-            print(f"DEBUG: Total employees after filter: {len(employees)}")
-        
-        if not employees:
-            return jsonify({'success': False, 'message': 'Tidak ada data pegawai untuk filter shift yang dipilih'})
-        
-        # CREATE PDF - A4 PORTRAIT
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=A4,
-            rightMargin=1.2*cm,
-            leftMargin=1.2*cm,
-            topMargin=0.8*cm,
-            bottomMargin=1.5*cm
-        )
-        
-        story = []
-        styles = getSampleStyleSheet()
-        
-        # CUSTOM STYLES
-        title_style = ParagraphStyle(
-            'TitleStyle',
-            parent=styles['Heading1'],
-            fontSize=11,
-            alignment=TA_CENTER,
-            spaceAfter=3,
-            textColor=colors.HexColor('#1a237e'),
-            fontName='Helvetica-Bold'
-        )
-        
-        subtitle_style = ParagraphStyle(
-            'SubtitleStyle',
-            parent=styles['Heading2'],
-            fontSize=9,
-            alignment=TA_CENTER,
-            spaceAfter=6,
-            textColor=colors.HexColor('#283593'),
-            fontName='Helvetica-Bold'
-        )
-        
-        # HEADER
-        story.append(Paragraph("RUMAH SAKIT ISLAM SITI KHADIJAH PALEMBANG", title_style))
-        story.append(Paragraph("REKAP ABSENSI SENAM PEGAWAI PER KELOMPOK", subtitle_style))
-        story.append(Spacer(1, 0.2*cm))
-        
-        # Filter shift text
-        shift_text_map = {
-            'all': 'Semua (Shift & Non-Shift)',
-            'shift': 'Shift',
-            'non_shift': 'Non-Shift'
-        }
-        shift_text = shift_text_map.get(shift_filter, 'Semua')
-        
-        # INFO KELOMPOK - Compact
-        info_data = [
-            ['STRUKTUR LINI', ':', struktur_lini, 'FILTER SHIFT', ':', shift_text],
-            ['JUMLAH PEGAWAI', ':', str(len(employees)), 'PERIODE', ':', f"{date_range.get('start', '-')} s/d {date_range.get('end', '-')}"]
-        ]
-        
-        info_table = Table(info_data, colWidths=[2.8*cm, 0.3*cm, 4*cm, 2.8*cm, 0.3*cm, 4*cm])
-        info_table.setStyle(TableStyle([
-            ('FONTNAME', (0,0), (0,-1), 'Helvetica-Bold'),
-            ('FONTNAME', (3,0), (3,-1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0,0), (-1,-1), 7),
-            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 2),
-            ('TOPPADDING', (0,0), (-1,-1), 2),
-        ]))
-        
-        story.append(info_table)
-        story.append(Spacer(1, 0.3*cm))
-        
-        # ===== PERBAIKAN: Ambil bulan dari rentang waktu FLEKSIBEL =====
-        months_list = []
-        if date_range.get('start') and date_range.get('end'):
-            start_year, start_month = map(int, date_range['start'].split('-'))
-            end_year, end_month = map(int, date_range['end'].split('-'))
-            
-            current_year = start_year
-            current_month = start_month
-            
-            # Loop untuk generate semua bulan dalam rentang
-            while (current_year < end_year) or (current_year == end_year and current_month <= end_month):
-                month_key = f"{current_year}-{str(current_month).zfill(2)}"
-                months_list.append(month_key)
-                
-                current_month += 1
-                if current_month > 12:
-                    current_month = 1
-                    current_year += 1
-        
-        print(f"DEBUG: Total months generated: {len(months_list)}")
-        print(f"DEBUG: Months list: {months_list[:5]}...{months_list[-5:] if len(months_list) > 5 else ''}")
-        
-        # TABEL DATA PEGAWAI - DINAMIS berdasarkan jumlah bulan
-        month_names_short = {
-            '01': 'Jan', '02': 'Feb', '03': 'Mar', '04': 'Apr',
-            '05': 'Mei', '06': 'Jun', '07': 'Jul', '08': 'Ags',
-            '09': 'Sep', '10': 'Okt', '11': 'Nov', '12': 'Des'
-        }
-        
-        # ===== PERBAIKAN: Hitung lebar kolom dinamis =====
-        num_months = len(months_list)
-        
-        # Tentukan ukuran font dan padding berdasarkan jumlah bulan
-        if num_months <= 12:
-            # 12 bulan atau kurang - ukuran normal
-            header_font_size = 5
-            data_font_size = 5.5
-            month_col_width = 0.55*cm
-            show_year_in_header = True
-        elif num_months <= 18:
-            # 13-18 bulan - ukuran sedang
-            header_font_size = 4.5
-            data_font_size = 5
-            month_col_width = 0.50*cm
-            show_year_in_header = True
-        elif num_months <= 24:
-            # 19-24 bulan - ukuran kecil
-            header_font_size = 4
-            data_font_size = 4.5
-            month_col_width = 0.45*cm
-            show_year_in_header = False  # Hanya bulan, tanpa tahun
-        else:
-            # Lebih dari 24 bulan - sangat kecil
-            header_font_size = 3.5
-            data_font_size = 4
-            month_col_width = 0.40*cm
-            show_year_in_header = False
-        
-        # Header tabel dengan 2 kolom status (Non-Shift dan Shift)
-        header = ['NO', 'NAMA', 'NIK', 'TEMPAT TUGAS']
-        for month_key in months_list:
-            year, month = month_key.split('-')
-            if show_year_in_header:
-                header.append(f"{month_names_short[month]}\n'{year[2:]}")
-            else:
-                header.append(f"{month_names_short[month]}")
-        header.extend(['TOTAL', 'NON-SHIFT', 'SHIFT'])
-        
-        table_data = [header]
-        
-        # ===== PERBAIKAN: Hitung target berdasarkan JUMLAH BULAN AKTUAL =====
-        # Asumsi: 40 kegiatan per tahun = 40/12 per bulan ≈ 3.33 per bulan
-        kegiatan_per_bulan = 40 / 12
-        total_kegiatan_dalam_periode = kegiatan_per_bulan * num_months
-        
-        # Target untuk periode ini
-        TARGET_NON_SHIFT = int(total_kegiatan_dalam_periode * 0.70)  # 70%
-        TARGET_SHIFT = int(total_kegiatan_dalam_periode * 0.50)      # 50%
-        
-        print(f"DEBUG: Total kegiatan dalam periode {num_months} bulan: {total_kegiatan_dalam_periode:.2f}")
-        print(f"DEBUG: Target NON-SHIFT: {TARGET_NON_SHIFT}")
-        print(f"DEBUG: Target SHIFT: {TARGET_SHIFT}")
-        
-        # Data pegawai dengan status
-        grand_total = 0
-        for idx, emp in enumerate(employees, 1):
-            try:
-                if not isinstance(emp, dict):
-                    print(f"ERROR: Invalid employee at index {idx}")
-                    continue
-                
-                nama = emp.get('nama', f'Pegawai {idx}')
-                nik = emp.get('nik', '-')
-                tempat = emp.get('tempat', '-')
-                
-                # Gunakan Paragraph untuk text wrapping
-                nama_para = Paragraph(str(nama), ParagraphStyle(
-                    'NamaStyle',
-                    fontSize=data_font_size,
-                    leading=data_font_size + 1,
-                    wordWrap='CJK'
-                ))
-                
-                nik_para = Paragraph(str(nik), ParagraphStyle(
-                    'NikStyle',
-                    fontSize=data_font_size,
-                    leading=data_font_size + 1,
-                    wordWrap='CJK'
-                ))
-                
-                tempat_para = Paragraph(str(tempat), ParagraphStyle(
-                    'TempatStyle',
-                    fontSize=data_font_size,
-                    leading=data_font_size + 1,
-                    wordWrap='CJK'
-                ))
-                
-                row = [
-                    str(idx),
-                    nama_para,
-                    nik_para,
-                    tempat_para
-                ]
-                
-                employee_total = 0
-                for month_key in months_list:
-                    year, month = month_key.split('-')
-                    value = 0
-                    
-                    # Validasi struktur data bulanan
-                    bulanan = emp.get('bulanan', {})
-                    if not isinstance(bulanan, dict):
-                        print(f"WARNING: Invalid bulanan data for {nama}")
-                        row.append('0')
-                        continue
-                    
-                    if year in bulanan:
-                        year_data = bulanan[year]
-                        if isinstance(year_data, dict):
-                            month_data = year_data.get(month_key, {})
-                            if isinstance(month_data, dict):
-                                value = month_data.get('value', 0)
-                                try:
-                                    value = int(value) if value else 0
-                                except (ValueError, TypeError):
-                                    value = 0
-                    
-                    row.append(str(value))
-                    employee_total += value
-                
-                row.append(str(employee_total))
-                grand_total += employee_total
-                
-                # Status NON-SHIFT (target dinamis)
-                if employee_total >= TARGET_NON_SHIFT:
-                    status_non_shift = Paragraph('✓ Tercapai', ParagraphStyle(
-                        'StatusGood',
-                        fontSize=data_font_size,
-                        textColor=colors.HexColor('#2e7d32'),
-                        fontName='Helvetica-Bold',
-                        alignment=TA_CENTER
-                    ))
-                else:
-                    kurang_non_shift = TARGET_NON_SHIFT - employee_total
-                    status_non_shift = Paragraph(f'✗ Kurang {kurang_non_shift}x', ParagraphStyle(
-                        'StatusBad',
-                        fontSize=data_font_size,
-                        textColor=colors.HexColor('#c62828'),
-                        alignment=TA_CENTER
-                    ))
-                
-                # Status SHIFT (target dinamis)
-                if employee_total >= TARGET_SHIFT:
-                    status_shift = Paragraph('✓ Tercapai', ParagraphStyle(
-                        'StatusGood',
-                        fontSize=data_font_size,
-                        textColor=colors.HexColor('#2e7d32'),
-                        fontName='Helvetica-Bold',
-                        alignment=TA_CENTER
-                    ))
-                else:
-                    kurang_shift = TARGET_SHIFT - employee_total
-                    status_shift = Paragraph(f'✗ Kurang {kurang_shift}x', ParagraphStyle(
-                        'StatusBad',
-                        fontSize=data_font_size,
-                        textColor=colors.HexColor('#c62828'),
-                        alignment=TA_CENTER
-                    ))
-                
-                row.extend([status_non_shift, status_shift])
-                table_data.append(row)
-                
-            except Exception as e:
-                print(f"ERROR processing employee {idx}: {str(e)}")
-                import traceback
-                traceback.print_exc()
-                continue
-        
-        # Total row
-        total_row = ['', Paragraph('<b>TOTAL</b>', ParagraphStyle(
-            'TotalBold',
-            fontSize=6,
-            fontName='Helvetica-Bold'
-        )), '', '']
-        
-        for month_key in months_list:
-            month_total = 0
-            try:
-                for emp in employees:
-                    if isinstance(emp, dict):
-                        bulanan = emp.get('bulanan', {})
-                        if isinstance(bulanan, dict):
-                            year = month_key.split('-')[0]
-                            if year in bulanan:
-                                year_data = bulanan[year]
-                                if isinstance(year_data, dict):
-                                    month_data = year_data.get(month_key, {})
-                                    if isinstance(month_data, dict):
-                                        value = month_data.get('value', 0)
-                                        try:
-                                            month_total += int(value) if value else 0
-                                        except (ValueError, TypeError):
-                                            pass
-            except Exception as e:
-                print(f"ERROR calculating month total for {month_key}: {str(e)}")
-            
-            total_row.append(str(month_total))
-        
-        total_row.extend([str(grand_total), '', ''])
-        table_data.append(total_row)
-        
-        # Validasi table_data
-        if len(table_data) <= 1:
-            return jsonify({'success': False, 'message': 'Tidak ada data valid untuk ditampilkan'})
-        
-        # ===== PERBAIKAN: Hitung lebar kolom DINAMIS =====
-        # Total width: 18cm - NO(0.5) - NAMA(2.5) - NIK(1.5) - TEMPAT(2.5) - TOTAL(0.8) - NON-SHIFT(1.6) - SHIFT(1.6) = sisa untuk bulan
-        fixed_width = 0.5 + 2.5 + 1.5 + 2.5 + 0.8 + 1.6 + 1.6  # = 11.0cm
-        available_for_months = 18 - fixed_width  # = 7cm
-        
-        # Hitung lebar kolom bulan
-        if num_months > 0:
-            month_col_width = min(month_col_width, available_for_months / num_months)
-        
-        col_widths = [
-            0.5*cm,    # NO
-            2.5*cm,    # NAMA
-            1.5*cm,    # NIK
-            2.5*cm,    # TEMPAT TUGAS
-        ] + [month_col_width*cm] * num_months + [
-            0.8*cm,    # TOTAL
-            1.6*cm,    # NON-SHIFT
-            1.6*cm     # SHIFT
-        ]
-        
-        data_table = Table(table_data, colWidths=col_widths, repeatRows=1)
-        data_table.setStyle(TableStyle([
-            # Header
-            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#1976d2')),
-            ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0,0), (-1,0), header_font_size),
-            ('ALIGN', (0,0), (-1,0), 'CENTER'),
-            ('VALIGN', (0,0), (-1,0), 'MIDDLE'),
-            
-            # Data rows
-            ('FONTSIZE', (0,1), (-1,-2), data_font_size),
-            ('ALIGN', (0,1), (0,-1), 'CENTER'),  # NO
-            ('ALIGN', (2,1), (2,-2), 'CENTER'),  # NIK
-            ('ALIGN', (4,1), (-1,-2), 'CENTER'),  # Bulan, Total, Status
-            ('VALIGN', (0,1), (-1,-1), 'MIDDLE'),
-            
-            # Total row
-            ('BACKGROUND', (0,-1), (-1,-1), colors.HexColor('#e3f2fd')),
-            ('FONTNAME', (0,-1), (-1,-1), 'Helvetica-Bold'),
-            ('FONTSIZE', (0,-1), (-1,-1), 6),
-            ('ALIGN', (4,-1), (-1,-1), 'CENTER'),
-            
-            # Grid
-            ('GRID', (0,0), (-1,-1), 0.3, colors.grey),
-            ('ROWBACKGROUNDS', (0,1), (-1,-2), [colors.white, colors.HexColor('#f5f5f5')]),
-            
-            # Padding
-            ('BOTTOMPADDING', (0,0), (-1,-1), 2),
-            ('TOPPADDING', (0,0), (-1,-1), 2),
-            ('LEFTPADDING', (0,0), (-1,-1), 1.5),
-            ('RIGHTPADDING', (0,0), (-1,-1), 1.5),
-        ]))
-        
-        story.append(data_table)
-        story.append(Spacer(1, 0.4*cm))
-        
-        # TARGET DAN ANALISIS - DINAMIS
-        avg_attendance = grand_total / len(employees) if len(employees) > 0 else 0
-        
-        analysis_data = [
-            ['KETERANGAN', 'NILAI'],
-            ['Total Pegawai', f'{len(employees)} orang'],
-            ['Periode', f'{num_months} bulan ({date_range.get("start")} s/d {date_range.get("end")})'],
-            ['Total Kehadiran', f'{grand_total} kali'],
-            ['Rata-rata per Pegawai', f'{avg_attendance:.1f} kali'],
-        ]
-        
-        analysis_table = Table(analysis_data, colWidths=[10*cm, 5*cm])
-        analysis_table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#e3f2fd')),
-            ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0,0), (-1,-1), 7),
-            ('ALIGN', (0,0), (-1,-1), 'LEFT'),
-            ('ALIGN', (1,0), (1,-1), 'CENTER'),
-            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-            ('GRID', (0,0), (-1,-1), 0.3, colors.grey),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 3),
-            ('TOPPADDING', (0,0), (-1,-1), 3),
-            ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.white, colors.HexColor('#fafafa')]),
-        ]))
-        
-        story.append(analysis_table)
-        story.append(Spacer(1, 0.25*cm))
-        
-        # KETERANGAN TARGET - DINAMIS
-        keterangan_style = ParagraphStyle(
-            'Keterangan',
-            parent=styles['Normal'],
-            fontSize=6.5,
-            leading=8,
-            leftIndent=8,
-            rightIndent=8,
-            spaceAfter=2
-        )
-        
-        keterangan_text = f"""
-        <b>KETERANGAN STATUS:</b><br/>
-        • <b>Periode:</b> {num_months} bulan dari {date_range.get('start')} sampai {date_range.get('end')}<br/>
-        • <b>Total Kegiatan Senam dalam periode:</b> {total_kegiatan_dalam_periode:.1f} kali ({kegiatan_per_bulan:.2f} kali/bulan × {num_months} bulan)<br/>
-        • <b>Target NON-SHIFT:</b> {TARGET_NON_SHIFT} kali (70% dari {total_kegiatan_dalam_periode:.1f})<br/>
-        • <b>Target SHIFT:</b> {TARGET_SHIFT} kali (50% dari {total_kegiatan_dalam_periode:.1f})<br/>
-        • Status <font color="#2e7d32"><b>✓ Tercapai</b></font> = Kehadiran mencapai/melebihi target<br/>
-        • Status <font color="#c62828"><b>✗ Kurang Nx</b></font> = Kehadiran kurang N kali dari target
-        """
-        
-        keterangan_para = Paragraph(keterangan_text, keterangan_style)
-        keterangan_table = Table([[keterangan_para]], colWidths=[15*cm])
-        keterangan_table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#fff9c4')),
-            ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#f9a825')),
-            ('LEFTPADDING', (0,0), (-1,-1), 6),
-            ('RIGHTPADDING', (0,0), (-1,-1), 6),
-            ('TOPPADDING', (0,0), (-1,-1), 5),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 5),
-        ]))
-        
-        story.append(keterangan_table)
-        story.append(Spacer(1, 0.4*cm))
+        print(f"DEBUG: Shift filter received: {shift_filter}")
+        print(f"DEBUG: Total employees before filter: {len(employees)}")
+        print(f"DEBUG: Date range: {date_range}")
         
-        # TANDA TANGAN
-        signature_data = [
-            ['', ''],
-            ['KABAG SDM', 'KASUBAG KEPEGAWAIAN'],
-            ['', ''],
-            ['', ''],
-            ['Dewi Nashrulloh, SKM.M.Kes', 'Rahmawati, SH'],
-            ['NIK: 011205226', 'NIK: 022708322']
-        ]
+        if error:
+            return jsonify({'success': False, 'message': error})
+        if renderer not in PDF_RENDERERS:
+            return jsonify({'success': False, 'message': f'Renderer PDF tidak dikenal: {renderer}'})
+        if not employees:
+            return jsonify({'success': False, 'message': 'Tidak ada data pegawai'})
         
-        signature_table = Table(signature_data, colWidths=[7.5*cm, 7.5*cm])
-        signature_table.setStyle(TableStyle([
-            ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-            ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-            ('FONTSIZE', (0,0), (-1,-1), 7),
-            ('FONTSIZE', (0,1), (-1,1), 7),
-            ('FONTNAME', (0,1), (-1,1), 'Helvetica-Bold'),
-            ('TOPPADDING', (0,1), (-1,1), 0),
-            ('TOPPADDING', (0,4), (-1,5), 3),
-        ]))
+        # Filter berdasarkan shift status jika bukan "all"
+        if shift_filter != 'all':
+            filtered_employees = []
+            for emp in employees:
+                if not isinstance(emp, dict):
+                    print(f"WARNING: Invalid employee data type: {type(emp)}")
+                    continue
+                
+                emp_shift_status = emp.get('shift_status', 'non_shift')
+                print(f"DEBUG: Employee {emp.get('nama', 'UNKNOWN')} - shift_status: {emp_shift_status}")
+                
+                if emp_shift_status == shift_filter:
+                    filtered_employees.append(emp)
+            
+            employees = filtered_employees
+            print(f"DEBUG: Total employees after filter: {len(employees)}")
         
-        story.append(signature_table)
+        if not employees:
+            return jsonify({'success': False, 'message': 'Tidak ada data pegawai untuk filter shift yang dipilih'})
         
-        # FOOTER
-        footer_style = ParagraphStyle(
-            'Footer',
-            parent=styles['Normal'],
-            fontSize=6,
-            alignment=TA_RIGHT,
-            textColor=colors.grey
-        )
+        # ===== Tabel laporan: matriks kehadiran, total & target dalam satu langkah =====
+        report = build_report_table(employees, months_in_range(date_range))
+        months_list = report.months
         
-        story.append(Spacer(1, 0.15*cm))
-        story.append(Paragraph(
-            f"Dicetak pada: {datetime.now().strftime('%d %B %Y %H:%M:%S')}",
-            footer_style
-        ))
+        print(f"DEBUG: Total months generated: {len(months_list)}")
+        print(f"DEBUG: Months list: {months_list[:5]}...{months_list[-5:] if len(months_list) > 5 else ''}")
+        print(f"DEBUG: Total kegiatan dalam periode {len(months_list)} bulan: {report.total_kegiatan:.2f}")
+        print(f"DEBUG: Target NON-SHIFT: {report.target_non_shift}")
+        print(f"DEBUG: Target SHIFT: {report.target_shift}")
+        
+        parts = group_report_parts(report, date_range, shift_filter, struktur_lini)
+        
+        struktur_safe = struktur_lini.replace(' ', '_').replace('/', '-')
+        shift_safe = shift_filter.replace('_', '-')
+        filename = f"rekap_senam_kelompok_{struktur_safe}_{shift_safe}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        
+        # CREATE PDF - A4 PORTRAIT
+        buffer = io.BytesIO()
         
         # BUILD PDF
         try:
-            print(f"DEBUG: Building PDF with {len(story)} elements")
-            doc.build(story)
+            write_group_report_pdf(buffer, report, parts, renderer)
             print("DEBUG: PDF build successful")
         except Exception as build_error:
             print(f"ERROR building PDF: {str(build_error)}")
@@ -1928,10 +4227,6 @@ def export_group_pdf():
         if pdf_size < 100:
             return jsonify({'success': False, 'message': 'PDF yang dihasilkan tidak valid (terlalu kecil)'})
         
-        struktur_safe = struktur_lini.replace(' ', '_').replace('/', '-')
-        shift_safe = shift_filter.replace('_', '-')
-        filename = f"rekap_senam_kelompok_{struktur_safe}_{shift_safe}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-        
         print(f"DEBUG: Returning PDF file: {filename}, size: {pdf_size}")
         
         return send_file(
@@ -1949,10 +4244,20 @@ def export_group_pdf():
     
 
 @app.route('/api/export-excel', methods=['POST'])
+@cached_export
 def export_excel():
+    """Rekap seluruh pegawai terfilter. format: 'xlsx' (default), 'csv'
+    (di-stream per potongan baris) atau 'parquet'"""
     try:
-        data = request.json.get('data', [])
-        
+        payload = request.json or {}
+        output_format = payload.get('format', 'xlsx')
+        data, error = resolve_export_employees(payload, legacy_key='data')
+        
+        if error:
+            return jsonify({'success': False, 'message': error})
+        format_error = table_export_format_error(output_format)
+        if format_error:
+            return jsonify({'success': False, 'message': format_error})
         if not data:
             return jsonify({'success': False, 'message': 'Tidak ada data'})
         
@@ -1977,126 +4282,376 @@ def export_excel():
         
         df = pd.DataFrame(rows)
         
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Rekap Senam')
-            
-            worksheet = writer.sheets['Rekap Senam']
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 30)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
-        
-        output.seek(0)
-        
-        filename = f"rekap_senam_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-        
-        return send_file(
-            output,
-            as_attachment=True,
-            download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        )
+        basename = f"rekap_senam_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        return table_export_response(df, basename, output_format, 'Rekap Senam')
         
     except Exception as e:
         print(f"Excel Export error: {str(e)}")
         return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
 
 @app.route('/api/export-group-excel', methods=['POST'])
+@cached_export
 def export_group_excel():
-    """Export Excel untuk kelompok pegawai (berdasarkan filter struktur lini)"""
+    """Export Excel untuk kelompok pegawai (berdasarkan filter struktur lini).
+    format: 'xlsx' (default), 'csv' atau 'parquet'"""
     try:
         data = request.json
-        employees = data.get('employees', [])
+        employees, error = resolve_export_employees(data)
         date_range = data.get('date_range', {})
         struktur_lini = data.get('struktur_lini', 'Semua')
+        output_format = data.get('format', 'xlsx')
         
+        if error:
+            return jsonify({'success': False, 'message': error})
+        format_error = table_export_format_error(output_format)
+        if format_error:
+            return jsonify({'success': False, 'message': format_error})
         if not employees:
             return jsonify({'success': False, 'message': 'Tidak ada data pegawai'})
         
-        # Ambil bulan dari rentang waktu
-        months_list = []
-        if date_range.get('start') and date_range.get('end'):
-            start_year, start_month = map(int, date_range['start'].split('-'))
-            end_year, end_month = map(int, date_range['end'].split('-'))
-            
-            current_year = start_year
-            current_month = start_month
-            
-            while (current_year < end_year) or (current_year == end_year and current_month <= end_month):
-                month_key = f"{current_year}-{str(current_month).zfill(2)}"
-                months_list.append(month_key)
-                
-                current_month += 1
-                if current_month > 12:
-                    current_month = 1
-                    current_year += 1
+        table = build_report_table(employees, months_in_range(date_range))
         
         # Buat data untuk Excel
-        rows = []
-        for emp in employees:
-            row = {
-                'NAMA': emp.get('nama', '-'),
-                'NIK': emp.get('nik', '-'),
-                'JABATAN': emp.get('jabatan', '-'),
-                'STRUKTUR_LINI': emp.get('struktur', '-'),
-            }
-            
-            employee_total = 0
-            for month_key in months_list:
-                year, month = month_key.split('-')
-                value = 0
-                
-                if year in emp.get('bulanan', {}):
-                    month_data = emp['bulanan'][year].get(month_key, {})
-                    value = month_data.get('value', 0)
-                
-                row[month_key] = value
-                employee_total += value
-            
-            row['TOTAL'] = employee_total
-            rows.append(row)
+        df = table.report_frame(['NAMA', 'NIK', 'JABATAN', 'STRUKTUR_LINI'])
         
-        df = pd.DataFrame(rows)
+        struktur_safe = struktur_lini.replace(' ', '_').replace('/', '-')
+        basename = f"rekap_senam_kelompok_{struktur_safe}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        return table_export_response(df, basename, output_format, 'Rekap Senam Kelompok')
         
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Rekap Senam Kelompok')
-            
-            worksheet = writer.sheets['Rekap Senam Kelompok']
-            for column in worksheet.columns:
-                max_length = 0
-                column_letter = column[0].column_letter
-                for cell in column:
-                    try:
-                        if len(str(cell.value)) > max_length:
-                            max_length = len(str(cell.value))
-                    except:
-                        pass
-                adjusted_width = min(max_length + 2, 30)
-                worksheet.column_dimensions[column_letter].width = adjusted_width
+    except Exception as e:
+        print(f"Group Excel Export error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
+
+# ============================================
+# BUNDEL EXPORT KELOMPOK (satu tabel laporan, beberapa format sekaligus)
+# ============================================
+
+GROUP_BUNDLE_FORMATS = ('pdf',) + TABLE_EXPORT_FORMATS
+
+
+def render_group_bundle(report, parts, frame, formats, basename, renderer):
+    """Render semua format bundel dari tabel yang sama. Tabel (xlsx/csv/
+    parquet) dikerjakan process pool bersamaan dengan PDF di thread ini,
+    sehingga waktu total mengikuti renderer paling lambat.
+    Return [(nama file, bytes)] sesuai urutan `formats`."""
+    table_formats = [fmt for fmt in formats if fmt != 'pdf']
+    futures = {}
+    if PDF_WORKERS > 1 and table_formats and 'pdf' in formats:
+        pool = get_pdf_pool()
+        futures = {fmt: pool.submit(render_table_file, frame, fmt, 'Rekap Senam Kelompok') for fmt in table_formats}
+
+    try:
+        contents = {}
+        if 'pdf' in formats:
+            buffer = io.BytesIO()
+            write_group_report_pdf(buffer, report, parts, renderer)
+            contents['pdf'] = buffer.getvalue()
+        for fmt in table_formats:
+            contents[fmt] = futures[fmt].result() if fmt in futures else render_table_file(frame, fmt, 'Rekap Senam Kelompok')
+    finally:
+        for future in futures.values():
+            future.cancel()
+
+    return [(f'{basename}.{fmt}', contents[fmt]) for fmt in formats]
+
+
+@app.route('/api/export-group-bundle', methods=['POST'])
+@cached_export
+def export_group_bundle():
+    """Laporan kelompok dalam beberapa format (default PDF, XLSX, CSV) dalam
+    satu ZIP. Tabel laporan dihitung sekali; filter shift berlaku untuk semua
+    format. Payload sama dengan /api/export-group-pdf ditambah `formats`."""
+    try:
+        data = request.json or {}
+        employees, error = resolve_export_employees(data)
+        date_range = data.get('date_range', {})
+        shift_filter = data.get('shift_filter', 'all')
+        struktur_lini = data.get('struktur_lini', 'Semua')
+        renderer = data.get('renderer', 'platypus')
+        formats = data.get('formats') or ['pdf', 'xlsx', 'csv']
+        if isinstance(formats, str):
+            formats = formats.split(',')
+        formats = list(dict.fromkeys(formats))
+        
+        if error:
+            return jsonify({'success': False, 'message': error})
+        if renderer not in PDF_RENDERERS:
+            return jsonify({'success': False, 'message': f'Renderer PDF tidak dikenal: {renderer}'})
+        for fmt in formats:
+            format_error = None if fmt == 'pdf' else table_export_format_error(fmt)
+            if format_error:
+                return jsonify({'success': False, 'message': format_error})
+        if shift_filter != 'all':
+            employees = [emp for emp in employees if emp.get('shift_status', 'non_shift') == shift_filter]
+        if not employees:
+            return jsonify({'success': False, 'message': 'Tidak ada data pegawai'})
         
-        output.seek(0)
+        started = time.perf_counter()
+        report = build_report_table(employees, months_in_range(date_range))
+        parts = group_report_parts(report, date_range, shift_filter, struktur_lini)
+        frame = report.report_frame(['NAMA', 'NIK', 'JABATAN', 'STRUKTUR_LINI'])
         
         struktur_safe = struktur_lini.replace(' ', '_').replace('/', '-')
-        filename = f"rekap_senam_kelompok_{struktur_safe}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        shift_safe = shift_filter.replace('_', '-')
+        basename = f"rekap_senam_kelompok_{struktur_safe}_{shift_safe}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        
+        files = render_group_bundle(report, parts, frame, formats, basename, renderer)
+        print(f"DEBUG: Bundel kelompok {', '.join(formats)}: {len(report)} pegawai dalam {time.perf_counter() - started:.2f}s")
+        
+        return stream_download(stream_zip_files([(name, io.BytesIO(content)) for name, content in files]),
+                               f'{basename}.zip', 'application/zip')
+        
+    except Exception as e:
+        print(f"Group bundle export error: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
+
+
+# ============================================
+# PAKET STRUKTUR LINI (semua unit dalam satu kali proses)
+# ============================================
+
+STRUKTUR_KOSONG = '(Tanpa Struktur Lini)'
+XLSX_SHEET_INVALID = re.compile(r'[\[\]:*?/\\]')
+
+
+def group_by_struktur(report):
+    """Satu group-by atas tabel laporan. Hasil: nama unit (terurut), kode unit
+    per baris, dan baris tiap unit (urutan pegawai dipertahankan)"""
+    units = np.array([str(emp.get('struktur', '') or '').strip() or STRUKTUR_KOSONG for emp in report.employees], dtype=object)
+    names, codes = np.unique(units, return_inverse=True)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.cumsum(np.bincount(codes, minlength=len(names)))[:-1]
+    return names.tolist(), codes, np.split(order, bounds)
+
+
+def struktur_summary_frame(report, names, codes):
+    """Ringkasan per struktur lini (dihitung dengan bincount atas kode unit)"""
+    size = len(names)
+    employees = np.bincount(codes, minlength=size)
+    attendance = np.bincount(codes, weights=report.totals, minlength=size).astype(np.int64)
+    met_non_shift = np.bincount(codes, weights=report.gap_non_shift == 0, minlength=size).astype(np.int64)
+    met_shift = np.bincount(codes, weights=report.gap_shift == 0, minlength=size).astype(np.int64)
+
+    frame = pd.DataFrame({
+        'STRUKTUR_LINI': names,
+        'JUMLAH_PEGAWAI': employees,
+        'TOTAL_KEHADIRAN': attendance,
+        'RATA_RATA': np.round(attendance / np.maximum(employees, 1), 1),
+        'TERCAPAI_NON_SHIFT': met_non_shift,
+        'PERSEN_NON_SHIFT': np.round(met_non_shift * 100 / np.maximum(employees, 1), 1),
+        'TERCAPAI_SHIFT': met_shift,
+        'PERSEN_SHIFT': np.round(met_shift * 100 / np.maximum(employees, 1), 1),
+    })
+    total = len(report)
+    met_non_shift_all = int(met_non_shift.sum())
+    met_shift_all = int(met_shift.sum())
+    frame.loc[len(frame)] = [
+        'TOTAL RUMAH SAKIT', total, report.grand_total,
+        round(report.grand_total / total, 1) if total else 0,
+        met_non_shift_all, round(met_non_shift_all * 100 / total, 1) if total else 0,
+        met_shift_all, round(met_shift_all * 100 / total, 1) if total else 0,
+    ]
+    return frame
+
+
+def struktur_summary_story(report, summary, parts, date_range, shift_filter):
+    """Halaman ringkasan seluruh rumah sakit (awal paket PDF)"""
+    styles = PDF_SAMPLE_STYLES
+    story = []
+    
+    title_style = ParagraphStyle(
+        'TitleStyle',
+        parent=styles['Heading1'],
+        fontSize=11,
+        alignment=TA_CENTER,
+        spaceAfter=3,
+        textColor=colors.HexColor('#1a237e'),
+        fontName='Helvetica-Bold'
+    )
+    
+    subtitle_style = ParagraphStyle(
+        'SubtitleStyle',
+        parent=styles['Heading2'],
+        fontSize=9,
+        alignment=TA_CENTER,
+        spaceAfter=6,
+        textColor=colors.HexColor('#283593'),
+        fontName='Helvetica-Bold'
+    )
+    
+    story.append(pdf_letterhead("RINGKASAN REKAP SENAM PER STRUKTUR LINI", title_style, subtitle_style))
+    story.append(Spacer(1, 0.2*cm))
+    
+    info_data = [
+        ['JUMLAH UNIT', ':', str(len(summary) - 1), 'FILTER SHIFT', ':', SHIFT_TEXT_MAP.get(shift_filter, 'Semua')],
+        ['JUMLAH PEGAWAI', ':', str(len(report)), 'PERIODE', ':', f"{date_range.get('start', '-')} s/d {date_range.get('end', '-')}"]
+    ]
+    info_table = Table(info_data, colWidths=[2.8*cm, 0.3*cm, 4*cm, 2.8*cm, 0.3*cm, 4*cm])
+    info_table.setStyle(TableStyle([
+        ('FONTNAME', (0,0), (0,-1), 'Helvetica-Bold'),
+        ('FONTNAME', (3,0), (3,-1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0,0), (-1,-1), 7),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+        ('BOTTOMPADDING', (0,0), (-1,-1), 2),
+        ('TOPPADDING', (0,0), (-1,-1), 2),
+    ]))
+    story.append(info_table)
+    story.append(Spacer(1, 0.3*cm))
+    
+    cell_style = pdf_cell_style(6.5)
+    table_data = [['NO', 'STRUKTUR LINI', 'PEGAWAI', 'TOTAL\nKEHADIRAN', 'RATA-RATA',
+                   'TERCAPAI\nNON-SHIFT', 'TERCAPAI\nSHIFT']]
+    rows = summary.itertuples(index=False)
+    for idx, row in enumerate(rows, 1):
+        is_total = idx == len(summary)
+        table_data.append([
+            '' if is_total else str(idx),
+            pdf_text_cell(row.STRUKTUR_LINI, 6*cm - 6, cell_style),
+            str(row.JUMLAH_PEGAWAI),
+            str(row.TOTAL_KEHADIRAN),
+            f'{row.RATA_RATA:.1f}',
+            f'{row.TERCAPAI_NON_SHIFT} ({row.PERSEN_NON_SHIFT:.1f}%)',
+            f'{row.TERCAPAI_SHIFT} ({row.PERSEN_SHIFT:.1f}%)',
+        ])
+    
+    summary_table = Table(table_data, colWidths=[0.8*cm, 6*cm, 1.6*cm, 2*cm, 1.8*cm, 2.6*cm, 2.6*cm], repeatRows=1)
+    summary_table.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#1976d2')),
+        ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0,0), (-1,0), 6),
+        ('FONTSIZE', (0,1), (-1,-1), 6.5),
+        ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+        ('ALIGN', (1,1), (1,-1), 'LEFT'),
+        ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
+        ('GRID', (0,0), (-1,-1), 0.3, colors.grey),
+        ('ROWBACKGROUNDS', (0,1), (-1,-2), [colors.white, colors.HexColor('#f5f5f5')]),
+        ('BACKGROUND', (0,-1), (-1,-1), colors.HexColor('#e3f2fd')),
+        ('FONTNAME', (0,-1), (-1,-1), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0,0), (-1,-1), 2),
+        ('TOPPADDING', (0,0), (-1,-1), 2),
+    ]))
+    story.append(summary_table)
+    story.append(Spacer(1, 0.4*cm))
+    
+    # Keterangan target sama dengan bagian per unit (periode sama) -> satu form XObject
+    keterangan_table = Table([[parts.keterangan_para]], colWidths=[15*cm])
+    keterangan_table.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#fff9c4')),
+        ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#f9a825')),
+        ('LEFTPADDING', (0,0), (-1,-1), 6),
+        ('RIGHTPADDING', (0,0), (-1,-1), 6),
+        ('TOPPADDING', (0,0), (-1,-1), 5),
+        ('BOTTOMPADDING', (0,0), (-1,-1), 5),
+    ]))
+    story.append(FormBlock(f'keterangan:{parts.keterangan_text}', [keterangan_table]))
+    story.append(Spacer(1, 0.4*cm))
+    story.extend(pdf_signature_story(parts.signature_data))
+    return story
+
+
+def xlsx_sheet_name(name, used):
+    """Nama sheet Excel yang valid (maks 31 karakter, tanpa []:*?/\\) dan unik"""
+    base = XLSX_SHEET_INVALID.sub('-', name)[:31] or 'Sheet'
+    sheet, number = base, 2
+    while sheet.lower() in used:
+        suffix = f' ({number})'
+        sheet = base[:31 - len(suffix)] + suffix
+        number += 1
+    used.add(sheet.lower())
+    return sheet
+
+
+@app.route('/api/export-struktur-pack', methods=['POST'])
+@cached_export
+def export_struktur_pack():
+    """Paket manajemen: ringkasan rumah sakit + laporan kelompok setiap
+    struktur lini (PDF) dan satu sheet per struktur lini (Excel) dari satu
+    tabel laporan. format: 'zip' (PDF + Excel), 'pdf' atau 'excel'."""
+    try:
+        data = request.json or {}
+        date_range = data.get('date_range', {})
+        shift_filter = data.get('shift_filter', 'all')
+        output_format = data.get('format', 'zip')
+        
+        if output_format not in ('zip', 'pdf', 'excel'):
+            return jsonify({'success': False, 'message': f'Format paket tidak dikenal: {output_format}'})
+        
+        # Tanpa spesifikasi: seluruh pegawai dataset
+        if not data.get('employees') and not any(key in data for key in EXPORT_SPEC_KEYS):
+            data = dict(data, filter={})
+        employees, error = resolve_export_employees(data)
+        
+        if error:
+            return jsonify({'success': False, 'message': error})
+        if shift_filter != 'all':
+            employees = [emp for emp in employees if emp.get('shift_status', 'non_shift') == shift_filter]
+        if not employees:
+            return jsonify({'success': False, 'message': 'Tidak ada data pegawai'})
+        
+        # Satu tabel laporan untuk semua pegawai, lalu satu group-by per struktur lini
+        report = build_report_table(employees, months_in_range(date_range))
+        names, codes, unit_rows = group_by_struktur(report)
+        units = [(name, report.subset(rows)) for name, rows in zip(names, unit_rows)]
+        summary = struktur_summary_frame(report, names, codes)
+        print(f"DEBUG: Paket struktur lini: {len(units)} unit, {len(report)} pegawai")
+        
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        shift_safe = shift_filter.replace('_', '-')
+        basename = f"paket_struktur_lini_{shift_safe}_{timestamp}"
+        # File hasil ditulis ke file sementara lalu di-stream, tidak ditahan di memori
+        files = []
+        
+        if output_format in ('zip', 'pdf'):
+            output = tempfile.TemporaryFile()
+            files.append((f'{basename}.pdf', output, 'application/pdf'))
+            doc = SimpleDocTemplate(
+                output,
+                pagesize=A4,
+                rightMargin=1.2*cm,
+                leftMargin=1.2*cm,
+                topMargin=0.8*cm,
+                bottomMargin=1.5*cm
+            )
+            parts = group_report_parts(report, date_range, shift_filter, 'Semua')
+            story = struktur_summary_story(report, summary, parts, date_range, shift_filter)
+            for name, unit_report in units:
+                story.append(PageBreak())
+                story.extend(group_report_story(doc, unit_report, group_report_parts(unit_report, date_range, shift_filter, name)))
+            build_pdf_story(doc, story)
+            output.seek(0)
+        
+        if output_format in ('zip', 'excel'):
+            workbook = Workbook(write_only=True)
+            used = set()
+            write_xlsx_sheet(workbook, xlsx_sheet_name('Ringkasan', used), summary)
+            for name, unit_report in units:
+                df = unit_report.report_frame(['NAMA', 'NIK', 'JABATAN', 'STRUKTUR_LINI'])
+                write_xlsx_sheet(workbook, xlsx_sheet_name(name, used), df)
+            files.append((f'{basename}.xlsx', xlsx_tempfile(workbook),
+                          'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'))
+        
+        if output_format == 'zip':
+            print(f"DEBUG: Streaming struktur pack: {basename}.zip")
+            return stream_download(stream_zip_files([(name, output) for name, output, _ in files]),
+                                   f'{basename}.zip', 'application/zip')
+        
+        filename, output, mimetype = files[0]
+        print(f"DEBUG: Returning struktur pack: {filename}")
         
         return send_file(
             output,
             as_attachment=True,
             download_name=filename,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            mimetype=mimetype
         )
         
     except Exception as e:
-        print(f"Group Excel Export error: {str(e)}")
+        print(f"Struktur pack export error: {str(e)}")
+        import traceback
+        traceback.print_exc()
         return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
 
 @app.route('/api/validate-template', methods=['POST'])
@@ -2192,6 +4747,421 @@ def serve_static(filename):
 def health():
     return jsonify({'status': 'ok', 'message': 'Server is running'})
 
+@app.route('/api/export-cache')
+def export_cache_info():
+    """Statistik cache export (per proses) dan isi folder cache"""
+    entries, size = 0, 0
+    if os.path.isdir(EXPORT_CACHE_FOLDER):
+        for entry in os.scandir(EXPORT_CACHE_FOLDER):
+            if entry.name.endswith('.bin'):
+                entries += 1
+                size += entry.stat().st_size
+    with _export_cache_lock:
+        stats = dict(export_cache_stats)
+    return jsonify({
+        'success': True,
+        'stats': stats,
+        'renders_saved': stats['hits'] + stats['coalesced'],
+        'entries': entries,
+        'size': size,
+        'max_size': EXPORT_CACHE_MAX_BYTES
+    })
+
+
+# ============================================
+# ANTREAN EXPORT (job di database, dikerjakan proses worker terpisah)
+# ============================================
+
+# Jenis job -> view export yang merender file (payload = body JSON endpoint aslinya)
+EXPORT_JOB_RENDERERS = {
+    'excel': export_excel,
+    'group-excel': export_group_excel,
+    'attendance-excel': export_attendance_excel,
+    'no-attendance-excel': export_no_attendance_excel,
+    'pdf': export_pdf,
+    'employee-pdfs': export_employee_pdfs,
+    'group-pdf': export_group_pdf,
+    'group-bundle': export_group_bundle,
+    'struktur-pack': export_struktur_pack,
+    'attendance-pdf': export_attendance_pdf,
+    'no-attendance-pdf': export_no_attendance_pdf,
+}
+
+EXPORT_JOB_TIMEOUT = timedelta(minutes=int(os.environ.get('EXPORT_JOB_TIMEOUT_MINUTES', '30')))
+EXPORT_JOB_MAX_ATTEMPTS = int(os.environ.get('EXPORT_JOB_MAX_ATTEMPTS', '3'))
+EXPORT_JOB_RETENTION = timedelta(hours=24)
+
+
+def export_job_info(job):
+    """Status job untuk respons JSON (tanpa isi file)"""
+    info = {
+        'success': True,
+        'job_id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'message': job.message,
+        'attempts': job.attempts,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'status_url': f'/api/export-jobs/{job.id}',
+    }
+    if job.status == 'queued':
+        info['position'] = ExportJob.query.filter(
+            ExportJob.status == 'queued', ExportJob.id < job.id
+        ).count() + 1
+    if job.status == 'done':
+        info.update({
+            'filename': job.filename,
+            'size': job.size,
+            'download_url': f'/api/export-jobs/{job.id}/download',
+        })
+    return info
+
+
+def claim_export_job(worker_id):
+    """Ambil satu job antrean secara atomik.
+
+    Klaim berupa UPDATE bersyarat (status masih 'queued'); bila worker lain
+    lebih dulu mengklaim, rowcount = 0 dan kandidat berikutnya dicoba. Cara ini
+    berlaku sama di SQLite dan PostgreSQL tanpa SELECT ... FOR UPDATE."""
+    while True:
+        candidate = db.session.query(ExportJob.id).filter(
+            ExportJob.status == 'queued'
+        ).order_by(ExportJob.id).first()
+        if candidate is None:
+            db.session.rollback()
+            return None
+
+        claimed = db.session.execute(
+            db.update(ExportJob)
+            .where(ExportJob.id == candidate.id, ExportJob.status == 'queued')
+            .values(status='running', worker=worker_id, started_at=datetime.now(),
+                    attempts=ExportJob.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        if claimed.rowcount == 1:
+            return db.session.get(ExportJob, candidate.id)
+
+
+def requeue_stale_export_jobs():
+    """Job 'running' yang melewati batas waktu (worker mati) dikembalikan ke
+    antrean, atau ditandai gagal bila jatah percobaan sudah habis"""
+    deadline = datetime.now() - EXPORT_JOB_TIMEOUT
+    stale = (ExportJob.status == 'running', ExportJob.started_at < deadline)
+    db.session.execute(
+        db.update(ExportJob)
+        .where(*stale, ExportJob.attempts >= EXPORT_JOB_MAX_ATTEMPTS)
+        .values(status='failed', finished_at=datetime.now(),
+                message='Worker berhenti sebelum export selesai')
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        db.update(ExportJob)
+        .where(*stale, ExportJob.attempts < EXPORT_JOB_MAX_ATTEMPTS)
+        .values(status='queued', worker=None)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def purge_export_jobs():
+    """Hapus job selesai/gagal yang lebih tua dari masa simpan (sama dengan data upload)"""
+    db.session.execute(
+        db.delete(ExportJob)
+        .where(ExportJob.status.in_(('done', 'failed')),
+               ExportJob.finished_at < datetime.now() - EXPORT_JOB_RETENTION)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+
+def render_export_job(job):
+    """Render job dengan view export aslinya. Hasil: (isi file, nama file, mimetype)
+    atau pesan error dari view."""
+    payload = json.loads(job.payload_json)
+    legacy = payload.get('employees') or payload.get('data')
+    if not legacy and any(key in payload for key in EXPORT_SPEC_KEYS):
+        # Spesifikasi filter diresolve terhadap dataset saat job dibuat
+        index = get_dataset_index()
+        if index is None or index.version != job.dataset_version:
+            raise ValueError('Data sudah berubah sejak export diminta, silakan export ulang')
+
+    view = EXPORT_JOB_RENDERERS[job.kind]
+    with app.test_request_context(method='POST', json=payload):
+        response = app.make_response(view())
+    response.direct_passthrough = False
+    body = response.get_data()
+    response.close()
+
+    if response.mimetype == 'application/json':
+        result = json.loads(body)
+        raise ValueError(result.get('message') or 'Export gagal')
+
+    return body, response_filename(response, f'export_{job.id}'), response.mimetype
+
+
+def run_export_job(job):
+    """Kerjakan satu job yang sudah diklaim dan simpan hasil/errornya"""
+    started = time.perf_counter()
+    try:
+        body, filename, mimetype = render_export_job(job)
+        job.result = body
+        job.filename = filename
+        job.mimetype = mimetype
+        job.size = len(body)
+        job.status = 'done'
+        job.message = None
+    except Exception as e:
+        db.session.rollback()
+        print(f"Export job {job.id} error: {str(e)}")
+        job.status = 'failed'
+        job.message = f'Terjadi kesalahan: {str(e)}'
+    job.finished_at = datetime.now()
+    db.session.commit()
+    print(f"DEBUG: Export job {job.id} ({job.kind}) {job.status} dalam {time.perf_counter() - started:.2f}s")
+
+
+@app.route('/api/export-jobs', methods=['POST'])
+def enqueue_export_job():
+    """Masukkan export ke antrean; body: {kind, payload} dengan payload sama
+    seperti body endpoint export yang bersangkutan"""
+    try:
+        data = request.json or {}
+        kind = data.get('kind')
+        payload = data.get('payload') or {}
+
+        if kind not in EXPORT_JOB_RENDERERS:
+            return jsonify({'success': False, 'message': f'Jenis export tidak dikenal: {kind}'})
+        if not isinstance(payload, dict):
+            return jsonify({'success': False, 'message': 'Payload export tidak valid'})
+
+        index = get_dataset_index()
+        job = ExportJob(
+            kind=kind,
+            payload_json=json.dumps(payload, ensure_ascii=False),
+            dataset_version=index.version if index is not None else None,
+            status='queued',
+            created_at=datetime.now()
+        )
+        db.session.add(job)
+        db.session.commit()
+        print(f"DEBUG: Export job {job.id} ({kind}) masuk antrean")
+
+        return jsonify(export_job_info(job))
+
+    except Exception as e:
+        db.session.rollback()
+        print(f"Enqueue export error: {str(e)}")
+        return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
+
+
+@app.route('/api/export-jobs/<int:job_id>')
+def export_job_status(job_id):
+    try:
+        job = db.session.get(ExportJob, job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': 'Job export tidak ditemukan'}), 404
+        return jsonify(export_job_info(job))
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
+
+
+@app.route('/api/export-jobs/<int:job_id>/download')
+def export_job_download(job_id):
+    try:
+        job = db.session.get(ExportJob, job_id)
+        if job is None:
+            return jsonify({'success': False, 'message': 'Job export tidak ditemukan'}), 404
+        if job.status != 'done':
+            return jsonify({'success': False, 'message': f'Export belum selesai (status: {job.status})'}), 409
+
+        return send_file(
+            io.BytesIO(job.result),
+            as_attachment=True,
+            download_name=job.filename,
+            mimetype=job.mimetype
+        )
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Terjadi kesalahan: {str(e)}'})
+
+
+@app.cli.command('export-worker')
+@click.option('--once', is_flag=True, help='Kerjakan antrean yang ada lalu berhenti')
+@click.option('--poll', default=2.0, type=float, help='Jeda (detik) saat antrean kosong')
+def export_worker(once, poll):
+    """Worker antrean export; jalankan sebanyak yang dibutuhkan (boleh di host lain
+    selama memakai DATABASE_URL yang sama)"""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    click.echo(f"Export worker {worker_id} berjalan")
+    try:
+        db.create_all()
+    except Exception as e:
+        print(f"Bypass DB init error: {e}")
+
+    while True:
+        try:
+            requeue_stale_export_jobs()
+            job = claim_export_job(worker_id)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Export worker error: {str(e)}")
+            job = None
+
+        if job is not None:
+            run_export_job(job)
+            continue
+        if once:
+            break
+        try:
+            purge_export_jobs()
+        except Exception as e:
+            db.session.rollback()
+            print(f"Export worker error: {str(e)}")
+        time.sleep(poll)
+
+
+# ============================================
+# PEMANASAN CACHE EXPORT (setelah upload, di thread latar prioritas rendah)
+# ============================================
+
+# Export yang dirender lebih dulu, dipisah koma; kosong / '0' = nonaktif.
+# Default nonaktif di Vercel karena thread latar berhenti bersama request.
+EXPORT_WARM_TARGETS = [
+    target.strip() for target in os.environ.get('EXPORT_WARM', '' if is_vercel else 'group-pdf,excel').split(',')
+    if target.strip() not in ('', '0')
+]
+
+
+def export_warm_requests(index, month):
+    """(view, payload) untuk setiap export yang dipanaskan. Payload sama dengan
+    yang dikirim dashboard agar kunci cache-nya cocok."""
+    date_range = {'start': month, 'end': month, 'active': True}
+    jobs = []
+    if 'group-pdf' in EXPORT_WARM_TARGETS:
+        for struktur in index.filters.counts('struktur', None):
+            if struktur:
+                jobs.append((export_group_pdf, {
+                    'filter': {'struktur': struktur},
+                    'date_range': date_range,
+                    'shift_filter': 'all',
+                    'struktur_lini': struktur,
+                }))
+    if 'excel' in EXPORT_WARM_TARGETS:
+        jobs.append((export_excel, {'filter': {}}))
+    return jobs
+
+
+def warm_export_cache():
+    """Hitung agregat periode lalu render export populer ke cache disk.
+    Berhenti bila ada upload baru di tengah jalan."""
+    try:
+        # Prioritas rendah hanya untuk thread ini (Linux: nice per thread)
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except (AttributeError, OSError):
+        pass
+
+    started = time.perf_counter()
+    with app.app_context():
+        index = get_dataset_index()
+        if index is None:
+            return
+        month = latest_report_month(index)
+        index.report_table([month])
+
+        warmed = 0
+        for view, payload in export_warm_requests(index, month):
+            current = get_dataset_index()
+            if current is None or current.version != index.version:
+                print("DEBUG: Pemanasan cache dihentikan, data sudah berubah")
+                return
+            try:
+                with app.test_request_context(method='POST', json=payload, environ_overrides={'export.warm': True}):
+                    # Body dikonsumsi habis agar tersimpan ke cache
+                    with app.make_response(view()) as response:
+                        for _ in response.response:
+                            pass
+                warmed += 1
+            except Exception as e:
+                print(f"Export warm error ({view.__name__}): {e}")
+        print(f"DEBUG: Pemanasan cache {month}: {warmed} export dalam {time.perf_counter() - started:.2f}s")
+
+
+def start_export_warming():
+    """Jalankan pemanasan cache di thread latar setelah upload berhasil"""
+    if not EXPORT_WARM_TARGETS or EXPORT_CACHE_MAX_BYTES <= 0:
+        return None
+    thread = threading.Thread(target=warm_export_cache, name='export-warm', daemon=True)
+    thread.start()
+    return thread
+
+
+# ============================================
+# CLI: BENCHMARK RENDERER PDF
+# ============================================
+
+BENCH_PDF_ENDPOINTS = (
+    '/api/export-group-pdf',
+    '/api/export-attendance-pdf',
+    '/api/export-no-attendance-pdf',
+)
+
+
+@app.cli.command('bench-pdf')
+@click.option('--rows', default=0, type=int, help='Perbanyak data upload terakhir sampai N pegawai (0 = apa adanya)')
+@click.option('--start', default=None, help='Bulan awal YYYY-MM (default: bulan pertama yang berisi data)')
+@click.option('--end', default=None, help='Bulan akhir YYYY-MM (default: bulan terakhir yang berisi data)')
+@click.option('--repeat', default=3, type=int, help='Jumlah pengulangan, diambil waktu tercepat')
+def bench_pdf(rows, start, end, repeat):
+    """Bandingkan waktu render PDF platypus vs canvas pada data upload terakhir"""
+    index = get_dataset_index()
+    if index is None or len(index) == 0:
+        click.echo('Belum ada data upload')
+        return
+
+    active = np.flatnonzero(index.attendance.any(axis=0))
+    if len(active):
+        start = start or INDEX_MONTHS[active[0]]
+        end = end or INDEX_MONTHS[active[-1]]
+    date_range = {'start': start, 'end': end, 'active': True}
+
+    payload = {'filter': {}, 'date_range': date_range}
+    employees = index.employees
+    if rows > len(employees):
+        # Payload daftar pegawai (format lama) untuk roster yang lebih besar dari data upload
+        payload = {
+            'employees': (employees * (rows // len(employees) + 1))[:rows],
+            'date_range': date_range
+        }
+    total = len(payload.get('employees', employees))
+
+    click.echo(f"Benchmark PDF: {total} pegawai, periode {start} s/d {end}, {repeat}x")
+    client = app.test_client()
+    for endpoint in BENCH_PDF_ENDPOINTS:
+        results = {}
+        for renderer in PDF_RENDERERS:
+            best, size = None, 0
+            for _ in range(repeat):
+                started = time.perf_counter()
+                # Log DEBUG dari endpoint tidak ikut dicetak; cache export dilewati
+                # agar setiap pengulangan benar-benar merender
+                with contextlib.redirect_stdout(io.StringIO()):
+                    response = client.post(endpoint, json=dict(payload, renderer=renderer),
+                                           environ_overrides={'export.nocache': True})
+                    body = response.data
+                elapsed = time.perf_counter() - started
+                if response.mimetype != 'application/pdf':
+                    click.echo(f"{endpoint} [{renderer}] gagal: {response.get_json()}")
+                    break
+                best = elapsed if best is None else min(best, elapsed)
+                size = len(body)
+            results[renderer] = best
+            if best is not None:
+                click.echo(f"{endpoint:32} {renderer:9} {best:8.2f}s {size / 1024:10.1f} KB")
+        if results.get('platypus') and results.get('canvas'):
+            click.echo(f"{endpoint:32} {'speedup':9} {results['platypus'] / results['canvas']:8.2f}x")
+
 if __name__ == '__main__':
     clear_temp_data()
     
@@ -17,6 +17,15 @@ let noAttendanceEmployees = [];
 let attendanceEmployees = [];
 let currentSort = { column: "nama", direction: "asc" };
 
+// Hasil pencarian server (/api/search) untuk kata kunci aktif
+let searchResultIds = null;
+let searchResultTerm = "";
+
+// Cache urutan id dari /api/sort-order, per kolom & arah
+let sortOrderCache = {};
+const nameCollator = new Intl.Collator("id", { sensitivity: "base", numeric: true });
+let tableSortActive = false;
+
 // Filter states
 let shiftStatus = "non_shift";
 let dateRangeFilter = {
@@ -158,6 +167,13 @@ function hideLoading() {
 async function loadData() {
   try {
     showLoading("Memuat data...");
+
+    // Facet filter kecil & sudah dihitung server: tampilkan dropdown lebih dulu
+    const facetsRequest = fetchFacets().then((facets) => {
+      if (facets) populateFilters(facets);
+      return facets;
+    });
+
     const response = await fetch("/api/data");
 
     if (!response.ok) {
@@ -165,12 +181,16 @@ async function loadData() {
     }
 
     dataGlobal = await response.json();
+    searchResultIds = null;
+    searchResultTerm = "";
+    sortOrderCache = {};
+    tableSortActive = false;
     filteredData = [...dataGlobal];
     filteredDataForChart = [...dataGlobal];
 
     updateDataStatus();
     renderDashboard();
-    populateFilters();
+    if (!(await facetsRequest)) populateFilters();
     hideLoading();
 
     if (dataGlobal.length === 0) {
@@ -660,7 +680,20 @@ function updateTableInfo() {
   ).textContent = `Menampilkan ${start}-${end} dari ${total} pegawai${filterText}`;
 }
 
-function sortTable(column) {
+async function getSortOrder(column, direction) {
+  const key = `${column}:${direction}`;
+  if (!sortOrderCache[key]) {
+    const response = await fetch(
+      `/api/sort-order?column=${encodeURIComponent(column)}&direction=${direction}`
+    );
+    const result = await response.json();
+    if (!result.success) return null;
+    sortOrderCache[key] = result.ids;
+  }
+  return sortOrderCache[key];
+}
+
+async function sortTable(column) {
   if (currentSort.column === column) {
     currentSort.direction = currentSort.direction === "asc" ? "desc" : "asc";
   } else {
@@ -668,32 +701,47 @@ function sortTable(column) {
     currentSort.direction = "asc";
   }
 
-  filteredData.sort((a, b) => {
-    let aVal = a[column];
-    let bVal = b[column];
+  const serverColumn =
+    column === "total_all" && activeYearFilter && activeYearFilter !== "all"
+      ? `tahun_${activeYearFilter}`
+      : column;
+  currentSort.serverColumn = serverColumn;
+  tableSortActive = true;
 
-    if (column === "total_all") {
-      aVal =
-        activeYearFilter && activeYearFilter !== "all"
-          ? a.tahunan[activeYearFilter] || 0
-          : a.total_all;
-      bVal =
-        activeYearFilter && activeYearFilter !== "all"
-          ? b.tahunan[activeYearFilter] || 0
-          : b.total_all;
-    }
+  let order = null;
+  try {
+    order = await getSortOrder(serverColumn, currentSort.direction);
+  } catch (error) {
+    console.error("Sort order error:", error);
+  }
 
-    if (typeof aVal === "string") {
-      aVal = aVal.toLowerCase();
-      bVal = bVal.toLowerCase();
-    }
+  if (order && order.length === dataGlobal.length) {
+    // Ambil urutan server lalu saring sesuai data yang sedang tampil
+    const visible = new Map(filteredData.map((item) => [item.id, item]));
+    filteredData = order.filter((id) => visible.has(id)).map((id) => visible.get(id));
+  } else {
+    filteredData.sort((a, b) => {
+      let aVal = a[column];
+      let bVal = b[column];
+
+      if (column === "total_all") {
+        aVal =
+          activeYearFilter && activeYearFilter !== "all"
+            ? a.tahunan[activeYearFilter] || 0
+            : a.total_all;
+        bVal =
+          activeYearFilter && activeYearFilter !== "all"
+            ? b.tahunan[activeYearFilter] || 0
+            : b.total_all;
+      }
 
-    if (currentSort.direction === "asc") {
-      return aVal > bVal ? 1 : -1;
-    } else {
-      return aVal < bVal ? 1 : -1;
-    }
-  });
+      const result =
+        typeof aVal === "string"
+          ? nameCollator.compare(aVal, bVal || "")
+          : aVal - bVal;
+      return currentSort.direction === "asc" ? result : -result;
+    });
+  }
 
   currentPage = 1;
   renderTable();
@@ -704,48 +752,123 @@ function sortTable(column) {
 // FILTER FUNCTIONS
 // ============================================
 
-function populateFilters() {
-  const tempatSet = new Set();
-  const kelompokSet = new Set();
-  const statusSet = new Set();
-  const strukturSet = new Set();
+async function fetchFacets(params = "") {
+  try {
+    const response = await fetch(`/api/facets${params ? "?" + params : ""}`);
+    const result = await response.json();
+    return result.success ? result.facets : null;
+  } catch (error) {
+    console.error("Facets error:", error);
+    return null;
+  }
+}
 
+function buildFacetsFromData() {
+  const facets = { tempat: {}, kelompok: {}, status: {}, struktur: {} };
   dataGlobal.forEach((item) => {
-    if (item.tempat) tempatSet.add(item.tempat);
-    if (item.kelompok) kelompokSet.add(item.kelompok);
-    if (item.status) statusSet.add(item.status);
-    if (item.struktur) strukturSet.add(item.struktur);
+    Object.keys(facets).forEach((column) => {
+      if (item[column]) {
+        facets[column][item[column]] = (facets[column][item[column]] || 0) + 1;
+      }
+    });
+  });
+
+  const result = {};
+  Object.entries(facets).forEach(([column, counts]) => {
+    result[column] = Object.keys(counts)
+      .sort()
+      .map((value) => ({ value, count: counts[value] }));
+  });
+  return result;
+}
+
+function currentFilterSpec() {
+  const checkedStatus = Array.from(
+    document.querySelectorAll(".status-checkbox:checked")
+  ).map((cb) => cb.value);
+  const allStatus = document.querySelectorAll(".status-checkbox");
+  const struktur = document.getElementById("filterStruktur").value;
+
+  return {
+    tempat: document.getElementById("filterTempat").value,
+    kelompok: document.getElementById("filterKelompok").value,
+    status:
+      checkedStatus.length === allStatus.length ? [] : checkedStatus,
+    struktur: struktur && struktur !== "all" ? struktur : "",
+    q: document.getElementById("searchInput").value.trim(),
+  };
+}
+
+function filterSpecToParams(spec) {
+  const params = new URLSearchParams();
+  Object.entries(spec).forEach(([key, value]) => {
+    if (Array.isArray(value)) {
+      value.forEach((item) => params.append(key, item));
+    } else if (value) {
+      params.append(key, value);
+    }
+  });
+  return params.toString();
+}
+
+// Spesifikasi export ringkas: server meresolve pegawai dari dataset tersimpan,
+// jadi data pegawai tidak perlu dikirim ulang dari browser
+function exportSpec(extra = {}) {
+  return { filter: currentFilterSpec(), ...extra };
+}
+
+// Urutan tabel yang sedang tampil (hanya bila user memilih kolom urut)
+function tableSortSpec() {
+  if (!tableSortActive) return {};
+  return {
+    sort: { column: currentSort.serverColumn, direction: currentSort.direction },
+  };
+}
+
+function tableExportSpec() {
+  return exportSpec(tableSortSpec());
+}
+
+function attendanceExportSpec(mode) {
+  return exportSpec({
+    attendance: mode,
+    attendance_year: activeYearFilter,
+    ...tableSortSpec(),
   });
+}
+
+function populateFilters(facets) {
+  facets = facets || buildFacetsFromData();
 
   const tempatSelect = document.getElementById("filterTempat");
   tempatSelect.innerHTML = '<option value="">Semua Tempat</option>';
-  [...tempatSet].sort().forEach((tempat) => {
+  facets.tempat.forEach(({ value, count }) => {
     const option = document.createElement("option");
-    option.value = tempat;
-    option.textContent = tempat;
+    option.value = value;
+    option.textContent = `${value} (${count})`;
     tempatSelect.appendChild(option);
   });
 
   const kelompokSelect = document.getElementById("filterKelompok");
   kelompokSelect.innerHTML = '<option value="">Semua Kelompok</option>';
-  [...kelompokSet].sort().forEach((kelompok) => {
+  facets.kelompok.forEach(({ value, count }) => {
     const option = document.createElement("option");
-    option.value = kelompok;
-    option.textContent = kelompok;
+    option.value = value;
+    option.textContent = `${value} (${count})`;
     kelompokSelect.appendChild(option);
   });
 
   const statusOptions = document.getElementById("filterStatusOptions");
   if (statusOptions) {
     statusOptions.innerHTML = '';
-    [...statusSet].sort().forEach((status) => {
+    facets.status.forEach(({ value, count }) => {
       const div = document.createElement("div");
       div.className = "checkbox-item";
       div.style.marginBottom = "8px";
       div.innerHTML = `
         <label>
-          <input type="checkbox" class="status-checkbox" value="${status}" onchange="toggleIndividualStatusFilter()" checked>
-          ${status}
+          <input type="checkbox" class="status-checkbox" value="${value}" onchange="toggleIndividualStatusFilter()" checked>
+          ${value} (<span class="facet-count">${count}</span>)
         </label>
       `;
       statusOptions.appendChild(div);
@@ -756,15 +879,44 @@ function populateFilters() {
   const strukturSelect = document.getElementById("filterStruktur");
   if (strukturSelect) {
     strukturSelect.innerHTML = '<option value="all">Semua Struktur</option>';
-    [...strukturSet].sort().forEach((struktur) => {
+    facets.struktur.forEach(({ value, count }) => {
       const option = document.createElement("option");
-      option.value = struktur;
-      option.textContent = struktur;
+      option.value = value;
+      option.textContent = `${value} (${count})`;
       strukturSelect.appendChild(option);
     });
   }
 }
 
+// Perbarui jumlah pada pilihan filter sesuai filter aktif di kolom lain
+async function refreshFacetCounts() {
+  const facets = await fetchFacets(filterSpecToParams(currentFilterSpec()));
+  if (!facets) return;
+
+  [
+    ["filterTempat", "tempat"],
+    ["filterKelompok", "kelompok"],
+    ["filterStruktur", "struktur"],
+  ].forEach(([elementId, column]) => {
+    const select = document.getElementById(elementId);
+    if (!select) return;
+    const counts = new Map(facets[column].map((f) => [f.value, f.count]));
+    Array.from(select.options).forEach((option) => {
+      if (counts.has(option.value)) {
+        option.textContent = `${option.value} (${counts.get(option.value)})`;
+      }
+    });
+  });
+
+  const statusCounts = new Map(facets.status.map((f) => [f.value, f.count]));
+  document.querySelectorAll(".status-checkbox").forEach((checkbox) => {
+    const countEl = checkbox.parentElement.querySelector(".facet-count");
+    if (countEl && statusCounts.has(checkbox.value)) {
+      countEl.textContent = statusCounts.get(checkbox.value);
+    }
+  });
+}
+
 function toggleAllStatusFilters() {
   const isChecked = document.getElementById("filterStatusAll").checked;
   const checkboxes = document.querySelectorAll(".status-checkbox");
@@ -924,55 +1076,43 @@ function applyFilters() {
   strukturLiniFilter = struktur;
 
   filteredData = [...dataGlobal];
-  filteredDataForChart = [...dataGlobal];
 
   if (searchTerm) {
-    filteredData = filteredData.filter(
-      (item) =>
-        (item.nama && item.nama.toLowerCase().includes(searchTerm)) ||
-        (item.nik && item.nik.toLowerCase().includes(searchTerm)) ||
-        (item.jabatan && item.jabatan.toLowerCase().includes(searchTerm)) ||
-        (item.tempat && item.tempat.toLowerCase().includes(searchTerm))
-    );
-
-    filteredDataForChart = filteredDataForChart.filter(
-      (item) =>
-        (item.nama && item.nama.toLowerCase().includes(searchTerm)) ||
-        (item.nik && item.nik.toLowerCase().includes(searchTerm)) ||
-        (item.jabatan && item.jabatan.toLowerCase().includes(searchTerm)) ||
-        (item.tempat && item.tempat.toLowerCase().includes(searchTerm))
-    );
+    if (searchResultIds && searchResultTerm === searchTerm) {
+      // Pakai hasil indeks server, tidak perlu scan semua pegawai
+      filteredData = filteredData.filter((item) => searchResultIds.has(item.id));
+    } else {
+      filteredData = filteredData.filter(
+        (item) =>
+          (item.nama && item.nama.toLowerCase().includes(searchTerm)) ||
+          (item.nik && item.nik.toLowerCase().includes(searchTerm)) ||
+          (item.jabatan && item.jabatan.toLowerCase().includes(searchTerm)) ||
+          (item.tempat && item.tempat.toLowerCase().includes(searchTerm))
+      );
+    }
   }
 
   if (tempat) {
     filteredData = filteredData.filter((item) => item.tempat === tempat);
-    filteredDataForChart = filteredDataForChart.filter(
-      (item) => item.tempat === tempat
-    );
   }
   if (kelompok) {
     filteredData = filteredData.filter((item) => item.kelompok === kelompok);
-    filteredDataForChart = filteredDataForChart.filter(
-      (item) => item.kelompok === kelompok
-    );
   }
   if (!isAllStatusSelected) {
     filteredData = filteredData.filter((item) => selectedStatuses.includes(item.status));
-    filteredDataForChart = filteredDataForChart.filter(
-      (item) => selectedStatuses.includes(item.status)
-    );
   }
 
   if (struktur && struktur !== "all") {
     filteredData = filteredData.filter((item) => item.struktur === struktur);
-    filteredDataForChart = filteredDataForChart.filter(
-      (item) => item.struktur === struktur
-    );
   }
 
+  filteredDataForChart = [...filteredData];
+  tableSortActive = false;
+
   currentPage = 1;
   renderDashboard();
   updateFilterInfo();
+  refreshFacetCounts();
 }
 
 function updateSelectAllState() {
@@ -1073,14 +1213,37 @@ function resetAllFilters() {
 
   filteredData = [...dataGlobal];
   filteredDataForChart = [...dataGlobal];
+  tableSortActive = false;
 
   currentPage = 1;
   renderDashboard();
   updateFilterInfo();
+  refreshFacetCounts();
   showToast("Semua filter telah direset", "info");
 }
 
-function performSearch(keyword) {
+async function performSearch(keyword) {
+  const term = (keyword || "").trim();
+  searchResultIds = null;
+  searchResultTerm = "";
+
+  if (term) {
+    try {
+      const response = await fetch(`/api/search?q=${encodeURIComponent(term)}`);
+      const result = await response.json();
+      // Abaikan respon lama jika user sudah mengetik kata kunci lain
+      if (
+        result.success &&
+        document.getElementById("searchInput").value.trim() === term
+      ) {
+        searchResultIds = new Set(result.ids);
+        searchResultTerm = term.toLowerCase();
+      }
+    } catch (error) {
+      console.error("Search error:", error);
+    }
+  }
+
   applyFilters();
 }
 
@@ -1434,6 +1597,28 @@ function updateMonthlyDateRangeInfo() {
   }
 }
 
+// Nomor permintaan target terakhir; respons yang terlambat diabaikan
+let monthlyTargetRequest = 0;
+
+async function loadMonthlyTarget(params) {
+  const requestId = ++monthlyTargetRequest;
+  let employee = null;
+  try {
+    const response = await fetch(`/api/compliance?${params.toString()}`);
+    const result = await response.json();
+    if (result.success && result.employees && result.employees.length > 0) {
+      employee = result.employees[0];
+    }
+  } catch (error) {
+    console.error("Compliance error:", error);
+  }
+
+  const targetEl = document.getElementById("monthlyTargetValue");
+  if (requestId !== monthlyTargetRequest || !targetEl) return;
+  targetEl.textContent = employee ? employee.target : "-";
+  targetEl.className = employee ? (employee.passed ? "good" : "bad") : "";
+}
+
 function renderMonthlyData() {
   const ctx = document.getElementById("monthlyChart");
   const tbody = document.getElementById("monthlyTableBody");
@@ -1514,11 +1699,17 @@ function renderMonthlyData() {
   let totalAttendance = allMonths.reduce((sum, m) => sum + m.value, 0);
   let totalMonths = allMonths.length;
 
-  let targetTotal;
-  if (shiftStatus === "shift") {
-    targetTotal = 40;
-  } else {
-    targetTotal = 56;
+  // Target dihitung server (/api/compliance), periode sama dengan export PDF:
+  // rentang tanggal, atau 24 bulan sampai bulan terakhir yang ditampilkan
+  const targetParams = new URLSearchParams({
+    ids: currentDetailData.id,
+    shift_status: shiftStatus,
+  });
+  if (dateRangeFilter.active) {
+    targetParams.append("start", dateRangeFilter.start);
+    targetParams.append("end", dateRangeFilter.end);
+  } else if (allMonths.length > 0) {
+    targetParams.append("end", allMonths[allMonths.length - 1].key);
   }
 
   // Populate table
@@ -1537,7 +1728,6 @@ function renderMonthlyData() {
   // Summary cards
   const percentage =
     totalMonths > 0 ? ((totalAttendance / totalMonths) * 100).toFixed(1) : 0;
-  const statusClass = totalAttendance >= targetTotal ? "good" : "bad";
 
   summaryContainer.innerHTML = `
     <div class="summary-card">
@@ -1566,7 +1756,7 @@ function renderMonthlyData() {
         <span class="summary-label">Target (${
           shiftStatus === "shift" ? "50%" : "70%"
         })</span>
-        <h3 class="${statusClass}">${targetTotal}</h3>
+        <h3 id="monthlyTargetValue">…</h3>
       </div>
     </div>
     <div class="summary-card">
@@ -1582,6 +1772,8 @@ function renderMonthlyData() {
     </div>
   `;
 
+  loadMonthlyTarget(targetParams);
+
   // Chart
   if (allMonths.length > 0) {
     const chartLabels = allMonths.map(
@@ -1672,7 +1864,7 @@ async function exportNoAttendanceExcel() {
         "Content-Type": "application/json",
       },
       body: JSON.stringify({
-        employees: noAttendanceEmployees,
+        ...attendanceExportSpec("none"),
         date_range: dateRangeFilter,
         shift_status: shiftStatus,
         struktur_lini: strukturText,
@@ -1740,7 +1932,7 @@ async function exportNoAttendancePDF() {
         "Content-Type": "application/json",
       },
       body: JSON.stringify({
-        employees: noAttendanceEmployees,
+        ...attendanceExportSpec("none"),
         date_range: dateRangeFilter,
         shift_filter: groupExportShiftFilter || "all",
         struktur_lini: strukturText,
@@ -1805,7 +1997,7 @@ async function exportAttendanceExcel() {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({
-        employees: attendanceEmployees,
+        ...attendanceExportSpec("present"),
         date_range: dateRangeFilter,
         shift_status: shiftStatus,
         struktur_lini: strukturText,
@@ -1868,7 +2060,7 @@ async function exportAttendancePDF() {
       method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({
-        employees: attendanceEmployees,
+        ...attendanceExportSpec("present"),
         date_range: dateRangeFilter,
         shift_filter: groupExportShiftFilter || "all",
         struktur_lini: strukturText,
@@ -2011,16 +2203,13 @@ async function exportSelectedExcel() {
   try {
     showLoading(`Mengexport Excel untuk ${selectedEmployees.size} pegawai...`);
 
-    // Ambil data lengkap dari Map
-    const selectedData = Array.from(selectedEmployees.values());
-
     const response = await fetch("/api/export-group-excel", {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
       },
       body: JSON.stringify({
-        employees: selectedData,
+        ids: Array.from(selectedEmployees.keys()),
         date_range: dateRangeFilter.active
           ? dateRangeFilter
           : {
@@ -2081,16 +2270,13 @@ async function exportSelectedPDF() {
   try {
     showLoading(`Membuat PDF untuk ${selectedEmployees.size} pegawai...`);
 
-    // Ambil data lengkap dari Map
-    const selectedData = Array.from(selectedEmployees.values());
-
     const response = await fetch("/api/export-group-pdf", {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
       },
       body: JSON.stringify({
-        employees: selectedData,
+        ids: Array.from(selectedEmployees.keys()),
         date_range: dateRangeFilter,
         shift_filter: "all",
         struktur_lini: `${selectedEmployees.size} Pegawai Terpilih`,
@@ -2444,7 +2630,7 @@ async function exportExcel() {
         "Content-Type": "application/json",
       },
       body: JSON.stringify({
-        data: filteredData,
+        ...tableExportSpec(),
         filters: {
           year: activeYearFilter,
           dateRange: dateRangeFilter,
@@ -2544,7 +2730,7 @@ async function exportGroupPDF() {
       strukturLiniFilter !== "all" ? strukturLiniFilter : "Semua";
 
     const exportData = {
-      employees: filteredData,
+      ...tableExportSpec(),
       date_range: dateRangeFilter,
       shift_filter: groupExportShiftFilter, // NEW: Kirim filter shift
       struktur_lini: strukturText,
@@ -2615,7 +2801,7 @@ async function exportGroupExcel() {
       strukturLiniFilter !== "all" ? strukturLiniFilter : "Semua";
 
     const exportData = {
-      employees: filteredData,
+      ...tableExportSpec(),
       date_range: dateRangeFilter,
       shift_status: shiftStatus,
       struktur_lini: strukturText,